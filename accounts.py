@@ -0,0 +1,79 @@
+import fnmatch
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+PathLike = Union[str, Path]
+
+# Parâmetros do PostingRateLimiter que cada conta pode sobrescrever
+PACING_KEYS = ('posts_per_hour', 'posts_per_day', 'burst', 'photo_interval', 'video_interval', 'jitter')
+
+
+@dataclass
+class Account:
+    """Conta do Instagram atendida pelo processo, com pasta de mídias e ritmo próprios"""
+    username: str
+    media_path: Path
+    password: Optional[str] = None
+    caption: Optional[str] = None
+    patterns: List[str] = field(default_factory=list)  # nomes aceitos (glob); vazio = todos
+    pacing: Dict[str, float] = field(default_factory=dict)  # sobrescreve o ritmo da configuração
+
+    @property
+    def session_file(self) -> str:
+        return f".session.{self.username}.enc"
+
+    def ledger_path(self, base: Path) -> Path:
+        """Registro de posts da conta, ao lado do registro padrão"""
+        base = Path(base)
+        return base.with_name(f"{base.stem}.{self.username}{base.suffix}")
+
+    def matches(self, path: PathLike) -> bool:
+        """Verifica se o arquivo pertence à conta pelas regras de nome"""
+        if not self.patterns:
+            return True
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+
+def load_accounts(path: PathLike) -> List[Account]:
+    """Lê as contas de um arquivo JSON (lista de objetos)
+
+    A senha pode vir do campo `password` ou da variável de ambiente indicada em
+    `password_env`; sem nenhuma das duas, o login depende da sessão salva.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: esperada uma lista de contas")
+
+    accounts = []
+    seen = set()
+    for item in data:
+        username = item.get('username')
+        media_path = item.get('media_path')
+        if not username or not media_path:
+            raise ValueError(f"{path}: cada conta precisa de 'username' e 'media_path'")
+        if username in seen:
+            raise ValueError(f"{path}: conta {username} repetida")
+        seen.add(username)
+
+        pacing = item.get('pacing', {})
+        unknown = set(pacing) - set(PACING_KEYS)
+        if unknown:
+            raise ValueError(f"{path}: parâmetros de ritmo desconhecidos para {username}: {sorted(unknown)}")
+
+        password = item.get('password')
+        if password is None and item.get('password_env'):
+            password = os.getenv(item['password_env'])
+        accounts.append(Account(
+            username=username,
+            media_path=Path(media_path),
+            password=password,
+            caption=item.get('caption'),
+            patterns=list(item.get('patterns', [])),
+            pacing=dict(pacing),
+        ))
+    return accounts
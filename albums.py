@@ -0,0 +1,103 @@
+import math
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Union
+
+from scanner import ScanEntry
+
+PathLike = Union[str, Path]
+
+# Modos de agrupamento: desativado, por subpasta, por prefixo do nome ou por janela de tempo
+ALBUM_MODES = ('off', 'folder', 'prefix', 'time')
+
+# Limite de itens de um carrossel do Instagram
+MAX_ALBUM_ITEMS = 10
+
+# Contador no fim do nome: "praia_01", "praia-2", "praia 3" -> "praia"
+_COUNTER = re.compile(r'[\s_\-.]*\(?\d+\)?$')
+
+
+@dataclass
+class MediaGroup:
+    """Arquivos relacionados que serão postados juntos, como um carrossel"""
+    key: str
+    entries: List[ScanEntry]
+
+    @property
+    def path(self) -> Path:
+        return self.entries[0].path
+
+
+def name_prefix(path: PathLike) -> str:
+    """Nome do arquivo sem a extensão e sem o contador final"""
+    stem = Path(path).stem
+    return _COUNTER.sub('', stem) or stem
+
+
+def _split(key: str, entries: List[ScanEntry], max_items: int) -> Iterator[Union[ScanEntry, MediaGroup]]:
+    """Divide o grupo em carrosséis de tamanhos equilibrados (11 itens viram 6 + 5, não 10 + 1)"""
+    if len(entries) == 1:
+        yield entries[0]
+        return
+    parts = math.ceil(len(entries) / max_items)
+    base, extra = divmod(len(entries), parts)
+    start = 0
+    for i in range(parts):
+        size = base + (1 if i < extra else 0)
+        yield MediaGroup(key if parts == 1 else f"{key} ({i + 1}/{parts})", entries[start:start + size])
+        start += size
+
+
+def group_entries(
+    entries: Iterable[ScanEntry],
+    mode: str,
+    root: PathLike,
+    max_items: int = MAX_ALBUM_ITEMS,
+    window: float = 300,
+) -> Iterator[Union[ScanEntry, MediaGroup]]:
+    """Agrupa as entradas da varredura em carrosséis de até `max_items` mídias
+
+    - 'folder': cada subpasta de `root` é um grupo; arquivos na própria `root` saem sozinhos
+    - 'prefix': arquivos com o mesmo nome a menos do contador final ("praia_01", "praia_02")
+    - 'time': arquivos modificados com até `window` segundos entre um e o seguinte
+
+    Grupos de um único arquivo são gerados como a própria entrada, para o post comum.
+    As entradas são consumidas por completo antes do primeiro grupo.
+    """
+    if mode not in ALBUM_MODES:
+        raise ValueError(f"Modo de álbum desconhecido: {mode}")
+    if not 2 <= max_items <= MAX_ALBUM_ITEMS:
+        raise ValueError(f"max_items deve estar entre 2 e {MAX_ALBUM_ITEMS}")
+    if mode == 'off':
+        yield from entries
+        return
+
+    if mode == 'time':
+        ordered = sorted(entries, key=lambda entry: entry.mtime_ns)
+        limit = int(window * 1e9)
+        group: List[ScanEntry] = []
+        for entry in ordered:
+            if group and entry.mtime_ns - group[-1].mtime_ns > limit:
+                yield from _split(group[0].path.stem, group, max_items)
+                group = []
+            group.append(entry)
+        if group:
+            yield from _split(group[0].path.stem, group, max_items)
+        return
+
+    root = Path(root)
+    groups: Dict[str, List[ScanEntry]] = {}
+    for entry in entries:
+        if mode == 'folder':
+            if entry.path.parent == root:
+                yield entry
+                continue
+            key = str(entry.path.parent.relative_to(root))
+        else:
+            key = name_prefix(entry.path)
+        groups.setdefault(key, []).append(entry)
+
+    for key, members in groups.items():
+        members.sort(key=lambda entry: entry.path.name)
+        yield from _split(key, members, max_items)
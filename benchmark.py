@@ -0,0 +1,458 @@
+"""Benchmark da preparação de mídia e do pipeline de postagem
+
+Gera um corpus sintético de imagens e vídeos e mede, por etapa, a vazão, as latências
+p50/p99 e o pico de memória (RSS). Cada etapa roda em um processo próprio, para que o
+pico de memória e o custo de import não se misturem entre etapas. O resultado é um JSON
+para comparar execuções ao longo do tempo.
+
+Uso:
+    python benchmark.py --images 20 --videos 3 --output resultados.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+STAGES = (
+    'resize_image', 'convert_video', 'process_directory', 'process_directory_warm',
+    'ledger_record', 'ledger_lookup', 'end_to_end', 'end_to_end_album', 'simulate', 'startup',
+)
+
+# Módulos pesados que o caminho "nada para postar" não deve carregar
+HEAVY_MODULES = ('instagrapi', 'moviepy', 'PIL', 'requests', 'cryptography')
+
+
+def _size(value: str):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Percentil pelo método nearest-rank"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _peak_rss_mb() -> float:
+    """Pico de RSS do processo da etapa e dos seus filhos (pool de imagens, ffmpeg)"""
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024  # bytes no macOS, KB no Linux
+    return round(max(self_kb, children_kb) / divisor, 1)
+
+
+def _summary(samples: List[float], elapsed: float, count: int) -> dict:
+    return {
+        'count': count,
+        'seconds': round(elapsed, 4),
+        'throughput_per_s': round(count / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _timed(fn: Callable, samples: List[float]) -> Callable:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+def _config(workdir: Path, corpus: Path, **overrides):
+    from config import Config
+
+    # Nada de ritmo de postagem: mede-se apenas o custo do pipeline
+    params = dict(
+        upload_dir=corpus,
+        ledger_path=workdir / 'ledger.db',
+        scan_index_path=workdir / 'scan_index.db',
+        cache_dir=workdir / 'cache',
+        upload_state_path=workdir / 'upload_state.db',
+        resumable_video_upload=False,
+        posts_per_hour=0,
+        posts_per_day=0,
+        photo_interval=0,
+        video_interval=0,
+        pacing_jitter=0,
+        # Os vídeos sintéticos têm o mesmo padrão (testsrc2) e seriam pulados como
+        # quase idênticos; a carga medida é a de postar todo o corpus
+        dedup_perceptual=False,
+    )
+    params.update(overrides)
+    return Config(**params)
+
+
+# Corpus sintético
+
+def generate_images(directory: Path, count: int, size) -> List[Path]:
+    from PIL import Image
+
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        # Ruído sobre gradiente: comprime como uma foto, não como uma cor sólida
+        noise = Image.effect_noise(size, 40 + i % 20)
+        gradient = Image.linear_gradient('L').resize(size)
+        image = Image.merge('RGB', (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+        path = directory / f"img_{i:04d}.jpg"
+        image.save(path, 'JPEG', quality=90)
+        paths.append(path)
+    return paths
+
+
+def generate_videos(directory: Path, count: int, size, seconds: float) -> List[Path]:
+    import media
+
+    directory.mkdir(parents=True, exist_ok=True)
+    width, height = size
+    paths = []
+    for i in range(count):
+        path = directory / f"vid_{i:04d}.mp4"
+        subprocess.run(
+            [
+                media.ffmpeg_binary(), '-v', 'error', '-y',
+                '-f', 'lavfi', '-i', f"testsrc2=size={width}x{height}:rate=30:duration={seconds}",
+                '-f', 'lavfi', '-i', f"sine=frequency={440 + 110 * i}:duration={seconds}",
+                '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest', str(path),
+            ],
+            check=True, capture_output=True
+        )
+        paths.append(path)
+    return paths
+
+
+# Etapas (cada uma roda em um processo novo)
+
+def stage_resize_image(workdir: Path, corpus: Path, options: dict) -> dict:
+    import media
+
+    images = sorted(corpus.glob('img_*.jpg'))
+    output = workdir / 'out'
+    output.mkdir(exist_ok=True)
+    samples: List[float] = []
+    resize = _timed(media.resize_image, samples)
+    start = time.perf_counter()
+    for image in images:
+        resize(image, output / image.name)
+    return _summary(samples, time.perf_counter() - start, len(images))
+
+
+def stage_convert_video(workdir: Path, corpus: Path, options: dict) -> dict:
+    import media
+
+    videos = sorted(corpus.glob('vid_*.mp4'))
+    output = workdir / 'out'
+    output.mkdir(exist_ok=True)
+    samples: List[float] = []
+    convert = _timed(media.convert_video, samples)
+    start = time.perf_counter()
+    for video in videos:
+        # Sempre recodifica, mesmo que o vídeo já esteja no formato aceito
+        convert(video, output / video.name)
+    return _summary(samples, time.perf_counter() - start, len(videos))
+
+
+def _process_directory(workdir: Path, corpus: Path, options: dict, runs: int) -> dict:
+    from processor import MediaProcessor
+
+    processor = MediaProcessor(_config(workdir, corpus, max_workers=options['workers']))
+    try:
+        samples: List[float] = []
+        for run in range(runs):
+            if run == runs - 1:
+                # Mede só a última execução; as anteriores apenas aquecem o cache
+                processor._process_file_sync = _timed(processor._process_file_sync, samples)
+            start = time.perf_counter()
+            results = asyncio.run(processor.process_directory(corpus))
+            elapsed = time.perf_counter() - start
+        return _summary(samples, elapsed, len(results))
+    finally:
+        processor.shutdown()
+
+
+def stage_process_directory(workdir: Path, corpus: Path, options: dict) -> dict:
+    return _process_directory(workdir, corpus, options, runs=1)
+
+
+def stage_process_directory_warm(workdir: Path, corpus: Path, options: dict) -> dict:
+    return _process_directory(workdir, corpus, options, runs=2)
+
+
+def _ledger_digests(count: int) -> List[str]:
+    return [f"{i:064x}" for i in range(count)]
+
+
+def stage_ledger_record(workdir: Path, corpus: Path, options: dict) -> dict:
+    from ledger import PostedLedger
+
+    digests = _ledger_digests(options['ledger_records'])
+    samples: List[float] = []
+    with PostedLedger(workdir / 'ledger_bench.db', batch_size=options['ledger_batch_size']) as ledger:
+        record = _timed(ledger.record, samples)
+        start = time.perf_counter()
+        for i, digest in enumerate(digests):
+            record(f"media_{i}.jpg", digest)
+        elapsed = time.perf_counter() - start
+    return _summary(samples, elapsed, len(digests))
+
+
+def stage_ledger_lookup(workdir: Path, corpus: Path, options: dict) -> dict:
+    from ledger import PostedLedger
+
+    digests = _ledger_digests(options['ledger_records'])
+    with PostedLedger(workdir / 'ledger_lookup.db', batch_size=len(digests) or 1) as ledger:
+        for i, digest in enumerate(digests):
+            ledger.record(f"media_{i}.jpg", digest)
+        ledger.flush()
+        samples: List[float] = []
+        lookup = _timed(ledger.is_posted, samples)
+        start = time.perf_counter()
+        for i, digest in enumerate(digests):
+            # Metade encontrada, metade ausente
+            lookup(digest if i % 2 else f"{digest[:-1]}z", f"media_{i}.jpg")
+        elapsed = time.perf_counter() - start
+    return _summary(samples, elapsed, len(digests))
+
+
+class FakeClient:
+    """Substituto do instagrapi.Client: só simula a latência dos uploads"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.uploads: List[float] = []
+        self.media = 0
+
+    def _upload(self, path, caption=None):
+        if not isinstance(path, list):
+            self.media += 1
+        time.sleep(self.latency)
+        self.uploads.append(time.perf_counter())
+
+    photo_upload = _upload
+    video_upload = _upload
+
+    def album_upload(self, paths, caption=None):
+        self._upload(paths, caption)
+        self.media += len(paths)
+
+
+def _post_all(workdir: Path, corpus: Path, options: dict, client, **overrides) -> float:
+    """Roda o postar_midia sobre o corpus e retorna o tempo de parede
+
+    Falha se alguma mídia do corpus não foi postada: o resultado não mediria a carga anunciada.
+    """
+    import script
+    from processor import MediaProcessor
+
+    script.CAMINHO_ARQUIVOS = str(corpus)
+    script.CAPTION_PADRAO = "benchmark"
+    processor = MediaProcessor(_config(workdir, corpus, max_workers=options['workers'], **overrides))
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            script.postar_midia(client, processor)
+    finally:
+        processor.shutdown()
+    elapsed = time.perf_counter() - start
+    expected = options['images'] + options['videos']
+    if client.media != expected:
+        raise RuntimeError(f"{client.media} de {expected} mídias do corpus postadas")
+    return elapsed
+
+
+def _end_to_end(workdir: Path, corpus: Path, options: dict, **overrides) -> dict:
+    client = FakeClient(options['upload_latency'])
+    start = time.perf_counter()
+    elapsed = _post_all(workdir, corpus, options, client, **overrides)
+    # Latência: intervalo entre uploads consecutivos (o primeiro conta desde o início)
+    marks = [start] + client.uploads
+    samples = [b - a for a, b in zip(marks, marks[1:])]
+    report = _summary(samples, elapsed, len(client.uploads))
+    report['media'] = client.media
+    return report
+
+
+def stage_end_to_end(workdir: Path, corpus: Path, options: dict) -> dict:
+    return _end_to_end(workdir, corpus, options)
+
+
+def stage_end_to_end_album(workdir: Path, corpus: Path, options: dict) -> dict:
+    # O corpus sintético é gerado de uma vez: a janela de tempo agrupa tudo em carrosséis de 10
+    return _end_to_end(workdir, corpus, options, album_mode='time', album_window=3600)
+
+
+def stage_simulate(workdir: Path, corpus: Path, options: dict) -> dict:
+    """Pipeline completo com o ritmo de postagem padrão, no relógio acelerado do cliente simulado"""
+    from clients import SimulatedClient, SimulatedClock
+    from config import Config
+
+    pacing = {
+        name: Config.model_fields[name].default
+        for name in ('posts_per_hour', 'posts_per_day', 'photo_interval', 'video_interval', 'pacing_jitter')
+    }
+    client = SimulatedClient(
+        latency=options['upload_latency'],
+        clock=SimulatedClock(options['simulate_speedup']),
+        seed=0,
+    )
+    elapsed = _post_all(workdir, corpus, options, client, **pacing)
+    report = client.summary()
+    report['seconds'] = round(elapsed, 3)
+    report['throughput_per_s'] = round(client.uploads / elapsed, 2) if elapsed else 0.0
+    return report
+
+
+def stage_startup(workdir: Path, corpus: Path, options: dict) -> dict:
+    """Tempo de parede da CLI em um interpretador novo, com a pasta de mídia vazia"""
+    script_path = Path(__file__).resolve().with_name('script.py')
+    empty = workdir / 'vazia'
+    empty.mkdir(exist_ok=True)
+    env = {**os.environ, 'UPLOAD_DIR': str(workdir / 'uploads')}
+    command = [sys.executable, str(script_path), '--path', str(empty)]
+    samples = []
+    start = time.perf_counter()
+    for _ in range(options['startup_runs']):
+        t0 = time.perf_counter()
+        subprocess.run(command, cwd=workdir, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    # Quais módulos pesados o mesmo caminho importou
+    probe = (
+        "import runpy, sys\n"
+        f"sys.path.insert(0, {str(script_path.parent)!r})\n"
+        f"sys.argv = [{str(script_path)!r}, '--path', {str(empty)!r}]\n"
+        "try:\n"
+        f"    runpy.run_path({str(script_path)!r}, run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', probe], cwd=workdir, env=env, check=True,
+                            capture_output=True, text=True)
+    loaded = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ''
+
+    report = _summary(samples, elapsed, len(samples))
+    report['heavy_modules'] = [m for m in loaded.split(',') if m]
+    return report
+
+
+def _generate_corpus(corpus: Path, options: dict):
+    generate_images(corpus, options['images'], options['image_size'])
+    generate_videos(corpus, options['videos'], options['video_size'], options['video_seconds'])
+
+
+def _run_stage(name: str, workdir: str, corpus: str, options: dict) -> dict:
+    stage_dir = Path(workdir) / name
+    stage_dir.mkdir(parents=True, exist_ok=True)
+    os.chdir(stage_dir)  # logs e bancos auxiliares ficam no diretório da etapa
+    return globals()[f"stage_{name}"](stage_dir, Path(corpus), options)
+
+
+def run(stages: List[str], options: dict, workdir: Path) -> Dict:
+    corpus = workdir / 'corpus'
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    # O corpus também é gerado em um processo próprio: no Linux o ru_maxrss é herdado
+    # pelos filhos, e o pico de gerar as imagens apareceria em todas as etapas
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        pool.submit(_generate_corpus, corpus, options).result()
+    corpus_seconds = time.perf_counter() - start
+
+    results = {}
+    for name in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            print(f"Etapa {name}...", file=sys.stderr)
+            results[name] = pool.submit(_run_stage, name, str(workdir), str(corpus), options).result()
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': {**options, 'image_size': list(options['image_size']),
+                    'video_size': list(options['video_size'])},
+        'corpus_seconds': round(corpus_seconds, 2),
+        'stages': results,
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark do Instagram Auto Poster')
+    parser.add_argument('--images', type=int, default=20, help='Quantidade de imagens sintéticas')
+    parser.add_argument('--image-size', type=_size, default=(4000, 3000), help='Tamanho das imagens (LxA)')
+    parser.add_argument('--videos', type=int, default=2, help='Quantidade de vídeos sintéticos')
+    parser.add_argument('--video-size', type=_size, default=(1280, 720), help='Tamanho dos vídeos (LxA)')
+    parser.add_argument('--video-seconds', type=float, default=5, help='Duração dos vídeos')
+    parser.add_argument('--ledger-records', type=int, default=1000, help='Registros na etapa do ledger')
+    parser.add_argument('--ledger-batch-size', type=int, default=1, help='ledger_batch_size da etapa do ledger')
+    parser.add_argument('--workers', type=int, default=4, help='max_workers do MediaProcessor')
+    parser.add_argument('--upload-latency', type=float, default=0.05,
+                        help='Latência simulada de cada upload (segundos)')
+    parser.add_argument('--simulate-speedup', type=float, default=1000,
+                        help='Aceleração do relógio na etapa simulate')
+    parser.add_argument('--startup-runs', type=int, default=5, help='Execuções da CLI na etapa startup')
+    parser.add_argument('--startup-budget-ms', type=float,
+                        help='Falha (código 1) se o p50 da etapa startup passar deste tempo')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='Etapas a medir')
+    parser.add_argument('--workdir', type=str, help='Diretório de trabalho (padrão: temporário, removido ao fim)')
+    parser.add_argument('--output', type=str, help='Arquivo JSON de saída (padrão: stdout)')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    options = {
+        'images': args.images,
+        'image_size': args.image_size,
+        'videos': args.videos,
+        'video_size': args.video_size,
+        'video_seconds': args.video_seconds,
+        'ledger_records': args.ledger_records,
+        'ledger_batch_size': args.ledger_batch_size,
+        'workers': args.workers,
+        'upload_latency': args.upload_latency,
+        'simulate_speedup': args.simulate_speedup,
+        'startup_runs': args.startup_runs,
+    }
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='instaposter-bench-'))
+    try:
+        report = run(args.stages, options, workdir.resolve())
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    startup = report['stages'].get('startup')
+    if args.startup_budget_ms and startup and startup['p50_ms'] > args.startup_budget_ms:
+        print(f"Inicialização acima do orçamento: p50 {startup['p50_ms']:.0f}ms > "
+              f"{args.startup_budget_ms:.0f}ms", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+
+def file_digest(path: PathLike, chunk_size: int = 1024 * 1024) -> str:
+    """Calcula o hash SHA-256 do conteúdo de um arquivo"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class MediaCache:
+    """Cache persistente de mídias preparadas, endereçado pelo conteúdo da origem
+
+    A chave combina o hash do arquivo de origem com a transformação e seus parâmetros,
+    então renomear ou mover a origem não invalida o cache. Entradas são gravadas de forma
+    atômica e removidas por LRU quando o tamanho total passa de `max_bytes`, exceto as
+    fixadas (`pin=True`, até `unpin`), como as mídias preparadas ainda à espera do upload.
+    Uma entrada em geração por uma thread é aguardada pelas outras, não gerada de novo.
+    """
+
+    def __init__(self, directory: PathLike, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        self._size = 0
+        self._pins: Dict[Path, int] = {}
+        self._inflight: Dict[Path, threading.Event] = {}
+        self._load()
+
+    def _load(self):
+        """Carrega as entradas existentes ordenadas do uso mais antigo ao mais recente"""
+        entries = []
+        for path in self.directory.glob('*/*'):
+            if path.name.startswith('.'):
+                # Restos de gravações interrompidas
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._entries[path] = size
+            self._size += size
+
+    def key(self, digest: str, transform: str, params: dict) -> str:
+        """Chave da entrada: hash da origem + transformação + parâmetros"""
+        payload = json.dumps([digest, transform, params], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path_for(self, key: str, suffix: str) -> Path:
+        return self.directory / key[:2] / f"{key}{suffix}"
+
+    def fetch(
+        self,
+        source: PathLike,
+        transform: str,
+        params: dict,
+        suffix: str,
+        producer: Callable[[Path], None],
+        digest: Optional[str] = None,
+        pin: bool = False,
+    ) -> Path:
+        """Retorna a mídia preparada do cache ou a gera com `producer(caminho_temporario)`"""
+        key = self.key(digest or file_digest(source), transform, params)
+        target = self._path_for(key, suffix)
+        if not self._reserve({'': target}, pin):
+            return target
+
+        tmp = self._temp_path(target)
+        try:
+            producer(tmp)
+            os.replace(tmp, target)
+            with self._lock:
+                self._add(target)
+                if pin:
+                    self._pin(target)
+                self._evict()
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+            self._release([target])
+        return target
+
+    def fetch_many(
+        self,
+        source: PathLike,
+        requests: Dict[str, Tuple[str, dict, str]],
+        producer: Callable[[Dict[str, Path]], None],
+        digest: Optional[str] = None,
+        pin: bool = False,
+    ) -> Dict[str, Path]:
+        """Várias transformações da mesma origem (nome -> (transformação, parâmetros, sufixo))
+
+        `producer` recebe, de uma só vez, os caminhos temporários apenas das que não
+        estão no cache, para gerá-las a partir de uma única leitura da origem.
+        """
+        digest = digest or file_digest(source)
+        targets = {
+            name: self._path_for(self.key(digest, transform, params), suffix)
+            for name, (transform, params, suffix) in requests.items()
+        }
+        missing = self._reserve(targets, pin)
+        if not missing:
+            return targets
+
+        temps = {name: self._temp_path(target) for name, target in missing.items()}
+        try:
+            producer(temps)
+            for name, target in missing.items():
+                os.replace(temps[name], target)
+            with self._lock:
+                for target in missing.values():
+                    self._add(target)
+                    if pin:
+                        self._pin(target)
+                self._evict()
+        finally:
+            for tmp in temps.values():
+                if tmp.exists():
+                    tmp.unlink()
+            self._release(missing.values())
+        return targets
+
+    def _reserve(self, targets: Dict[str, Path], pin: bool) -> Dict[str, Path]:
+        """Entradas de `targets` fora do cache, reservadas para esta thread gerar
+
+        Se outra thread está gerando alguma delas, espera e verifica de novo, para a
+        mesma mídia não ser gerada duas vezes. As entradas já no cache são fixadas com `pin`.
+        """
+        while True:
+            with self._lock:
+                busy = next((self._inflight[t] for t in targets.values() if t in self._inflight), None)
+                if busy is None:
+                    missing = {name: target for name, target in targets.items() if not self._hit(target)}
+                    for name, target in targets.items():
+                        if name in missing:
+                            self._inflight[target] = threading.Event()
+                        elif pin:
+                            self._pin(target)
+                    return missing
+            busy.wait()
+
+    def _release(self, targets: Iterable[Path]):
+        """Encerra a geração das entradas, liberando quem as aguarda"""
+        with self._lock:
+            for target in targets:
+                event = self._inflight.pop(target, None)
+                if event is not None:
+                    event.set()
+
+    def _pin(self, target: Path):
+        self._pins[target] = self._pins.get(target, 0) + 1
+
+    def unpin(self, target: PathLike):
+        """Libera uma entrada fixada com `pin=True`, que volta a poder ser removida"""
+        target = Path(target)
+        with self._lock:
+            count = self._pins.pop(target, 0) - 1
+            if count > 0:
+                self._pins[target] = count
+            self._evict()
+
+    def _hit(self, target: Path) -> bool:
+        """Contabiliza o acesso; True se a entrada está no cache (chamar com o lock)"""
+        if target in self._entries and target.exists():
+            self.hits += 1
+            self._entries.move_to_end(target)
+            os.utime(target)
+            return True
+        self.misses += 1
+        return False
+
+    def _temp_path(self, target: Path) -> Path:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Mantém o sufixo para que encoders deduzam o formato pelo nome
+        return target.with_name(f".{target.stem}.{os.getpid()}.{threading.get_ident()}{target.suffix}")
+
+    def _add(self, target: Path):
+        size = target.stat().st_size
+        self._size += size - self._entries.pop(target, 0)
+        self._entries[target] = size
+
+    def _evict(self):
+        """Remove as entradas menos usadas até o cache caber em `max_bytes`"""
+        if self._size <= self.max_bytes:
+            return
+        for path in list(self._entries):
+            if self._size <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if path in self._pins:
+                continue
+            size = self._entries.pop(path)
+            self._size -= size
+            self.evictions += 1
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            logger.debug(f"Removido do cache: {path}")
+
+    def stats(self) -> dict:
+        """Contadores de uso do cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
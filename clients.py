@@ -0,0 +1,155 @@
+import itertools
+import math
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional, Protocol, Union
+
+PathLike = Union[str, Path]
+
+HOUR = 3600
+
+
+class InstagramClient(Protocol):
+    """O que o pipeline usa do cliente: o instagrapi.Client ou o SimulatedClient"""
+
+    def photo_upload(self, path: PathLike, caption: str): ...
+
+    def video_upload(self, path: PathLike, caption: str): ...
+
+    def album_upload(self, paths: List[PathLike], caption: str): ...
+
+
+class SimulatedUploadError(Exception):
+    """Falha de upload sorteada pelo cliente simulado"""
+
+
+class SimulatedClock:
+    """Relógio acelerado: uma espera de `s` segundos dura s / speedup segundos reais
+
+    O tempo que a espera deixou de durar é somado ao relógio, então ritmo de postagem,
+    cotas e backoffs se comportam como em tempo real. Com speedup infinito, não há espera.
+    """
+
+    def __init__(self, speedup: float = 1.0):
+        if speedup <= 0:
+            raise ValueError("speedup deve ser maior que 0")
+        self.speedup = speedup
+        self._offset = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        return time.time() + self._offset
+
+    def _real(self, seconds: float) -> float:
+        return 0.0 if math.isinf(self.speedup) else seconds / self.speedup
+
+    def _advance(self, seconds: float, real: float):
+        with self._lock:
+            self._offset += max(0.0, seconds - real)
+
+    def sleep(self, seconds: float):
+        real = self._real(seconds)
+        time.sleep(real)
+        self._advance(seconds, real)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        """Como `event.wait(seconds)`, no tempo simulado"""
+        real = self._real(seconds)
+        if event.wait(real):
+            return True
+        self._advance(seconds, real)
+        return False
+
+
+class SimulatedClient:
+    """Instagram local, para testar varredura, preparação, ritmo e registro sem postar nada
+
+    Cada upload leva `latency` segundos (no relógio simulado), falha com probabilidade
+    `failure_rate` e recebe a resposta de limite do Instagram com probabilidade
+    `throttle_rate` ou quando passa de `hourly_limit` uploads na última hora.
+    """
+
+    def __init__(
+        self,
+        latency: float = 1.0,
+        failure_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        hourly_limit: int = 0,
+        clock: Optional[SimulatedClock] = None,
+        seed: Optional[int] = None,
+        username: str = 'simulado',
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.hourly_limit = hourly_limit
+        self.clock = clock or SimulatedClock()
+        self.username = username
+        self.user_id = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent: deque = deque()
+        self._ids = itertools.count(1)
+        self.started = self.clock()
+        self._started_real = time.monotonic()
+        self.uploads = 0  # posts aceitos
+        self.media = 0  # mídias nos posts aceitos
+        self.failures = 0
+        self.throttles = 0
+
+    @classmethod
+    def from_config(cls, config, username: str = 'simulado') -> 'SimulatedClient':
+        return cls(
+            latency=config.simulate_latency,
+            failure_rate=config.simulate_failure_rate,
+            throttle_rate=config.simulate_throttle_rate,
+            hourly_limit=config.simulate_hourly_limit,
+            clock=SimulatedClock(config.simulate_speedup),
+            seed=config.simulate_seed,
+            username=username,
+        )
+
+    def _upload(self, kind: str, count: int):
+        from instagrapi.exceptions import PleaseWaitFewMinutes
+
+        self.clock.sleep(self.latency)
+        with self._lock:
+            now = self.clock()
+            while self._recent and self._recent[0] <= now - HOUR:
+                self._recent.popleft()
+            if (self.hourly_limit and len(self._recent) >= self.hourly_limit) \
+                    or self._random.random() < self.throttle_rate:
+                self.throttles += 1
+                raise PleaseWaitFewMinutes("Please wait a few minutes before you try again. (simulado)")
+            if self._random.random() < self.failure_rate:
+                self.failures += 1
+                raise SimulatedUploadError(f"Falha simulada no upload ({kind})")
+            self._recent.append(now)
+            self.uploads += 1
+            self.media += count
+            return SimpleNamespace(pk=f"sim{next(self._ids)}", media_type=kind)
+
+    def photo_upload(self, path: PathLike, caption: str = ''):
+        return self._upload('photo', 1)
+
+    def video_upload(self, path: PathLike, caption: str = ''):
+        return self._upload('video', 1)
+
+    def album_upload(self, paths: List[PathLike], caption: str = ''):
+        return self._upload('album', len(paths))
+
+    def summary(self) -> dict:
+        simulated = self.clock() - self.started
+        return {
+            'uploads': self.uploads,
+            'media': self.media,
+            'failures': self.failures,
+            'throttles': self.throttles,
+            'simulated_seconds': round(simulated, 1),
+            'real_seconds': round(time.monotonic() - self._started_real, 2),
+            'posts_per_hour': round(self.uploads / simulated * HOUR, 1) if simulated > 0 else 0.0,
+        }
@@ -6,6 +6,7 @@ from pydantic import validator
 class Config(BaseSettings):
     # Configurações Gerais
     max_workers: int = 4
+    pipeline_prefetch: int = 4  # arquivos preparados à frente do upload
     upload_dir: Path
     log_level: str = "INFO"
     
@@ -14,9 +15,84 @@ class Config(BaseSettings):
     allowed_video_formats: List[str] = ['.mp4', '.mov']
     max_video_size: int = 100 * 1024 * 1024  # 100MB
     max_video_duration: int = 60  # segundos
+    video_fit_size: bool = True  # recodifica vídeos acima de max_video_size em vez de pulá-los
+    video_trim: bool = False  # corta vídeos acima de max_video_duration em vez de pulá-los
+    image_max_bytes: int = 1024 * 1024  # reduz a qualidade do JPEG até caber (0 = qualidade fixa)
     max_retries: int = 3
     retry_delay: int = 5  # segundos
     
+    # Memória máxima das imagens decodificadas em paralelo (0 = sem limite)
+    image_memory_limit: int = 512 * 1024 * 1024  # 512MB
+    
+    # Encoder de vídeo (usado apenas quando a recodificação é necessária)
+    video_preset: str = 'medium'  # preset do libx264
+    video_crf: int = 23
+    video_threads: int = 0  # 0 = automático
+    video_max_dimension: int = 1920  # maior lado aceito sem redimensionar
+    
+    # Registro de mídias postadas
+    ledger_path: Path = Path('posted_media.db')
+    ledger_batch_size: int = 1  # registros por transação
+    
+    # Mídias quase idênticas (reexportadas, redimensionadas) às já postadas são puladas
+    dedup_perceptual: bool = True
+    dedup_max_distance: int = 6  # bits diferentes (de 64) do hash perceptual
+    
+    # Índice da varredura incremental de diretórios
+    scan_index_path: Path = Path('.scan_index.db')
+    
+    # Modo --watch
+    watch_backend: str = 'auto'  # 'auto', 'inotify' ou 'poll'
+    watch_settle_seconds: float = 2.0  # tempo sem alterações para considerar o arquivo completo
+    watch_poll_interval: float = 5.0  # segundos entre varreduras quando sem inotify
+    
+    # Cache de mídias preparadas
+    cache_dir: Path = Path('.media_cache')
+    cache_max_bytes: int = 2 * 1024 * 1024 * 1024  # 2GB
+    
+    # Ritmo de postagem (0 = sem limite)
+    posts_per_hour: int = 30
+    posts_per_day: int = 200
+    posting_burst: int = 5  # posts seguidos permitidos antes do limite por hora atuar
+    photo_interval: float = 10  # segundos mínimos após uma foto
+    video_interval: float = 30  # segundos mínimos após um vídeo
+    pacing_jitter: float = 0.2  # fração aleatória somada aos intervalos
+    throttle_backoff_initial: float = 60  # segundos de pausa no primeiro limite do Instagram
+    throttle_backoff_max: float = 3600
+    throttle_retries: int = 3  # novas tentativas do mesmo upload após um limite
+    
+    # Fila de posts (ordem por prioridade, horários agendados, falhas estacionadas)
+    job_queue: bool = False
+    job_queue_path: Path = Path('jobs.db')
+    job_max_attempts: int = 3  # tentativas antes de estacionar o job como 'failed'
+    job_retry_delay: float = 300  # segundos até a nova tentativa, dobrando a cada falha
+    job_lease: float = 3600  # segundos que um job retirado fica reservado ao processo
+    
+    # Carrosséis: mídias relacionadas postadas juntas, em um único post
+    album_mode: str = 'off'  # 'off', 'folder' (subpasta), 'prefix' (nome) ou 'time' (janela)
+    album_max_items: int = 10  # limite do Instagram
+    album_window: float = 300  # segundos entre arquivos do mesmo grupo, no modo 'time'
+    
+    # Upload retomável de vídeos (protocolo rupload, em blocos)
+    resumable_video_upload: bool = True
+    upload_chunk_size: int = 4 * 1024 * 1024  # 4MB
+    upload_state_path: Path = Path('.upload_state.db')
+    rupload_base_url: Optional[str] = None  # None = servidor do Instagram
+    
+    # Simulação (--simulate / --dry-run): cliente local no lugar do Instagram
+    simulate: bool = False
+    simulate_latency: float = 1.0  # segundos (simulados) por upload
+    simulate_failure_rate: float = 0.0  # fração dos uploads que falham
+    simulate_throttle_rate: float = 0.0  # fração dos uploads recusados por limite
+    simulate_hourly_limit: int = 0  # uploads por hora antes do limite simulado (0 = sem limite)
+    simulate_speedup: float = 1000  # quantas vezes o relógio simulado corre mais rápido
+    simulate_seed: Optional[int] = None
+    
+    # Métricas
+    metrics_log: Optional[Path] = Path('metrics.jsonl')  # spans por arquivo, em JSON (vazio = desativado)
+    metrics_port: int = 9108  # endpoint Prometheus no modo --watch (0 = desativado)
+    metrics_host: str = '127.0.0.1'
+    
     # Telegram
     telegram_enabled: bool = False
     telegram_token: Optional[str] = None
@@ -25,11 +101,18 @@ class Config(BaseSettings):
     # Email
     email_enabled: bool = False
     smtp_server: Optional[str] = None
+    smtp_port: int = 587
+    smtp_idle_timeout: float = 60  # segundos ociosos antes de verificar a conexão com NOOP
     smtp_user: Optional[str] = None
     smtp_password: Optional[str] = None
     smtp_from: Optional[str] = None
     smtp_to: Optional[str] = None
     
+    # Envio das notificações (por canal)
+    notify_batch_size: int = 50  # mensagens por resumo
+    notify_batch_window: float = 60  # segundos de espera para agrupar mensagens
+    notify_max_retries: int = 3
+    
     @validator('upload_dir')
     def validate_upload_dir(cls, v):
         path = Path(v)
@@ -43,4 +126,40 @@ class Config(BaseSettings):
             raise ValueError("max_workers deve ser maior que 0")
         return v
     
-    model_config = SettingsConfigDict(env_file='.env', case_sensitive=False)
\ No newline at end of file
+    @validator('pipeline_prefetch')
+    def validate_pipeline_prefetch(cls, v):
+        if v < 1:
+            raise ValueError("pipeline_prefetch deve ser maior que 0")
+        return v
+    
+    @validator('dedup_max_distance')
+    def validate_dedup_max_distance(cls, v):
+        if not 0 <= v <= 32:
+            raise ValueError("dedup_max_distance deve estar entre 0 e 32")
+        return v
+    
+    @validator('album_mode')
+    def validate_album_mode(cls, v):
+        if v not in ('off', 'folder', 'prefix', 'time'):
+            raise ValueError("album_mode deve ser 'off', 'folder', 'prefix' ou 'time'")
+        return v
+    
+    @validator('album_max_items')
+    def validate_album_max_items(cls, v):
+        if not 2 <= v <= 10:
+            raise ValueError("album_max_items deve estar entre 2 e 10")
+        return v
+    
+    @validator('simulate_failure_rate', 'simulate_throttle_rate')
+    def validate_simulate_rate(cls, v):
+        if not 0 <= v <= 1:
+            raise ValueError("as taxas da simulação devem estar entre 0 e 1")
+        return v
+    
+    @validator('simulate_speedup')
+    def validate_simulate_speedup(cls, v):
+        if v <= 0:
+            raise ValueError("simulate_speedup deve ser maior que 0")
+        return v
+    
+    model_config = SettingsConfigDict(env_file='.env', case_sensitive=False, extra='ignore')
\ No newline at end of file
@@ -18,4 +18,10 @@ class NotificationException(UploadException):
     """Exceção para erros de notificação"""
     def __init__(self, message: str, service: str, details: dict = None):
         super().__init__(message, details)
-        self.service = service 
\ No newline at end of file
+        self.service = service
+
+class ResumableUploadException(UploadException):
+    """Exceção para falhas no upload retomável de vídeos"""
+    def __init__(self, message: str, file_path: str, details: dict = None):
+        super().__init__(message, details)
+        self.file_path = file_path
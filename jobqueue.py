@@ -0,0 +1,366 @@
+"""Fila persistente de posts, com prioridades, horários agendados e falhas estacionadas
+
+Uso:
+    python jobqueue.py enqueue fotos/praia.jpg --priority 5 --at 2026-10-20T18:00
+    python jobqueue.py list --status failed
+    python jobqueue.py requeue --all-failed
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+PathLike = Union[str, Path]
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'  # esgotou as tentativas; aguarda `requeue`
+SKIPPED = 'skipped'  # pulado de propósito (já postado, fora dos limites); não é falha
+
+STATUSES = (PENDING, RUNNING, DONE, SKIPPED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    path TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    caption TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (account, path)
+);
+DROP INDEX IF EXISTS jobs_ready;
+CREATE INDEX IF NOT EXISTS jobs_available ON jobs (account, status, not_before, priority);
+"""
+
+
+@dataclass
+class Job:
+    """Post agendado de uma mídia"""
+    id: int
+    account: str  # vazio com uma única conta
+    path: str
+    priority: int  # maior sai antes
+    not_before: float  # epoch; 0 = assim que possível
+    status: str
+    attempts: int
+    last_error: Optional[str]
+    caption: Optional[str]
+    created: float
+    updated: float
+
+    def __str__(self) -> str:
+        return self.path
+
+
+_COLUMNS = ', '.join(f.name for f in fields(Job))
+
+
+class JobQueue:
+    """Fila de posts em SQLite (modo WAL), compartilhável entre execuções e processos
+
+    O próximo job pronto sai pelo índice (conta, status, horário): só os jobs já
+    liberados são ordenados por prioridade, sem passar pelos agendados para depois.
+    Jobs que falham voltam para a fila após `retry_delay` segundos, dobrando a cada
+    tentativa; após `max_attempts` ficam estacionados como 'failed', com o motivo, até
+    serem recolocados na fila. Um job retirado fica reservado por `lease` segundos
+    (renovável com `renew`); só depois disso outro processo pode recuperá-lo.
+    """
+
+    def __init__(self, path: PathLike, max_attempts: int = 3, retry_delay: float = 300, lease: float = 3600):
+        if max_attempts < 1:
+            raise ValueError("max_attempts deve ser maior que 0")
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._claimed = set()  # jobs em execução retirados por esta instância
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def enqueue(
+        self,
+        path: PathLike,
+        account: str = '',
+        priority: int = 0,
+        not_before: Optional[float] = None,
+        caption: Optional[str] = None,
+    ) -> int:
+        """Enfileira a mídia; se já estiver na fila (e não postada), atualiza prioridade e horário"""
+        now = time.time()
+        path = str(Path(path).resolve())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (account, path, priority, not_before, caption, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (account, path) DO UPDATE SET "
+                "priority = excluded.priority, not_before = excluded.not_before, "
+                "caption = COALESCE(excluded.caption, caption), updated = excluded.updated "
+                "WHERE status NOT IN ('done', 'skipped')",
+                (account, path, priority, not_before or 0, caption, now, now)
+            )
+            return self._conn.execute(
+                "SELECT id FROM jobs WHERE account = ? AND path = ?", (account, path)
+            ).fetchone()[0]
+
+    def enqueue_new(self, paths: Iterable[PathLike], account: str = '') -> int:
+        """Enfileira, com os valores padrão, as mídias que ainda não estão na fila"""
+        now = time.time()
+        rows = [(account, str(Path(path).resolve()), now, now) for path in paths]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (account, path, created, updated) VALUES (?, ?, ?, ?)", rows
+            )
+            return self._conn.total_changes - before
+
+    def claim(self, account: str = '', now: Optional[float] = None) -> Optional[Job]:
+        """Retira o próximo job pronto (maior prioridade, depois o mais antigo), marcando-o em execução"""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE account = ? AND status = ? AND not_before <= ? "
+                "ORDER BY priority DESC, not_before, id LIMIT 1",
+                (account, PENDING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            job = Job(*row)
+            job.status = RUNNING
+            job.attempts += 1
+            job.updated = now
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, updated = ? WHERE id = ?",
+                (RUNNING, job.attempts, now, job.id)
+            )
+            self._claimed.add(job.id)
+        return job
+
+    def renew(self, job_id: int):
+        """Renova a reserva de um job em execução (ex.: antes de um upload demorado)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET updated = ? WHERE id = ? AND status = ?", (time.time(), job_id, RUNNING)
+            )
+
+    def next_ready_at(self, account: str = '') -> Optional[float]:
+        """Horário do próximo job pendente; None com a fila vazia"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(not_before) FROM jobs WHERE account = ? AND status = ?", (account, PENDING)
+            ).fetchone()
+        return row[0]
+
+    def has_ready(self, account: str = '') -> bool:
+        ready_at = self.next_ready_at(account)
+        return ready_at is not None and ready_at <= time.time()
+
+    def complete(self, job_id: int):
+        self._set(job_id, DONE, None)
+
+    def skip(self, job_id: int, reason: str):
+        """Encerra o job sem postar, com o motivo, sem gastar tentativas"""
+        self._set(job_id, SKIPPED, reason)
+
+    def fail(self, job_id: int, reason: str) -> str:
+        """Registra a falha; o job volta para a fila com atraso ou fica estacionado"""
+        with self._lock, self._conn:
+            attempts = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if attempts is None:
+                return FAILED
+            now = time.time()
+            if attempts[0] >= self.max_attempts:
+                status, not_before = FAILED, now
+            else:
+                status, not_before = PENDING, now + self.retry_delay * 2 ** (attempts[0] - 1)
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, not_before = ?, updated = ? WHERE id = ?",
+                (status, reason, not_before, now, job_id)
+            )
+            self._claimed.discard(job_id)
+        return status
+
+    def _set(self, job_id: int, status: str, reason: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, updated = ? WHERE id = ?",
+                (status, reason, time.time(), job_id)
+            )
+            self._claimed.discard(job_id)
+
+    def release(self, account: str = '') -> int:
+        """Devolve à fila os jobs com a reserva expirada (processo interrompido ou caído)
+
+        Jobs ainda reservados, possivelmente por outro processo em execução, ficam onde estão.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE account = ? AND status = ? AND updated <= ?",
+                (PENDING, now, account, RUNNING, now - self.lease)
+            ).rowcount
+
+    def release_claimed(self) -> int:
+        """Devolve à fila os jobs retirados por esta instância e não concluídos"""
+        with self._lock, self._conn:
+            released = self._conn.executemany(
+                "UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?",
+                [(PENDING, time.time(), job_id, RUNNING) for job_id in self._claimed]
+            ).rowcount
+            self._claimed.clear()
+        return released
+
+    def requeue(self, ids: Optional[Iterable[int]] = None, account: Optional[str] = None) -> int:
+        """Recoloca na fila, do zero, os jobs indicados ou todos os estacionados"""
+        now = time.time()
+        with self._lock, self._conn:
+            if ids is not None:
+                return self._conn.executemany(
+                    "UPDATE jobs SET status = ?, attempts = 0, not_before = ?, updated = ? "
+                    "WHERE id = ? AND status != ?",
+                    [(PENDING, now, now, job_id, RUNNING) for job_id in ids]
+                ).rowcount
+            query = "UPDATE jobs SET status = ?, attempts = 0, not_before = ?, updated = ? WHERE status = ?"
+            params = [PENDING, now, now, FAILED]
+            if account is not None:
+                query += " AND account = ?"
+                params.append(account)
+            return self._conn.execute(query, params).rowcount
+
+    def jobs(self, status: Optional[str] = None, account: Optional[str] = None, limit: int = 100) -> List[Job]:
+        """Jobs na ordem em que sairão da fila"""
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if account is not None:
+            conditions.append("account = ?")
+            params.append(account)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs {where} ORDER BY priority DESC, not_before, id LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+        return [Job(*row) for row in rows]
+
+    def counts(self, account: Optional[str] = None) -> Dict[str, int]:
+        query = "SELECT status, COUNT(*) FROM jobs"
+        params = ()
+        if account is not None:
+            query += " WHERE account = ?"
+            params = (account,)
+        with self._lock:
+            rows = self._conn.execute(query + " GROUP BY status", params).fetchall()
+        return {status: 0 for status in STATUSES} | dict(rows)
+
+    def iter_ready(
+        self,
+        account: str = '',
+        stop: Optional[threading.Event] = None,
+        follow: bool = False,
+        poll_interval: float = 5,
+    ) -> Iterator[Job]:
+        """Gera os jobs conforme ficam prontos
+
+        Sem `follow`, termina quando não há mais jobs prontos; com `follow`, aguarda
+        os agendados e os novos até `stop` ser sinalizado.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            job = self.claim(account)
+            if job is not None:
+                yield job
+                continue
+            if not follow:
+                return
+            ready_at = self.next_ready_at(account)
+            delay = poll_interval if ready_at is None else min(poll_interval, max(0.0, ready_at - time.time()))
+            stop.wait(delay)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _when(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _expand(paths: List[str]) -> List[Path]:
+    """Arquivos indicados; diretórios contribuem com seus arquivos, em ordem de nome"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.iterdir() if p.is_file()))
+        else:
+            files.append(path)
+    return files
+
+
+def _format(job: Job) -> str:
+    horario = datetime.fromtimestamp(job.not_before).strftime('%Y-%m-%d %H:%M') if job.not_before else 'já'
+    linha = (f"{job.id:>6}  {job.status:<8} {job.priority:>4}  {horario:<16}  {job.attempts}x  "
+             f"{job.account or '-':<12}  {job.path}")
+    return f"{linha}\n{'':>8}{job.last_error}" if job.last_error and job.status != DONE else linha
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Fila de posts do Instagram Auto Poster')
+    parser.add_argument('--db', type=str, default=os.getenv('JOB_QUEUE_PATH', 'jobs.db'),
+                        help='Arquivo da fila (padrão: JOB_QUEUE_PATH ou jobs.db)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    enqueue = sub.add_parser('enqueue', help='Enfileira mídias (arquivos ou pastas)')
+    enqueue.add_argument('paths', nargs='+')
+    enqueue.add_argument('--priority', type=int, default=0, help='Maior prioridade sai antes')
+    enqueue.add_argument('--at', type=_when, help='Não postar antes de (ISO, ex.: 2026-10-20T18:00)')
+    enqueue.add_argument('--caption', type=str, help='Caption deste post')
+    enqueue.add_argument('--account', type=str, default='', help='Conta (com --accounts)')
+
+    listing = sub.add_parser('list', help='Lista os jobs na ordem de saída')
+    listing.add_argument('--status', choices=STATUSES)
+    listing.add_argument('--account', type=str)
+    listing.add_argument('--limit', type=int, default=50)
+
+    requeue = sub.add_parser('requeue', help='Recoloca jobs na fila')
+    requeue.add_argument('ids', nargs='*', type=int)
+    requeue.add_argument('--all-failed', action='store_true', help='Todos os jobs estacionados')
+    requeue.add_argument('--account', type=str)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    queue = JobQueue(args.db)
+    try:
+        if args.command == 'enqueue':
+            for path in _expand(args.paths):
+                job_id = queue.enqueue(path, args.account, args.priority, args.at, args.caption)
+                print(f"{job_id:>6}  {path}")
+        elif args.command == 'list':
+            contagem = queue.counts(args.account)
+            print('  '.join(f"{status}: {total}" for status, total in contagem.items()))
+            for job in queue.jobs(args.status, args.account, args.limit):
+                print(_format(job))
+        else:
+            if not args.ids and not args.all_failed:
+                raise SystemExit("Informe os ids ou --all-failed")
+            total = queue.requeue(args.ids or None, args.account)
+            print(f"{total} jobs recolocados na fila")
+    finally:
+        queue.close()
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+from cache import file_digest
+from perceptual import HammingIndex, PerceptualHash
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posted (
+    content_hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    album TEXT,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS posted_timestamp ON posted (timestamp);
+CREATE TABLE IF NOT EXISTS legacy (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+"""
+
+
+class PostedLedger:
+    """Registro indexado das mídias já postadas, em SQLite no modo WAL
+
+    As entradas são indexadas pelo hash do conteúdo, então arquivos renomeados ou movidos
+    continuam reconhecidos. Gravações são agrupadas em transações de `batch_size` entradas.
+    O hash perceptual, quando informado, permite reconhecer também cópias reexportadas ou
+    redimensionadas, a até `similarity_distance` bits de distância.
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        legacy_json: Optional[PathLike] = None,
+        batch_size: int = 1,
+        similarity_distance: int = 6,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size deve ser maior que 0")
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.similarity_distance = similarity_distance
+        self._similar: Optional[HammingIndex] = None  # montado na primeira busca
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._upgrade()
+        if legacy_json and os.path.exists(legacy_json):
+            self._migrate(Path(legacy_json))
+
+    def _upgrade(self):
+        """Acrescenta colunas novas a registros criados por versões anteriores"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(posted)")}
+        with self._conn:
+            for column in ('album', 'phash'):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE posted ADD COLUMN {column} TEXT")
+
+    def _migrate(self, legacy_json: Path):
+        """Importa o antigo posted_media.json (chaveado pelo nome do arquivo)"""
+        try:
+            with open(legacy_json, 'r') as f:
+                posted = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Não foi possível ler {legacy_json} para migração: {e}")
+            return
+
+        migrated = legacy = 0
+        with self._lock, self._conn:
+            for name, entry in posted.items():
+                path = entry.get('path', name)
+                timestamp = entry.get('timestamp', datetime.now().isoformat())
+                try:
+                    digest = file_digest(path)
+                except OSError:
+                    # Arquivo não existe mais: mantém o registro pelo nome
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO legacy (name, path, timestamp) VALUES (?, ?, ?)",
+                        (name, path, timestamp)
+                    )
+                    legacy += 1
+                    continue
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO posted (content_hash, name, path, timestamp) VALUES (?, ?, ?, ?)",
+                    (digest, name, path, timestamp)
+                )
+                migrated += 1
+
+        legacy_json.rename(legacy_json.with_name(legacy_json.name + '.migrated'))
+        logger.info(f"Migração de {legacy_json}: {migrated} por conteúdo, {legacy} apenas pelo nome")
+
+    def is_posted(self, digest: str, name: Optional[str] = None) -> bool:
+        """Verifica se a mídia já foi postada"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM posted WHERE content_hash = ?", (digest,)
+            ).fetchone()
+            if row is None and name is not None:
+                row = self._conn.execute(
+                    "SELECT 1 FROM legacy WHERE name = ?", (name,)
+                ).fetchone()
+        return row is not None
+
+    def _index(self) -> HammingIndex:
+        if self._similar is None:
+            index = HammingIndex(self.similarity_distance)
+            for name, phash in self._conn.execute("SELECT name, phash FROM posted WHERE phash IS NOT NULL"):
+                value = PerceptualHash.parse(phash)
+                index.add(value.key, (name, value))
+            self._similar = index
+        return self._similar
+
+    def find_similar(self, phash: PerceptualHash) -> Optional[Tuple[str, int]]:
+        """Mídia postada mais parecida (nome e distância), se estiver no limite de semelhança"""
+        with self._lock:
+            candidates = self._index().search(phash.key)
+        best = None
+        for _, (name, other) in candidates:
+            distance = phash.distance(other)
+            if distance <= self.similarity_distance and (best is None or distance < best[1]):
+                best = (name, distance)
+        return best
+
+    def _remember(self, name: str, phash: Optional[PerceptualHash]):
+        if phash is not None and self._similar is not None:
+            self._similar.add(phash.key, (name, phash))
+
+    def record(self, media_path: PathLike, digest: str, phash: Optional[PerceptualHash] = None):
+        """Registra uma mídia postada; a transação é confirmada a cada `batch_size` registros"""
+        name = os.path.basename(media_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO posted (content_hash, name, path, timestamp, phash) VALUES (?, ?, ?, ?, ?)",
+                (digest, name, str(media_path), datetime.now().isoformat(), str(phash) if phash else None)
+            )
+            self._remember(name, phash)
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._commit()
+
+    def record_album(self, album: str, items: Iterable[Tuple[PathLike, str, Optional[PerceptualHash]]]):
+        """Registra as mídias de um carrossel como um único post, em uma só transação
+
+        Cada mídia continua indexada pelo próprio hash (e não é postada de novo
+        individualmente); `album` as agrupa para a contagem de posts.
+        """
+        timestamp = datetime.now().isoformat()
+        rows = [
+            (digest, os.path.basename(path), str(path), timestamp, album, str(phash) if phash else None, phash)
+            for path, digest, phash in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO posted (content_hash, name, path, timestamp, album, phash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [row[:-1] for row in rows]
+            )
+            for row in rows:
+                self._remember(row[1], row[-1])
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._commit()
+
+    def posted_since(self, since: datetime) -> List[float]:
+        """Horários (epoch) dos posts feitos desde `since`, para as cotas de postagem
+
+        Um carrossel conta como um post.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT MIN(timestamp) FROM posted WHERE timestamp >= ? "
+                "GROUP BY COALESCE(album, content_hash)", (since.isoformat(),)
+            ).fetchall()
+        return [datetime.fromisoformat(timestamp).timestamp() for (timestamp,) in rows]
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def flush(self):
+        """Confirma os registros pendentes"""
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posted").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
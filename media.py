@@ -0,0 +1,501 @@
+import io
+import math
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+# PIL e moviepy são carregados apenas quando uma mídia precisa ser aberta,
+# para não pesar na inicialização quando não há nada a preparar
+from cache import MediaCache
+from probe import VideoInfo, probe_video
+from scheduler import PrepScheduler
+
+PathLike = Union[str, Path]
+
+IMAGE_FORMATS = ['JPEG', 'PNG']
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi']
+
+# Parâmetros das transformações; fazem parte da chave do cache
+IMAGE_PARAMS = {'max_size': [1080, 1080], 'quality': 95, 'exif_transpose': True}
+
+# Piso da busca de qualidade quando a imagem precisa caber em um limite de bytes
+IMAGE_MIN_QUALITY = 40
+
+# Decodifica JPEGs em escala reduzida até este múltiplo do tamanho final, antes do LANCZOS
+REDUCING_GAP = 2.0
+_DRAFT_SCALES = (8, 4, 2, 1)
+
+# JPEG das variantes por proporção: progressivo e com tabelas de Huffman otimizadas,
+# menor para o mesmo visual que o JPEG base de qualidade 95
+VARIANT_JPEG = {'quality': 88, 'progressive': True, 'optimize': True, 'subsampling': '4:2:0'}
+
+VIDEO_PARAMS = {'codec': 'libx264', 'audio_codec': 'aac'}
+
+# Vídeos que precisam caber em um limite de bytes: áudio fixo e folga para o container
+FIT_AUDIO_BITRATE = 128_000
+FIT_MARGIN = 0.9
+# O corte sem recodificar termina no pacote seguinte ao ponto pedido; a folga o mantém no limite
+TRIM_MARGIN = 0.5
+REMUX_PARAMS = {'container': 'mp4', 'faststart': True}
+
+# Decisões possíveis para um vídeo
+PASSTHROUGH = 'passthrough'  # enviado sem alterações
+REMUX = 'remux'  # streams copiados para um MP4 com faststart
+TRANSCODE = 'transcode'  # recodificado em H.264/AAC
+
+# Perfis H.264 de 8 bits 4:2:0 aceitos pelo Instagram
+COMPLIANT_H264_PROFILES = ('Baseline', 'Constrained Baseline', 'Main', 'High')
+
+
+@dataclass
+class VideoSettings:
+    """Parâmetros do encoder e limites de conformidade para vídeos"""
+    preset: str = 'medium'
+    crf: int = 23
+    threads: Optional[int] = None
+    max_dimension: int = 1920
+    max_bytes: Optional[int] = None  # recodifica com bitrate limitado para caber no tamanho
+    max_duration: Optional[float] = None  # corta vídeos mais longos
+
+    @classmethod
+    def from_config(cls, config) -> 'VideoSettings':
+        return cls(
+            preset=config.video_preset,
+            crf=config.video_crf,
+            threads=config.video_threads or None,
+            max_dimension=config.video_max_dimension,
+            max_bytes=config.max_video_size if config.video_fit_size else None,
+            max_duration=config.max_video_duration if config.video_trim else None,
+        )
+
+    def cache_params(self) -> dict:
+        """Parâmetros que alteram o arquivo gerado (a contagem de threads não entra)"""
+        params = dict(VIDEO_PARAMS, preset=self.preset, crf=self.crf, max_dimension=self.max_dimension)
+        if self.max_bytes:
+            params['max_bytes'] = self.max_bytes
+        if self.max_duration:
+            params['max_duration'] = self.max_duration
+        return params
+
+    def output_duration(self, duration: float) -> float:
+        """Duração do vídeo gerado, após o corte"""
+        return min(duration, self.max_duration) if self.max_duration else duration
+
+    def video_bitrate(self, duration: float) -> Optional[int]:
+        """Teto de bitrate do vídeo (bits/s) para caber em `max_bytes`, descontado o áudio"""
+        if not self.max_bytes or duration <= 0:
+            return None
+        bitrate = int(self.max_bytes * 8 * FIT_MARGIN / duration) - FIT_AUDIO_BITRATE
+        if bitrate < 100_000:
+            raise ValueError(f"Vídeo longo demais para caber em {self.max_bytes} bytes ({duration:.1f}s)")
+        return bitrate
+
+
+@dataclass(frozen=True)
+class AspectVariant:
+    """Render em uma proporção do Instagram
+
+    'crop' recorta o centro da imagem na proporção; 'pad' mantém a imagem inteira e
+    completa o quadro com `background`. A imagem nunca é ampliada.
+    """
+    width: int
+    height: int
+    policy: str = 'crop'
+    background: Tuple[int, int, int] = (0, 0, 0)
+
+    def cache_params(self) -> dict:
+        return {
+            'size': [self.width, self.height], 'policy': self.policy,
+            'background': list(self.background), 'exif_transpose': True, **VARIANT_JPEG,
+        }
+
+
+@dataclass(frozen=True)
+class ImageHeader:
+    """O que o cabeçalho de uma imagem informa, lido uma vez e repassado às etapas seguintes"""
+    format: Optional[str]
+    size: Tuple[int, int]
+    bands: int
+
+    @classmethod
+    def of(cls, img) -> 'ImageHeader':
+        """Do arquivo já aberto pelo PIL (sem decodificar os pixels)"""
+        return cls(img.format, img.size, len(img.getbands()))
+
+
+ASPECT_VARIANTS = {
+    'square': AspectVariant(1080, 1080),  # 1:1
+    'portrait': AspectVariant(1080, 1350),  # 4:5
+    'landscape': AspectVariant(1080, 566),  # 1.91:1
+    'story': AspectVariant(1080, 1920, policy='pad'),  # 9:16
+}
+
+
+def classify(path: PathLike) -> str:
+    """Classifica o arquivo como 'image', 'video' ou 'other'"""
+    if Path(path).suffix.lower() in VIDEO_EXTENSIONS:
+        return 'video'
+    from PIL import Image  # type: ignore
+
+    try:
+        with Image.open(path) as img:
+            if img.format in IMAGE_FORMATS:
+                return 'image'
+    except Exception:
+        pass
+    return 'other'
+
+
+def _target_size(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """Tamanho final preservando a proporção dentro de `box` (nunca amplia)"""
+    ratio = min(box[0] / size[0], box[1] / size[1], 1.0)
+    return max(1, round(size[0] * ratio)), max(1, round(size[1] * ratio))
+
+
+def _draft_request(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    target = _target_size(size, box)
+    return int(target[0] * REDUCING_GAP), int(target[1] * REDUCING_GAP)
+
+
+def estimate_image_memory(
+    source: PathLike, box: Optional[Tuple[int, int]] = None, header: Optional[ImageHeader] = None
+) -> int:
+    """Estimativa dos bytes decodificados para preparar a imagem
+
+    Usa `header`, se já lido; senão lê só o cabeçalho do arquivo.
+    """
+    if header is None:
+        from PIL import Image  # type: ignore
+
+        with Image.open(source) as img:
+            header = ImageHeader.of(img)
+    box = box or tuple(IMAGE_PARAMS['max_size'])
+    width, height = header.size
+    if header.format == 'JPEG':
+        request = _draft_request(header.size, box)
+        # Mesma regra do draft do PIL: maior redução que ainda cobre o pedido
+        for scale in _DRAFT_SCALES:
+            if -(-width // scale) >= request[0] and -(-height // scale) >= request[1]:
+                width, height = -(-width // scale), -(-height // scale)
+                break
+    return width * height * max(header.bands, 3)
+
+
+def encode_jpeg(img, max_bytes: Optional[int] = None, quality: int = IMAGE_PARAMS['quality'], **options) -> bytes:
+    """JPEG na maior qualidade (até `quality`) que cabe em `max_bytes`
+
+    A qualidade é buscada por bisseção, em memória; se nem IMAGE_MIN_QUALITY cabe,
+    fica o JPEG no piso de qualidade.
+    """
+    def encode(q: int) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=q, **options)
+        return buffer.getvalue()
+
+    data = encode(quality)
+    if not max_bytes or len(data) <= max_bytes:
+        return data
+    low, high = IMAGE_MIN_QUALITY, quality - 1
+    best = None
+    while low <= high:
+        q = (low + high) // 2
+        candidate = encode(q)
+        if len(candidate) <= max_bytes:
+            best, low = candidate, q + 1
+        else:
+            high = q - 1
+    return best if best is not None else encode(IMAGE_MIN_QUALITY)
+
+
+def resize_image(source: PathLike, output: PathLike, max_bytes: Optional[int] = None):
+    """Valida e redimensiona a imagem em uma única abertura do arquivo
+
+    JPEGs são decodificados já em escala reduzida (draft) e a orientação EXIF é aplicada
+    aos pixels, para que fotos de celular não saiam deitadas. Com `max_bytes`, a
+    qualidade do JPEG é reduzida até o arquivo caber no limite.
+    """
+    from PIL import Image, ImageOps  # type: ignore
+
+    box = tuple(IMAGE_PARAMS['max_size'])
+    with Image.open(source) as img:
+        if img.format not in IMAGE_FORMATS:
+            raise ValueError(f"Formato de imagem não suportado: {img.format}")
+        icc_profile = img.info.get('icc_profile')
+        if img.format == 'JPEG':
+            img.draft('RGB', _draft_request(img.size, box))
+        img.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        data = encode_jpeg(img, max_bytes, icc_profile=icc_profile)
+    with open(output, 'wb') as f:
+        f.write(data)
+
+
+def _variant_plan(size: Tuple[int, int], variant: AspectVariant):
+    """Região da origem (x0, y0, x1, y1), tamanho do conteúdo e escala aplicada"""
+    width, height = size
+    if variant.policy == 'crop':
+        ratio = variant.width / variant.height
+        if width / height > ratio:
+            crop_w, crop_h = height * ratio, height
+        else:
+            crop_w, crop_h = width, width / ratio
+        box = ((width - crop_w) / 2, (height - crop_h) / 2, (width + crop_w) / 2, (height + crop_h) / 2)
+        scale = min(1.0, variant.width / crop_w)
+        return box, (max(1, round(crop_w * scale)), max(1, round(crop_h * scale))), scale
+    if variant.policy == 'pad':
+        scale = min(1.0, variant.width / width, variant.height / height)
+        return (0, 0, width, height), (max(1, round(width * scale)), max(1, round(height * scale))), scale
+    raise ValueError(f"Política de proporção desconhecida: {variant.policy}")
+
+
+def render_variants(source: PathLike, outputs: Dict[str, PathLike]):
+    """Gera as variantes pedidas (nome em ASPECT_VARIANTS -> arquivo) com uma única decodificação
+
+    O JPEG é decodificado na menor escala que ainda atende a variante mais exigente.
+    """
+    from PIL import Image, ImageOps  # type: ignore
+
+    variants = {name: ASPECT_VARIANTS[name] for name in outputs}
+    with Image.open(source) as img:
+        if img.format not in IMAGE_FORMATS:
+            raise ValueError(f"Formato de imagem não suportado: {img.format}")
+        icc_profile = img.info.get('icc_profile')
+        size = img.size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            # Rotação de 90 graus pelo EXIF: as proporções valem para a imagem em pé
+            size = size[::-1]
+        plans = {name: _variant_plan(size, variant) for name, variant in variants.items()}
+        if img.format == 'JPEG':
+            need = max(scale for _, _, scale in plans.values()) * REDUCING_GAP
+            img.draft('RGB', (math.ceil(img.size[0] * need), math.ceil(img.size[1] * need)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        factor = img.size[0] / size[0]  # redução aplicada pelo draft
+
+        for name, output in outputs.items():
+            variant = variants[name]
+            box, content, _ = plans[name]
+            render = img.resize(
+                content, Image.Resampling.LANCZOS, box=tuple(v * factor for v in box), reducing_gap=REDUCING_GAP
+            )
+            if variant.policy == 'pad':
+                canvas = Image.new('RGB', (variant.width, variant.height), variant.background)
+                canvas.paste(render, ((variant.width - content[0]) // 2, (variant.height - content[1]) // 2))
+                render = canvas
+            render.save(output, "JPEG", icc_profile=icc_profile, **VARIANT_JPEG)
+
+
+def ffmpeg_binary() -> str:
+    """Executável do ffmpeg: o distribuído com o moviepy ou o do sistema"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        path = shutil.which('ffmpeg')
+        if path is None:
+            raise RuntimeError("ffmpeg não encontrado")
+        return path
+
+
+def convert_video(source: PathLike, output: PathLike, settings: Optional[VideoSettings] = None):
+    """Converte o vídeo para um formato compatível com o Instagram"""
+    # O módulo do clip, sem o moviepy.editor (que carrega IPython e afins)
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    settings = settings or VideoSettings()
+    video = VideoFileClip(str(source))
+    clip = video
+    try:
+        ffmpeg_params = ['-crf', str(settings.crf), '-movflags', '+faststart']
+        extra = {}
+        duration = settings.output_duration(video.duration)
+        if duration < video.duration:
+            clip = video.subclip(0, duration)
+        bitrate = settings.video_bitrate(duration)
+        if bitrate:
+            # CRF com teto de bitrate (VBV): mantém a qualidade do CRF onde ela já cabe
+            # e limita só as cenas que estourariam o tamanho, em uma única passada
+            ffmpeg_params += ['-maxrate', str(bitrate), '-bufsize', str(bitrate)]
+            extra['audio_bitrate'] = str(FIT_AUDIO_BITRATE)
+        if max(video.size) > settings.max_dimension:
+            # Reduz no próprio ffmpeg, com dimensões pares exigidas pelo yuv420p
+            factor = settings.max_dimension / max(video.size)
+            width, height = (max(2, int(round(side * factor / 2)) * 2) for side in video.size)
+            ffmpeg_params += ['-vf', f"scale={width}:{height}"]
+        clip.write_videofile(
+            str(output),
+            codec=VIDEO_PARAMS['codec'],
+            audio_codec=VIDEO_PARAMS['audio_codec'],
+            # Áudio temporário por saída, para conversões em paralelo
+            temp_audiofile=f"{output}.temp-audio.m4a",
+            remove_temp=True,
+            preset=settings.preset,
+            threads=settings.threads,
+            ffmpeg_params=ffmpeg_params,
+            **extra
+        )
+    finally:
+        video.close()
+    if settings.max_bytes and os.path.getsize(output) > settings.max_bytes:
+        raise ValueError(f"Vídeo convertido ainda passa de {settings.max_bytes} bytes: {source}")
+
+
+def remux_video(source: PathLike, output: PathLike, max_duration: Optional[float] = None):
+    """Copia os streams para um MP4 com o moov no início, sem recodificar
+
+    Com `max_duration`, o vídeo é cortado nessa duração (o início é preservado,
+    então o corte não depende de quadros-chave).
+    """
+    trim = ['-t', f"{max(0.0, max_duration - TRIM_MARGIN):.3f}"] if max_duration else []
+    subprocess.run(
+        [
+            ffmpeg_binary(), '-v', 'error', '-y', '-i', str(source),
+            '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy', *trim,
+            '-movflags', '+faststart', '-f', 'mp4', str(output),
+        ],
+        check=True, capture_output=True
+    )
+
+
+def extract_thumbnail(source: PathLike, output: PathLike, at: float = 0.0):
+    """Grava um quadro do vídeo como JPEG, para a capa do post"""
+    subprocess.run(
+        [
+            ffmpeg_binary(), '-v', 'error', '-y', '-ss', f"{at:.3f}", '-i', str(source),
+            '-frames:v', '1', '-q:v', '2', str(output),
+        ],
+        check=True, capture_output=True
+    )
+
+
+def plan_video(
+    info: Optional[VideoInfo],
+    settings: Optional[VideoSettings] = None,
+    size: Optional[int] = None,
+) -> str:
+    """Decide entre enviar sem alterações, só trocar o container ou recodificar
+
+    Com `settings.max_duration`, vídeos mais longos são cortados (no remux, se os
+    streams já servem); com `settings.max_bytes` e o `size` do arquivo, os que não
+    cabem no limite, mesmo após o corte, são recodificados com bitrate limitado.
+    """
+    settings = settings or VideoSettings()
+    if info is None:
+        return TRANSCODE
+    compliant_streams = (
+        info.video_codec == 'h264'
+        and (info.video_profile is None or info.video_profile in COMPLIANT_H264_PROFILES)
+        and info.audio_codec in (None, 'aac')
+        and max(info.width, info.height) <= settings.max_dimension
+    )
+    duration = settings.output_duration(info.duration)
+    if settings.max_bytes and size and info.duration > 0:
+        # Estimativa proporcional do tamanho após o corte
+        compliant_streams = compliant_streams and size * duration / info.duration <= settings.max_bytes
+    if not compliant_streams:
+        return TRANSCODE
+    if info.container == 'mp4' and info.faststart and duration >= info.duration:
+        return PASSTHROUGH
+    return REMUX
+
+
+def prepare_image(
+    source: PathLike,
+    cache: MediaCache,
+    digest: Optional[str] = None,
+    scheduler: Optional[PrepScheduler] = None,
+    max_bytes: Optional[int] = None,
+    pin: bool = False,
+    header: Optional[ImageHeader] = None,
+) -> Path:
+    """Imagem redimensionada, reaproveitada do cache quando possível (fixada nele com `pin`)
+
+    Com `header` (já lido pela validação), a origem só é aberta de novo pelo worker.
+    """
+    def produce(out: Path):
+        if scheduler is None:
+            resize_image(source, out, max_bytes)
+        else:
+            scheduler.run_image(
+                resize_image, str(source), str(out), max_bytes,
+                size=os.path.getsize(source), memory=estimate_image_memory(source, header=header)
+            )
+
+    params = dict(IMAGE_PARAMS, max_bytes=max_bytes) if max_bytes else IMAGE_PARAMS
+    return cache.fetch(source, 'resize', params, '.jpg', produce, digest, pin)
+
+
+def prepare_variants(
+    source: PathLike,
+    cache: MediaCache,
+    names: Optional[Iterable[str]] = None,
+    digest: Optional[str] = None,
+    scheduler: Optional[PrepScheduler] = None,
+) -> Dict[str, Path]:
+    """Variantes por proporção (nome -> arquivo), geradas juntas e guardadas no cache"""
+    names = list(names or ASPECT_VARIANTS)
+    unknown = set(names) - set(ASPECT_VARIANTS)
+    if unknown:
+        raise ValueError(f"Variantes desconhecidas: {', '.join(sorted(unknown))}")
+    requests = {name: ('variant', ASPECT_VARIANTS[name].cache_params(), '.jpg') for name in names}
+
+    def produce(outputs: Dict[str, Path]):
+        outputs = {name: str(path) for name, path in outputs.items()}
+        if scheduler is None:
+            render_variants(source, outputs)
+        else:
+            box = (max(v.width for v in ASPECT_VARIANTS.values()), max(v.height for v in ASPECT_VARIANTS.values()))
+            scheduler.run_image(
+                render_variants, str(source), outputs,
+                size=os.path.getsize(source), memory=estimate_image_memory(source, box)
+            )
+
+    return cache.fetch_many(source, requests, produce, digest)
+
+
+def prepare_video(
+    source: PathLike,
+    cache: MediaCache,
+    digest: Optional[str] = None,
+    info: Optional[VideoInfo] = None,
+    settings: Optional[VideoSettings] = None,
+    scheduler: Optional[PrepScheduler] = None,
+    pin: bool = False,
+) -> Tuple[Path, str]:
+    """Vídeo pronto para upload e a decisão tomada (passthrough, remux ou transcode)
+
+    Com `pin`, o arquivo gerado fica fixado no cache até `cache.unpin`.
+    """
+    settings = settings or VideoSettings()
+    size = os.path.getsize(source)
+    action = plan_video(info or probe_video(source), settings, size)
+    if action == PASSTHROUGH:
+        return Path(source), action
+
+    if action == REMUX:
+        def produce(out: Path):
+            if scheduler is None:
+                remux_video(source, out, settings.max_duration)
+            else:
+                scheduler.run_light(lambda: remux_video(source, out, settings.max_duration), size=size)
+
+        params = dict(REMUX_PARAMS, max_duration=settings.max_duration) if settings.max_duration else REMUX_PARAMS
+        return cache.fetch(source, 'remux', params, '.mp4', produce, digest, pin), action
+
+    def produce(out: Path):
+        if scheduler is None:
+            convert_video(source, out, settings)
+        else:
+            # O encoder recebe as threads reservadas no orçamento de CPU
+            scheduler.run_video(
+                lambda threads: convert_video(source, out, replace(settings, threads=threads)),
+                size=size
+            )
+
+    return cache.fetch(source, 'transcode', settings.cache_params(), '.mp4', produce, digest, pin), action
@@ -0,0 +1,261 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import structlog
+
+PREFIX = 'instaposter'
+
+# Limites (segundos) dos buckets do histograma de duração das etapas
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, math.inf)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# O logger 'metrics' não propaga para o log principal, para não poluir o console;
+# sem configure_logging os eventos são descartados
+_logger = logging.getLogger('metrics')
+_logger.propagate = False
+_logger.addHandler(logging.NullHandler())
+
+log = structlog.wrap_logger(
+    _logger,
+    processors=[
+        structlog.contextvars.merge_contextvars,
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt='iso'),
+        structlog.processors.JSONRenderer(ensure_ascii=False),
+    ],
+)
+
+
+def configure_logging(path: Optional[Union[str, Path]]):
+    """Grava os spans em JSON, um evento por linha, no arquivo `path` (None desativa)"""
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+    if path:
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+    else:
+        _logger.addHandler(logging.NullHandler())
+
+
+@dataclass
+class _Histogram:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    errors: int = 0
+    buckets: List[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+
+    def observe(self, seconds: float, error: bool):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errors += 1
+        for i, limit in enumerate(BUCKETS):
+            if seconds <= limit:
+                self.buckets[i] += 1
+                break
+
+
+class Span:
+    """Duração de uma etapa de um arquivo; `outcome` pode ser ajustado dentro do bloco"""
+
+    def __init__(self, stage: str, fields: dict):
+        self.stage = stage
+        self.fields = fields
+        self.outcome = 'ok'
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Metrics:
+    """Registro de métricas do processo: durações por etapa, contadores e medidores
+
+    Os medidores são funções consultadas na exportação (profundidade de filas, estado
+    do cache), então não há custo enquanto ninguém lê as métricas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], Tuple[str, Callable[[], float]]] = {}
+        self.started = time.time()
+
+    def observe(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            self._stages.setdefault(stage, _Histogram()).observe(seconds, error)
+
+    @contextmanager
+    def span(self, stage: str, **fields) -> Iterator[Span]:
+        """Mede o bloco como uma etapa e registra o evento estruturado correspondente"""
+        span = Span(stage, fields)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.outcome = 'error'
+            span.fields['error'] = repr(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(stage, elapsed, span.outcome == 'error')
+            log.info('span', stage=stage, duration_ms=round(elapsed * 1000, 3),
+                     outcome=span.outcome, **span.fields)
+
+    def record(self, stage: str, seconds: float, **fields):
+        """Registra uma etapa medida fora de `span` (ex.: a parte própria de uma varredura)"""
+        self.observe(stage, seconds)
+        log.info('span', stage=stage, duration_ms=round(seconds * 1000, 3), outcome='ok', **fields)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, fn: Callable[[], float], help: str = '', **labels) -> Tuple[str, Labels]:
+        """Registra um medidor; retorna a chave para `remove_gauge`"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = (help, fn)
+        return key
+
+    def remove_gauge(self, key: Tuple[str, Labels]):
+        with self._lock:
+            self._gauges.pop(key, None)
+
+    def render(self) -> str:
+        """Métricas no formato de texto do Prometheus"""
+        with self._lock:
+            stages = {name: (h.count, h.total, h.errors, list(h.buckets)) for name, h in self._stages.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Duração das etapas por arquivo",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        for stage, (count, total, _, buckets) in sorted(stages.items()):
+            labels = (('stage', stage),)
+            cumulative = 0
+            for limit, amount in zip(BUCKETS, buckets):
+                cumulative += amount
+                le = '+Inf' if math.isinf(limit) else repr(float(limit))
+                bucket_labels = _format_labels(labels, 'le="%s"' % le)
+                lines.append(f"{PREFIX}_stage_seconds_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{PREFIX}_stage_seconds_sum{_format_labels(labels)} {total}")
+            lines.append(f"{PREFIX}_stage_seconds_count{_format_labels(labels)} {count}")
+
+        lines.append(f"# TYPE {PREFIX}_stage_errors_total counter")
+        for stage, (_, _, errors, _) in sorted(stages.items()):
+            lines.append(f"{PREFIX}_stage_errors_total{_format_labels((('stage', stage),))} {errors}")
+
+        declared = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in declared:
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                declared.add(name)
+            lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (help_text, fn) in sorted(gauges.items(), key=lambda item: item[0]):
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            if name not in declared:
+                if help_text:
+                    lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+                declared.add(name)
+            lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {value}")
+
+        lines.append(f"# TYPE {PREFIX}_uptime_seconds gauge")
+        lines.append(f"{PREFIX}_uptime_seconds {time.time() - self.started:.3f}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict[str, dict]:
+        """Totais por etapa, para o resumo ao fim de uma execução"""
+        with self._lock:
+            return {
+                stage: {
+                    'count': h.count,
+                    'errors': h.errors,
+                    'total_s': round(h.total, 3),
+                    'mean_ms': round(h.total / h.count * 1000, 2) if h.count else 0.0,
+                    'max_ms': round(h.max * 1000, 2),
+                }
+                for stage, h in self._stages.items()
+            }
+
+    def log_summary(self):
+        """Imprime o resumo por etapa e o registra no log de métricas"""
+        summary = self.summary()
+        if not summary:
+            return
+        print("\nTempo por etapa:")
+        for stage, data in sorted(summary.items(), key=lambda item: -item[1]['total_s']):
+            print(f"  {stage:<12} {data['count']:>5}x  total {data['total_s']:>9.2f}s  "
+                  f"média {data['mean_ms']:>9.1f}ms  máx {data['max_ms']:>9.1f}ms  erros {data['errors']}")
+        log.info('summary', stages=summary)
+
+
+class MetricsServer:
+    """Endpoint HTTP local com as métricas no formato do Prometheus (GET /metrics)"""
+
+    def __init__(self, metrics: Metrics, port: int, host: str = '127.0.0.1'):
+        registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'MetricsServer':
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Registro padrão do processo
+metrics = Metrics()
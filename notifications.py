@@ -1,68 +1,317 @@
-import smtplib
-from telegram.ext import Application
+import asyncio
 import logging
-from typing import Union
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import datetime
+from email.message import EmailMessage
+from typing import List, Optional, Union
+
+import aiosmtplib
+from telegram import Bot
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
+
 from config import Config
 from exceptions import NotificationException
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__name__)
 
+# Limite de caracteres de uma mensagem do Telegram
+TELEGRAM_MAX_LENGTH = 4096
+
+
+@dataclass
+class Notification:
+    message: str
+    error: Optional[str] = None
+    timestamp: float = 0.0
+
+    def format(self) -> str:
+        hora = datetime.fromtimestamp(self.timestamp).strftime('%H:%M:%S')
+        texto = f"[{hora}] {self.message}"
+        return f"{texto}\n{self.error}" if self.error else texto
+
+
+class NotificationChannel(ABC):
+    """Canal com fila e estado de retry próprios
+
+    As notificações são agrupadas em resumos: o lote é enviado quando completa
+    `batch_size` mensagens ou `batch_window` segundos após a primeira; erros antecipam
+    o envio. Falhas de um canal não reenviam nem atrasam os outros.
+    """
+
+    name = 'canal'
+
+    def __init__(self, batch_size: int = 50, batch_window: float = 60, max_retries: int = 3):
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.sent = 0  # lotes enviados
+        self.failed = 0  # lotes descartados após esgotar as tentativas
+        self.consecutive_failures = 0
+
+    async def _collect(self) -> Optional[List[Notification]]:
+        """Aguarda o próximo lote; None quando o canal foi encerrado"""
+        first = await self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size and not batch[-1].error:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                # Encerramento: envia o que já foi coletado e repõe o sinal
+                self.queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self._collect()
+            if batch is None:
+                break
+            try:
+                async for attempt in AsyncRetrying(
+                    stop=stop_after_attempt(self.max_retries),
+                    wait=wait_exponential(multiplier=1, min=4, max=60),
+                    reraise=True,
+                ):
+                    with attempt:
+                        await self.send(batch)
+                self.sent += 1
+                self.consecutive_failures = 0
+            except Exception as e:
+                self.failed += 1
+                self.consecutive_failures += 1
+                logger.error(f"Notificação via {self.name} descartada ({len(batch)} mensagens): {e}")
+        await self.close()
+
+    @abstractmethod
+    async def send(self, batch: List[Notification]):
+        """Envia um lote; exceções fazem o lote ser tentado de novo"""
+
+    async def close(self):
+        pass
+
+
+class TelegramChannel(NotificationChannel):
+    name = 'telegram'
+
+    def __init__(self, token: str, chat_id: str, **kwargs):
+        super().__init__(**kwargs)
+        self.bot = Bot(token=token)
+        self.chat_id = chat_id
+        self._initialized = False
+
+    async def send(self, batch: List[Notification]):
+        try:
+            if not self._initialized:
+                await self.bot.initialize()
+                self._initialized = True
+            texto = "\n\n".join(n.format() for n in batch)
+            # Lotes grandes são divididos no limite de tamanho do Telegram
+            for inicio in range(0, len(texto), TELEGRAM_MAX_LENGTH):
+                await self.bot.send_message(
+                    chat_id=self.chat_id,
+                    text=texto[inicio:inicio + TELEGRAM_MAX_LENGTH]
+                )
+        except Exception as e:
+            raise NotificationException(f"Erro ao enviar notificação Telegram: {e}", self.name)
+
+    async def close(self):
+        if self._initialized:
+            await self.bot.shutdown()
+            self._initialized = False
+
+
+class EmailChannel(NotificationChannel):
+    """Email via aiosmtplib, com a conexão SMTP reaproveitada entre os lotes
+
+    Uma conexão ociosa há mais de `idle_timeout` segundos é verificada com NOOP antes
+    do uso; conexões derrubadas pelo servidor são refeitas na tentativa seguinte.
+    """
+
+    name = 'email'
+
+    def __init__(self, hostname: str, port: int, username: Optional[str], password: Optional[str],
+                 sender: str, recipient: str, idle_timeout: float = 60, **kwargs):
+        super().__init__(**kwargs)
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.recipient = recipient
+        self.idle_timeout = idle_timeout
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            if time.monotonic() - self._last_used < self.idle_timeout:
+                return self._smtp
+            try:
+                await self._smtp.noop()
+                return self._smtp
+            except aiosmtplib.SMTPException:
+                await self._discard()
+        # STARTTLS é negociado automaticamente quando o servidor oferece
+        self._smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+        )
+        await self._smtp.connect()
+        return self._smtp
+
+    async def _discard(self):
+        if self._smtp is not None:
+            self._smtp.close()
+            self._smtp = None
+
+    async def send(self, batch: List[Notification]):
+        erros = sum(1 for n in batch if n.error)
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = self.recipient
+        if len(batch) == 1:
+            email['Subject'] = "Erro no Upload" if erros else "Status do Upload"
+        else:
+            email['Subject'] = f"Resumo do Upload: {len(batch)} eventos, {erros} erros"
+        email.set_content("\n\n".join(n.format() for n in batch))
+        try:
+            smtp = await self._connection()
+            await smtp.send_message(email)
+            self._last_used = time.monotonic()
+        except Exception as e:
+            await self._discard()
+            raise NotificationException(f"Erro ao enviar email: {e}", self.name)
+
+    async def close(self):
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except aiosmtplib.SMTPException:
+                pass
+        self._smtp = None
+
+
 class NotificationService:
+    """Despacha notificações sem bloquear o event loop nem quem as gera
+
+    `notify` apenas enfileira a mensagem em cada canal habilitado e pode ser chamado
+    tanto de corrotinas quanto de outras threads. Cada canal envia seus resumos em uma
+    task própria, iniciada por `start()` e encerrada, com o envio do que restou, por `close()`.
+    Código síncrono usa `start_background()`/`close_background()`, com o event loop
+    em uma thread própria.
+    """
+
     def __init__(self, config: Config):
         self.config = config
-        self._setup_services()
+        self.channels: List[NotificationChannel] = []
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
         self.logger = logging.getLogger(__name__)
-    
+        self._setup_services()
+
     def _setup_services(self):
+        batching = dict(
+            batch_size=self.config.notify_batch_size,
+            batch_window=self.config.notify_batch_window,
+            max_retries=self.config.notify_max_retries,
+        )
         if self.config.telegram_enabled:
-            self._setup_telegram()
+            try:
+                self.channels.append(TelegramChannel(
+                    self.config.telegram_token, self.config.telegram_chat_id, **batching
+                ))
+            except Exception as e:
+                raise NotificationException("Erro ao configurar Telegram", "telegram", {"error": str(e)})
         if self.config.email_enabled:
-            self._setup_email()
-    
-    def _setup_telegram(self):
-        try:
-            self.bot = Application.from_token(token=self.config.telegram_token)
-        except Exception as e:
-            raise NotificationException("Erro ao configurar Telegram", "telegram", {"error": str(e)})
-    
-    def _setup_email(self):
-        try:
-            self.smtp = smtplib.SMTP(self.config.smtp_server)
-            self.smtp.starttls()
-            self.smtp.login(self.config.smtp_user, self.config.smtp_password)
-        except Exception as e:
-            raise NotificationException("Erro ao configurar email", "email", {"error": str(e)})
-    
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def notify(self, message: str, error: Union[Exception, None] = None):
-        """Envia notificação com retry automático"""
-        try:
-            if self.config.telegram_enabled:
-                await self._notify_telegram(message, error)
-            if self.config.email_enabled:
-                await self._notify_email(message, error)
-        except Exception as e:
-            self.logger.error(f"Erro ao enviar notificação: {e}")
-            raise
-    
-    async def _notify_telegram(self, message: str, error: Union[Exception, None]):
-        try:
-            await self.bot.send_message(
-                chat_id=self.config.telegram_chat_id,
-                text=f"{message}\n{str(error) if error else ''}"
-            )
-        except Exception as e:
-            raise NotificationException(f"Erro ao enviar notificação Telegram: {e}")
-    
-    async def _notify_email(self, message: str, error: Union[Exception, None]):
-        try:
-            subject = "Erro no Upload" if error else "Status do Upload"
-            body = f"{message}\n{str(error) if error else ''}"
-            self.smtp.sendmail(
+            if not self.config.smtp_server:
+                raise NotificationException("Erro ao configurar email", "email", {"error": "smtp_server ausente"})
+            self.channels.append(EmailChannel(
+                self.config.smtp_server,
+                self.config.smtp_port,
+                self.config.smtp_user,
+                self.config.smtp_password,
                 self.config.smtp_from,
                 self.config.smtp_to,
-                f"Subject: {subject}\n\n{body}"
-            )
-        except Exception as e:
-            raise NotificationException(f"Erro ao enviar email: {e}") 
\ No newline at end of file
+                idle_timeout=self.config.smtp_idle_timeout,
+                **batching
+            ))
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(channel.run()) for channel in self.channels]
+
+    def start_background(self) -> 'NotificationService':
+        """Inicia os canais em um event loop próprio, numa thread de fundo"""
+        loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=loop.run_forever, name='notificacoes', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), loop).result()
+        return self
+
+    def close_background(self, timeout: Optional[float] = None):
+        """Envia os lotes pendentes (até `timeout` segundos) e encerra a thread do event loop"""
+        loop = self._loop
+        if loop is None or self._thread is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result(timeout)
+        except FutureTimeoutError:
+            self.logger.warning("Notificações pendentes descartadas no encerramento")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                loop.close()
+            self._thread = None
+
+    def notify(self, message: str, error: Union[Exception, None] = None):
+        """Enfileira a notificação em todos os canais, sem aguardar o envio"""
+        if self._loop is None:
+            raise NotificationException("Serviço de notificação não iniciado", "dispatcher")
+        notification = Notification(message, str(error) if error else None, time.time())
+        for channel in self.channels:
+            self._put(channel, notification)
+
+    def _put(self, channel: NotificationChannel, item: Optional[Notification]):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            channel.queue.put_nowait(item)
+        else:
+            self._loop.call_soon_threadsafe(channel.queue.put_nowait, item)
+
+    async def close(self):
+        """Envia os lotes pendentes e encerra os canais"""
+        if self._loop is None:
+            return
+        for channel in self.channels:
+            self._put(channel, None)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
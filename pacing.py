@@ -0,0 +1,165 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Iterable, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def throttle_errors() -> Tuple[Type[BaseException], ...]:
+    """Respostas do Instagram que indicam excesso de requisições
+
+    O instagrapi só é importado na primeira consulta, não na inicialização.
+    """
+    from instagrapi.exceptions import (
+        ClientThrottledError,
+        FeedbackRequired,
+        PleaseWaitFewMinutes,
+        RateLimitError,
+    )
+    return (PleaseWaitFewMinutes, RateLimitError, FeedbackRequired, ClientThrottledError)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+class PostingRateLimiter:
+    """Ritmo de postagem: token bucket por hora, cota diária, intervalo mínimo e backoff
+
+    Só uploads concluídos consomem cota. Quando o Instagram sinaliza excesso de
+    requisições, os posts são suspensos por um backoff exponencial e o intervalo
+    entre posts ganha uma penalidade que diminui pela metade a cada sucesso.
+    """
+
+    def __init__(
+        self,
+        posts_per_hour: int = 30,
+        posts_per_day: int = 200,
+        burst: int = 5,
+        photo_interval: float = 10,
+        video_interval: float = 30,
+        jitter: float = 0.2,
+        backoff_initial: float = 60,
+        backoff_max: float = 3600,
+        history: Iterable[float] = (),
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+        wait_event: Callable[[threading.Event, float], bool] = threading.Event.wait,
+    ):
+        self.posts_per_hour = posts_per_hour
+        self.posts_per_day = posts_per_day
+        self.burst = max(1, burst)
+        self.intervals = {'photo': photo_interval, 'video': video_interval}
+        self.jitter = jitter
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.sleep = sleep
+        self.wait_event = wait_event
+
+        self.throttled = 0
+        self.waited = 0.0
+        self._tokens = float(self.burst)
+        self._refilled_at: Optional[float] = None
+        self._day: deque = deque()
+        self._next_post = 0.0
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+        self._penalty = 0.0
+
+        # Posts de execuções anteriores contam para as cotas
+        for timestamp in sorted(history):
+            self._consume(timestamp)
+            self._next_post = timestamp
+
+    @classmethod
+    def from_config(cls, config, history: Iterable[float] = (), **kwargs) -> 'PostingRateLimiter':
+        """Limiter com os parâmetros da configuração; `kwargs` sobrescrevem qualquer um deles"""
+        params = dict(
+            posts_per_hour=config.posts_per_hour,
+            posts_per_day=config.posts_per_day,
+            burst=config.posting_burst,
+            photo_interval=config.photo_interval,
+            video_interval=config.video_interval,
+            jitter=config.pacing_jitter,
+            backoff_initial=config.throttle_backoff_initial,
+            backoff_max=config.throttle_backoff_max,
+        )
+        params.update(kwargs)
+        return cls(history=history, **params)
+
+    @staticmethod
+    def is_throttle(error: BaseException) -> bool:
+        return isinstance(error, throttle_errors())
+
+    def _refill(self, now: float):
+        if not self.posts_per_hour:
+            return
+        if self._refilled_at is not None:
+            rate = self.posts_per_hour / HOUR
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _consume(self, now: float):
+        self._refill(now)
+        self._tokens = max(0.0, self._tokens - 1)
+        self._day.append(now)
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * (1 + random.uniform(0, self.jitter)) if seconds > 0 else 0.0
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Segundos até o próximo post ser permitido"""
+        now = self.clock() if now is None else now
+        delay = max(self._next_post - now, self._blocked_until - now, 0.0)
+
+        if self.posts_per_hour:
+            self._refill(now)
+            if self._tokens < 1:
+                delay = max(delay, (1 - self._tokens) * HOUR / self.posts_per_hour)
+
+        while self._day and self._day[0] <= now - DAY:
+            self._day.popleft()
+        if self.posts_per_day and len(self._day) >= self.posts_per_day:
+            delay = max(delay, self._day[0] + DAY - now)
+        return delay
+
+    def wait(self, stop: Optional[threading.Event] = None) -> float:
+        """Bloqueia até o próximo post ser permitido e retorna o tempo esperado
+
+        Com `stop`, a espera é interrompida assim que o evento for sinalizado.
+        """
+        waited = 0.0
+        while True:
+            delay = self.delay()
+            if delay <= 0:
+                break
+            print(f"Aguardando {delay:.1f} segundos antes do próximo post...")
+            if stop is not None:
+                if self.wait_event(stop, delay):
+                    break
+            else:
+                self.sleep(delay)
+            waited += delay
+        self.waited += waited
+        return waited
+
+    def record_post(self, kind: str):
+        """Contabiliza um upload concluído e agenda o intervalo até o próximo"""
+        now = self.clock()
+        self._consume(now)
+        self._next_post = now + self._jittered(self.intervals.get(kind, 0) + self._penalty)
+        self._backoff = 0.0
+        self._penalty /= 2
+
+    def record_throttle(self, error: Optional[BaseException] = None):
+        """Suspende os posts por um backoff exponencial após uma resposta de limite"""
+        self.throttled += 1
+        self._backoff = min(max(self._backoff * 2, self.backoff_initial), self.backoff_max)
+        self._penalty = max(self._penalty, self._backoff / 4)
+        self._blocked_until = self.clock() + self._jittered(self._backoff)
+        logger.warning(f"Limite do Instagram atingido ({error}); pausando por {self._backoff:.0f}s")
@@ -0,0 +1,171 @@
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar, Union
+
+from media import ffmpeg_binary
+from probe import VideoInfo, probe_video
+
+PathLike = Union[str, Path]
+T = TypeVar('T')
+
+# dHash: gradiente horizontal de uma miniatura 9x8 em tons de cinza (64 bits)
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+# Posições (fração da duração) dos quadros usados como assinatura de um vídeo
+VIDEO_FRAME_POSITIONS = (0.1, 0.5, 0.9)
+
+# Quadros com pouca informação (cartões lisos, fades) dão o mesmo hash para conteúdos
+# diferentes: exige-se um mínimo de vizinhos com diferença visível e de bits em cada lado
+MIN_GRADIENT = 4  # diferença de cinza entre vizinhos que conta como borda
+MIN_EDGES = 16  # das 64 comparações
+MIN_BITS = 8  # bits 1 (e 0) no hash
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _informative(pixels: bytes, value: int) -> bool:
+    """Se o quadro tem detalhe suficiente para o hash distinguir conteúdos"""
+    if not MIN_BITS <= value.bit_count() <= 64 - MIN_BITS:
+        return False
+    edges = sum(
+        abs(pixels[row * HASH_WIDTH + col] - pixels[row * HASH_WIDTH + col + 1]) >= MIN_GRADIENT
+        for row in range(HASH_HEIGHT) for col in range(HASH_WIDTH - 1)
+    )
+    return edges >= MIN_EDGES
+
+
+def _dhash(pixels: bytes) -> int:
+    """Hash de 64 bits: cada bit indica se o pixel é mais claro que o vizinho à direita"""
+    value = 0
+    for row in range(HASH_HEIGHT):
+        offset = row * HASH_WIDTH
+        for col in range(HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+@dataclass(frozen=True)
+class PerceptualHash:
+    """Hash perceptual de uma mídia: um dHash por imagem, um por quadro-chave de vídeo"""
+    frames: Tuple[int, ...]
+
+    def __str__(self) -> str:
+        return ','.join(f"{frame:016x}" for frame in self.frames)
+
+    @classmethod
+    def parse(cls, text: str) -> 'PerceptualHash':
+        return cls(tuple(int(part, 16) for part in text.split(',')))
+
+    @property
+    def key(self) -> int:
+        """Quadro usado na busca do índice (o do meio, nos vídeos)"""
+        return self.frames[len(self.frames) // 2]
+
+    def distance(self, other: 'PerceptualHash') -> int:
+        """Maior distância de Hamming entre quadros correspondentes (imagem x vídeo: 64)"""
+        if len(self.frames) != len(other.frames):
+            return 64
+        return max(hamming(a, b) for a, b in zip(self.frames, other.frames))
+
+
+def image_hash(source) -> Optional[PerceptualHash]:
+    """dHash da imagem, decodificada em escala reduzida quando o formato permite (JPEG)
+
+    `source` é um caminho ou uma imagem já aberta pelo PIL e ainda não decodificada.
+    None para imagens quase lisas, cujo hash não as distingue (vale só o hash do conteúdo).
+    """
+    from PIL import Image
+
+    if isinstance(source, (str, Path)):
+        with Image.open(source) as img:
+            return image_hash(img)
+    source.draft('L', (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+    pixels = source.convert('L').resize((HASH_WIDTH, HASH_HEIGHT), Image.Resampling.BOX).tobytes()
+    value = _dhash(pixels)
+    return PerceptualHash((value,)) if _informative(pixels, value) else None
+
+
+def video_hash(path: PathLike, info: Optional[VideoInfo] = None) -> Optional[PerceptualHash]:
+    """dHash de quadros em posições fixas do vídeo, reduzidos pelo próprio ffmpeg
+
+    None se nenhum quadro tem detalhe suficiente (um vídeo só de fades e telas lisas).
+    """
+    info = info or probe_video(path)
+    if info is None or not info.duration:
+        return None
+    frames = []
+    informative = False
+    for position in VIDEO_FRAME_POSITIONS:
+        result = subprocess.run(
+            [
+                ffmpeg_binary(), '-v', 'error', '-ss', f"{info.duration * position:.3f}", '-i', str(path),
+                '-frames:v', '1', '-vf', f"scale={HASH_WIDTH}:{HASH_HEIGHT}:flags=area,format=gray",
+                '-f', 'rawvideo', '-',
+            ],
+            check=True, capture_output=True
+        )
+        if len(result.stdout) < HASH_WIDTH * HASH_HEIGHT:
+            return None
+        value = _dhash(result.stdout)
+        informative = informative or _informative(result.stdout, value)
+        frames.append(value)
+    return PerceptualHash(tuple(frames)) if informative else None
+
+
+class HammingIndex(Generic[T]):
+    """Índice de hashes de 64 bits para busca por distância de Hamming (multi-index hashing)
+
+    O hash é dividido em 4 faixas de 16 bits, cada uma com uma tabela própria. Se dois
+    hashes estão a até `r` bits de distância, em alguma faixa eles diferem em no máximo
+    r // 4 bits; a busca consulta, em cada tabela, só as chaves a essa distância da faixa
+    da consulta e compara apenas os itens encontrados, sem percorrer o índice.
+    """
+
+    BANDS = 4
+    BAND_BITS = 16
+
+    def __init__(self, max_distance: int = 6):
+        if not 0 <= max_distance < 64:
+            raise ValueError("max_distance deve estar entre 0 e 63")
+        self.max_distance = max_distance
+        self._tables: List[Dict[int, List[Tuple[int, T]]]] = [{} for _ in range(self.BANDS)]
+        # Máscaras de até max_distance // 4 bits, para variar a chave de cada faixa
+        flips = [0]
+        for _ in range(max_distance // self.BANDS):
+            flips = sorted({flip | (1 << bit) for flip in flips for bit in range(self.BAND_BITS)} | set(flips))
+        self._flips = flips
+        self.size = 0
+
+    def _keys(self, value: int) -> List[int]:
+        mask = (1 << self.BAND_BITS) - 1
+        return [(value >> (band * self.BAND_BITS)) & mask for band in range(self.BANDS)]
+
+    def add(self, value: int, item: T):
+        entry = (value, item)
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append(entry)
+        self.size += 1
+
+    def search(self, value: int, radius: Optional[int] = None) -> List[Tuple[int, T]]:
+        """Itens com hash a no máximo `radius` bits de `value`, com a distância"""
+        radius = self.max_distance if radius is None else min(radius, self.max_distance)
+        flips = self._flips if radius >= self.BANDS else [0]
+        found = []
+        seen = set()
+        for table, key in zip(self._tables, self._keys(value)):
+            for flip in flips:
+                for entry in table.get(key ^ flip, ()):
+                    if id(entry) in seen:
+                        continue
+                    seen.add(id(entry))
+                    distance = (value ^ entry[0]).bit_count()
+                    if distance <= radius:
+                        found.append((distance, entry[1]))
+        return found
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,218 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Union
+
+from albums import MediaGroup
+from cache import MediaCache
+from metrics import metrics
+from perceptual import PerceptualHash
+from pacing import PostingRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Marca o fim da fila de mídias prontas
+_FIM = object()
+
+
+@dataclass
+class PreparedMedia:
+    """Mídia validada e preparada, pronta para upload"""
+    source: Path
+    path: Path
+    kind: str  # 'photo' ou 'video'
+    temporary: bool = False
+    digest: Optional[str] = None  # hash do conteúdo da origem
+    action: Optional[str] = None  # preparação aplicada (resize, passthrough, remux, transcode)
+    phash: Optional[PerceptualHash] = None  # para reconhecer cópias quase idênticas
+    cache: Optional[MediaCache] = None  # `path` fica fixado neste cache até o upload
+
+    @property
+    def pacing_kind(self) -> str:
+        return self.kind
+
+
+@dataclass
+class PreparedAlbum:
+    """Mídias de um grupo, preparadas, publicadas juntas como um carrossel"""
+    key: str
+    items: List[PreparedMedia]
+    kind: str = 'album'
+
+    @property
+    def source(self) -> str:
+        return self.key
+
+    @property
+    def pacing_kind(self) -> str:
+        # O intervalo após o carrossel é o do tipo mais pesado entre os itens
+        return 'video' if any(item.kind == 'video' for item in self.items) else 'photo'
+
+
+class PostingPipeline:
+    """Pipeline produtor/consumidor que prepara as próximas mídias enquanto a atual é enviada
+
+    Os workers do executor redimensionam/convertem até `prefetch` arquivos à frente;
+    o consumidor (thread chamadora) faz os uploads respeitando o `limiter`. Uploads
+    recusados por excesso de requisições voltam a ser tentados após o backoff.
+    Os itens de um `MediaGroup` são preparados em paralelo e publicados em um único
+    upload (`PreparedAlbum`).
+    Sinalizar `stop` encerra o consumo sem esperar o fim dos arquivos.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        prepare: Callable[[Path], Optional[PreparedMedia]],
+        upload: Callable[[Union[PreparedMedia, PreparedAlbum]], bool],
+        limiter: Optional[PostingRateLimiter] = None,
+        prefetch: int = 4,
+        throttle_retries: int = 3,
+        stop: Optional[threading.Event] = None,
+    ):
+        if prefetch < 1:
+            raise ValueError("prefetch deve ser maior que 0")
+        self.executor = executor
+        self.prepare = prepare
+        self.upload = upload
+        self.limiter = limiter
+        self.prefetch = prefetch
+        self.throttle_retries = throttle_retries
+        self.stop = stop
+        self.posted = 0
+        self._ready: Optional[queue.Queue] = None
+        self.logger = logging.getLogger(__name__)
+
+    def _feed(self, files: Iterable[Path], ready: queue.Queue, stop: threading.Event):
+        """Submete a preparação dos arquivos ao executor, bloqueando quando a fila está cheia"""
+        try:
+            for file in files:
+                if stop.is_set():
+                    return
+                future = self._submit(file)
+                while not stop.is_set():
+                    try:
+                        ready.put((file, future), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                else:
+                    self._cancel(future)
+                    return
+        except Exception as e:
+            self.logger.error(f"Erro ao listar arquivos para o pipeline: {e}")
+        finally:
+            while not stop.is_set():
+                try:
+                    ready.put(_FIM, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def _submit(self, item) -> Union[Future, List[Future]]:
+        if isinstance(item, MediaGroup):
+            return [self.executor.submit(self.prepare, entry) for entry in item.entries]
+        return self.executor.submit(self.prepare, item)
+
+    @staticmethod
+    def _cancel(future: Union[Future, List[Future]]):
+        for f in future if isinstance(future, list) else [future]:
+            f.cancel()
+
+    def _result(self, item, future: Union[Future, List[Future]]):
+        """Mídia preparada do item; de um grupo, só os itens preparados com sucesso"""
+        if not isinstance(item, MediaGroup):
+            try:
+                return future.result()
+            except Exception as e:
+                print(f"Erro ao preparar {item}: {str(e)}")
+                return None
+        items = []
+        for entry, f in zip(item.entries, future):
+            try:
+                prepared = f.result()
+            except Exception as e:
+                print(f"Erro ao preparar {entry.path}: {str(e)}")
+                continue
+            if prepared is not None:
+                items.append(prepared)
+        if not items:
+            return None
+        if len(items) == 1:
+            return items[0]
+        return PreparedAlbum(item.key, items)
+
+    def _publish(self, prepared: Union[PreparedMedia, PreparedAlbum]):
+        """Envia a mídia aguardando o limiter; a preparação continua nos workers"""
+        for _ in range(self.throttle_retries + 1):
+            if self.limiter is not None:
+                with metrics.span('pace_wait', file=str(prepared.source)):
+                    self.limiter.wait(self.stop)
+            if self._stopped():
+                return
+            try:
+                uploaded = self.upload(prepared)
+            except Exception as e:
+                if self.limiter is None or not self.limiter.is_throttle(e):
+                    raise
+                self.limiter.record_throttle(e)
+                metrics.inc('throttled_total')
+                continue
+            if uploaded:
+                self.posted += 1
+                metrics.inc('posts_total', kind=prepared.kind)
+                if self.limiter is not None:
+                    self.limiter.record_post(prepared.pacing_kind)
+            return
+        print(f"Desistindo de {prepared.source} após {self.throttle_retries + 1} tentativas limitadas")
+
+    @property
+    def depth(self) -> int:
+        """Mídias preparadas (ou em preparação) aguardando upload"""
+        return self._ready.qsize() if self._ready is not None else 0
+
+    def _stopped(self) -> bool:
+        return self.stop is not None and self.stop.is_set()
+
+    def _next(self, ready: queue.Queue):
+        """Próximo item da fila; _FIM também quando `stop` for sinalizado"""
+        while not self._stopped():
+            try:
+                return ready.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _FIM
+
+    def run(self, files: Iterable[Path]) -> int:
+        """Processa os arquivos e retorna o número de posts realizados"""
+        ready: queue.Queue = queue.Queue(maxsize=self.prefetch)
+        self._ready = ready
+        stop = threading.Event()
+        feeder = threading.Thread(target=self._feed, args=(files, ready, stop), daemon=True)
+        feeder.start()
+
+        try:
+            while True:
+                item = self._next(ready)
+                if item is _FIM:
+                    break
+                prepared = self._result(*item)
+                if prepared is None:
+                    continue
+                self._publish(prepared)
+        finally:
+            stop.set()
+            # Cancela preparações pendentes para não segurar o executor
+            while True:
+                try:
+                    item = ready.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _FIM:
+                    self._cancel(item[1])
+            feeder.join(timeout=1)
+
+        return self.posted
@@ -0,0 +1,326 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+# Limite de leitura do atom moov; arquivos com moov maior vão para o ffprobe
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+# Containers que o parser de atoms entende
+ISO_EXTENSIONS = ('.mp4', '.mov', '.m4v')
+
+_VIDEO_CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264',
+    b'hvc1': 'hevc', b'hev1': 'hevc',
+    b'mp4v': 'mpeg4', b'av01': 'av1', b'vp09': 'vp9',
+}
+_AUDIO_CODECS = {b'.mp3': 'mp3', b'ac-3': 'ac3', b'ec-3': 'eac3', b'Opus': 'opus', b'alac': 'alac'}
+# AVCProfileIndication do avcC (ISO/IEC 14496-10, anexo A)
+_H264_PROFILES = {
+    66: 'Baseline', 77: 'Main', 88: 'Extended', 100: 'High',
+    110: 'High 10', 122: 'High 4:2:2', 244: 'High 4:4:4 Predictive',
+}
+# objectTypeIndication do esds (ISO/IEC 14496-1)
+# Bytes que a SoundDescription do QuickTime acrescenta à AudioSampleEntry, por versão
+_SOUND_DESCRIPTION_EXTRA = {0: 0, 1: 16, 2: 36}
+_AUDIO_OBJECT_TYPES = {0x40: 'aac', 0x66: 'aac', 0x67: 'aac', 0x68: 'aac', 0x69: 'mp3', 0x6B: 'mp3'}
+
+
+@dataclass
+class VideoInfo:
+    """Metadados de um vídeo obtidos sem decodificar quadros"""
+    duration: float  # segundos
+    width: int
+    height: int
+    video_codec: Optional[str]
+    audio_codec: Optional[str]
+    bitrate: int  # bits/s do arquivo inteiro
+    container: str  # 'mp4', 'mov', ...
+    faststart: bool  # moov antes do mdat
+    source: str  # 'atoms', 'ffprobe' ou 'moviepy'
+    video_profile: Optional[str] = None  # perfil H.264, quando conhecido
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+
+class ProbeError(Exception):
+    """Arquivo não pôde ser interpretado pelo parser de atoms"""
+
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Percorre os atoms de um buffer, gerando (tipo, início do conteúdo, fim)"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ProbeError(f"Atom {kind!r} inválido")
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _find(data: bytes, start: int, end: int, kind: bytes) -> Optional[Tuple[int, int]]:
+    for box, box_start, box_end in _boxes(data, start, end):
+        if box == kind:
+            return box_start, box_end
+    return None
+
+
+def _top_level(f: BinaryIO, file_size: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Percorre os atoms de nível superior lendo apenas os cabeçalhos"""
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, kind = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            raise ProbeError(f"Atom {kind!r} inválido")
+        yield kind, offset + header_size, min(offset + size, file_size)
+        offset += size
+
+
+def _descriptor(data: bytes, offset: int) -> Tuple[int, int, int]:
+    """Lê (tag, início, tamanho) de um descritor MPEG-4"""
+    tag = data[offset]
+    offset += 1
+    length = 0
+    for _ in range(4):
+        byte = data[offset]
+        offset += 1
+        length = (length << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, offset, length
+
+
+def _audio_codec(data: bytes, entry_start: int, entry_end: int) -> str:
+    """Identifica o codec de uma entrada mp4a pelo objectTypeIndication do esds"""
+    # SampleEntry (8) + AudioSampleEntry (20) precedem os atoms filhos; no QuickTime a
+    # versão da SoundDescription (v1/v2) acrescenta campos antes deles
+    version = struct.unpack_from('>H', data, entry_start + 8)[0]
+    extra = _SOUND_DESCRIPTION_EXTRA.get(version)
+    if extra is None:
+        return 'mp4a'
+    children = entry_start + 28 + extra
+    esds = _find(data, children, entry_end, b'esds')
+    if esds is None:
+        # No QuickTime o esds pode vir dentro de um atom 'wave'
+        wave = _find(data, children, entry_end, b'wave')
+        if wave is not None:
+            esds = _find(data, wave[0], wave[1], b'esds')
+    if esds is None:
+        return 'aac'
+    offset = esds[0] + 4  # versão/flags
+    tag, offset, _ = _descriptor(data, offset)
+    if tag == 0x03:
+        flags = data[offset + 2]
+        offset += 3
+        if flags & 0x80:
+            offset += 2
+        if flags & 0x40:
+            offset += 1 + data[offset]
+        if flags & 0x20:
+            offset += 2
+        tag, offset, _ = _descriptor(data, offset)
+    if tag == 0x04:
+        return _AUDIO_OBJECT_TYPES.get(data[offset], 'mp4a')
+    return 'mp4a'
+
+
+def _parse_moov(moov: bytes) -> dict:
+    info = {
+        'duration': 0.0, 'width': 0, 'height': 0,
+        'video_codec': None, 'video_profile': None, 'audio_codec': None,
+    }
+
+    mvhd = _find(moov, 0, len(moov), b'mvhd')
+    if mvhd is None:
+        raise ProbeError("Atom mvhd ausente")
+    start = mvhd[0]
+    if moov[start] == 1:
+        timescale, duration = struct.unpack_from('>IQ', moov, start + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', moov, start + 12)
+    if timescale:
+        info['duration'] = duration / timescale
+
+    for box, trak_start, trak_end in _boxes(moov):
+        if box != b'trak':
+            continue
+        mdia = _find(moov, trak_start, trak_end, b'mdia')
+        if mdia is None:
+            continue
+        hdlr = _find(moov, mdia[0], mdia[1], b'hdlr')
+        if hdlr is None:
+            continue
+        handler = moov[hdlr[0] + 8:hdlr[0] + 12]
+
+        stsd = None
+        minf = _find(moov, mdia[0], mdia[1], b'minf')
+        if minf is not None:
+            stbl = _find(moov, minf[0], minf[1], b'stbl')
+            if stbl is not None:
+                stsd = _find(moov, stbl[0], stbl[1], b'stsd')
+        if stsd is None:
+            continue
+        # Primeira entrada da descrição de amostras: tamanho (4) + formato (4)
+        entry_start = stsd[0] + 8
+        entry_size, fourcc = struct.unpack_from('>I4s', moov, entry_start)
+        entry_end = min(entry_start + entry_size, stsd[1])
+
+        if handler == b'vide' and info['video_codec'] is None:
+            info['video_codec'] = _VIDEO_CODECS.get(fourcc, fourcc.decode('latin-1').strip())
+            if info['video_codec'] == 'h264':
+                # SampleEntry (8) + VisualSampleEntry (70) precedem os atoms filhos
+                avcc = _find(moov, entry_start + 8 + 78, entry_end, b'avcC')
+                if avcc is not None:
+                    profile = moov[avcc[0] + 1]
+                    info['video_profile'] = _H264_PROFILES.get(profile, str(profile))
+            tkhd = _find(moov, trak_start, trak_end, b'tkhd')
+            if tkhd is not None:
+                base = tkhd[0] + (52 if moov[tkhd[0]] == 1 else 40)
+                a, b = struct.unpack_from('>ii', moov, base)
+                width, height = struct.unpack_from('>II', moov, base + 36)
+                width, height = width >> 16, height >> 16
+                # Matriz de rotação de 90/270 graus troca largura e altura
+                if a == 0 and b != 0:
+                    width, height = height, width
+                info['width'], info['height'] = width, height
+        elif handler == b'soun' and info['audio_codec'] is None:
+            if fourcc == b'mp4a':
+                info['audio_codec'] = _audio_codec(moov, entry_start + 8, entry_end)
+            else:
+                info['audio_codec'] = _AUDIO_CODECS.get(fourcc, fourcc.decode('latin-1').strip())
+    return info
+
+
+def probe_atoms(path: PathLike) -> VideoInfo:
+    """Lê os metadados diretamente dos atoms de um MP4/MOV"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        brand = None
+        moov_offset = mdat_offset = None
+        moov = None
+        for kind, start, end in _top_level(f, file_size):
+            if kind == b'ftyp':
+                f.seek(start)
+                brand = f.read(4)
+            elif kind == b'mdat' and mdat_offset is None:
+                mdat_offset = start
+            elif kind == b'moov':
+                if end - start > MAX_MOOV_SIZE:
+                    raise ProbeError("Atom moov grande demais")
+                moov_offset = start
+                f.seek(start)
+                moov = f.read(end - start)
+        if moov is None:
+            raise ProbeError("Atom moov ausente")
+
+    info = _parse_moov(moov)
+    return VideoInfo(
+        duration=info['duration'],
+        width=info['width'],
+        height=info['height'],
+        video_codec=info['video_codec'],
+        audio_codec=info['audio_codec'],
+        bitrate=int(file_size * 8 / info['duration']) if info['duration'] else 0,
+        container='mov' if brand == b'qt  ' else 'mp4',
+        faststart=mdat_offset is None or moov_offset < mdat_offset,
+        source='atoms',
+        video_profile=info['video_profile'],
+    )
+
+
+def probe_ffprobe(path: PathLike) -> VideoInfo:
+    """Obtém os metadados com o ffprobe"""
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        raise ProbeError("ffprobe não encontrado")
+    result = subprocess.run(
+        [ffprobe, '-v', 'error', '-show_format', '-show_streams', '-of', 'json', str(path)],
+        capture_output=True, check=True, timeout=30
+    )
+    data = json.loads(result.stdout)
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    fmt = data.get('format', {})
+    width, height = int(video.get('width', 0)), int(video.get('height', 0))
+    rotation = abs(int(video.get('tags', {}).get('rotate', 0)))
+    if rotation in (90, 270):
+        width, height = height, width
+    names = fmt.get('format_name', '').split(',')
+    return VideoInfo(
+        duration=float(fmt.get('duration', 0.0)),
+        width=width,
+        height=height,
+        video_codec=video.get('codec_name'),
+        audio_codec=audio.get('codec_name') if audio else None,
+        bitrate=int(fmt.get('bit_rate', 0)),
+        container='mov' if Path(path).suffix.lower() == '.mov' else names[0],
+        faststart=False,  # o ffprobe não informa a posição do moov
+        source='ffprobe',
+        video_profile=video.get('profile'),
+    )
+
+
+def probe_moviepy(path: PathLike) -> VideoInfo:
+    """Último recurso: abre o vídeo com o moviepy"""
+    # O leitor do ffmpeg direto: moviepy.editor carrega o pacote inteiro (e o pygame, se houver)
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(str(path))
+    if not infos.get('video_found'):
+        raise ProbeError("Nenhuma trilha de vídeo encontrada")
+    duration = float(infos.get('duration') or 0)
+    width, height = infos['video_size']
+    return VideoInfo(
+        duration=duration,
+        width=width,
+        height=height,
+        video_codec=None,
+        audio_codec='unknown' if infos.get('audio_found') else None,
+        bitrate=int(os.path.getsize(path) * 8 / duration) if duration else 0,
+        container=Path(path).suffix.lower().lstrip('.'),
+        faststart=False,
+        source='moviepy',
+    )
+
+
+def probe_video(path: PathLike) -> Optional[VideoInfo]:
+    """Metadados do vídeo: atoms MP4/MOV, depois ffprobe e por fim moviepy
+
+    Retorna None se o arquivo não puder ser lido por nenhum dos métodos.
+    """
+    probes = [probe_ffprobe, probe_moviepy]
+    if Path(path).suffix.lower() in ISO_EXTENSIONS:
+        probes.insert(0, probe_atoms)
+    for probe in probes:
+        try:
+            return probe(path)
+        except Exception as e:
+            logger.debug(f"{probe.__name__} falhou para {path}: {e}")
+    return None
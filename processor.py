@@ -1,52 +1,197 @@
 import asyncio
+import heapq
+import itertools
 import logging
+import time
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, Dict, Iterable, List, Optional
 from exceptions import MediaProcessingException
+from cache import MediaCache
+from scanner import MediaScanner, ScanEntry
+from scheduler import PrepScheduler, default_budget
+import media
+from probe import probe_video
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class ProcessResult:
+    """Resultado do processamento de um arquivo: a mídia preparada ou o erro"""
+    source: Path
+    output: Optional[Path] = None
+    error: Optional[MediaProcessingException] = None
+    seconds: float = 0.0
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
 class MediaProcessor:
     def __init__(self, config):
         self.config = config
         self.executor = ThreadPoolExecutor(max_workers=config.max_workers)
+        self.cache = MediaCache(config.cache_dir, config.cache_max_bytes)
+        self.scanner = MediaScanner(config.scan_index_path, media.classify)
+        self.scheduler = PrepScheduler(
+            default_budget(config.max_workers),
+            config.video_threads or None,
+            config.image_memory_limit or None
+        )
         self.logger = logging.getLogger(__name__)
     
-    def _validate_file(self, file: Path) -> bool:
+    def shutdown(self, wait: bool = True):
+        """Encerra o executor e o pool de processos"""
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        self.scheduler.shutdown(wait=wait)
+    
+    def _validate_file(self, file: Path, size: Optional[int] = None) -> bool:
         """Valida se o arquivo é uma mídia permitida"""
-        if not file.exists():
+        if size is None and not file.exists():
             return False
         
         suffix = file.suffix.lower()
         if suffix in self.config.allowed_image_formats:
             return True
         if suffix in self.config.allowed_video_formats:
-            size = file.stat().st_size
-            if size > self.config.max_video_size:
+            if size is None:
+                size = file.stat().st_size
+            if size > self.config.max_video_size and not self.config.video_fit_size:
                 self.logger.warning(f"Vídeo muito grande: {file}")
                 return False
+            info = probe_video(file)
+            if info is None:
+                self.logger.warning(f"Vídeo ilegível: {file}")
+                return False
+            if info.duration > self.config.max_video_duration and not self.config.video_trim:
+                self.logger.warning(f"Vídeo muito longo ({info.duration:.1f}s): {file}")
+                return False
             return True
         return False
     
-    async def process_directory(self, directory: Path) -> List[Path]:
-        """Processa arquivos de mídia em paralelo"""
-        self.logger.info(f"Processando diretório: {directory}")
-        files = [f for f in directory.glob("**/*.*") if self._validate_file(f)]
+    async def iter_directory(
+        self,
+        directory: Path,
+        concurrency: Optional[int] = None,
+        largest_first: bool = False,
+        lookahead: Optional[int] = None
+    ) -> AsyncIterator[ProcessResult]:
+        """Processa as mídias do diretório, gerando cada resultado assim que fica pronto
         
-        if not files:
-            self.logger.warning("Nenhum arquivo válido encontrado")
-            return []
+        No máximo `concurrency` arquivos (padrão: 2x max_workers) ficam em andamento; o
+        próximo só é retirado da varredura quando um termina, então a fila do executor e a
+        memória não crescem com o tamanho da pasta. Falhas viram resultados com `error`,
+        sem interromper os demais. Encerrar a iteração cancela o que ainda não começou;
+        arquivos já em processamento terminam no executor, mas são descartados.
+        Com `largest_first`, os maiores saem primeiro entre os `lookahead` arquivos já
+        lidos da varredura (padrão: 4x concurrency), sem esperar a listagem inteira.
+        A varredura roda fora do event loop, em lotes, via `asyncio.to_thread`.
+        """
+        limit = concurrency or 2 * self.config.max_workers
+        if limit < 1:
+            raise ValueError("concurrency deve ser maior que 0")
+        window = (lookahead or 4 * limit) if largest_first else 0
+        allowed = set(self.config.allowed_image_formats) | set(self.config.allowed_video_formats)
+        entries = (
+            entry for entry in self.scanner.scan(directory, recursive=True)
+            if entry.path.suffix.lower() in allowed
+        )
         
-        tasks = [asyncio.create_task(self.process_file(f)) for f in files]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Lidos e ainda não iniciados: (ordem, desempate, entrada), em heap
+        buffer = []
+        order = itertools.count()
+        exhausted = False
+        pending = set()
+        try:
+            while True:
+                wanted = limit - len(pending) + window - len(buffer)
+                if wanted > 0 and not exhausted:
+                    batch = await asyncio.to_thread(lambda: list(itertools.islice(entries, wanted)))
+                    exhausted = len(batch) < wanted
+                    for entry in batch:
+                        key = -entry.size if largest_first else 0
+                        heapq.heappush(buffer, (key, next(order), entry))
+                while buffer and len(pending) < limit:
+                    entry = heapq.heappop(buffer)[2]
+                    pending.add(asyncio.create_task(self._process_entry(entry)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        yield result
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            try:
+                entries.close()
+            except ValueError:
+                # Cancelado no meio de um lote: a thread termina o lote e a varredura é abandonada
+                pass
+    
+    async def process_directory(self, directory: Path) -> List[Path]:
+        """Processa arquivos de mídia em paralelo
+        
+        Com falhas, a exceção traz em `details` os arquivos processados ('processed') e
+        os erros de cada arquivo ('errors').
+        """
+        self.logger.info(f"Processando diretório: {directory}")
+        processed = []
+        errors = []
+        # Os maiores primeiro, para que os trabalhos pesados não fiquem para o fim
+        async for result in self.iter_directory(directory, largest_first=True):
+            if result.ok:
+                processed.append(result.output)
+            else:
+                errors.append(result.error)
         
-        errors = [r for r in results if isinstance(r, Exception)]
         if errors:
             self.logger.error(f"Erros no processamento: {errors}")
-            raise MediaProcessingException(f"Erros no processamento", str(directory), {"errors": errors})
+            raise MediaProcessingException(
+                f"Erros no processamento", str(directory), {"errors": errors, "processed": processed}
+            )
+        if not processed:
+            self.logger.warning("Nenhum arquivo válido encontrado")
+        return processed
+    
+    async def _process_entry(self, entry: ScanEntry) -> Optional[ProcessResult]:
+        """Valida e processa um arquivo da varredura; None se não for uma mídia aceita"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            output = await loop.run_in_executor(self.executor, self._process_entry_sync, entry)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = MediaProcessingException(f"Erro ao processar {entry.path}: {e}", str(entry.path))
+            return ProcessResult(entry.path, error=error, seconds=time.perf_counter() - start)
+        if output is None:
+            return None
+        return ProcessResult(entry.path, output=output, seconds=time.perf_counter() - start)
+    
+    def _process_entry_sync(self, entry: ScanEntry) -> Optional[Path]:
+        if not self._validate_file(entry.path, entry.size):
+            return None
+        return self._process_file_sync(entry.path)
+    
+    async def prepare_variants(self, file: Path, names: Optional[Iterable[str]] = None) -> Dict[str, Path]:
+        """Renders da imagem nas proporções do Instagram (padrão: todas de media.ASPECT_VARIANTS)
         
-        return [r for r in results if isinstance(r, Path)]
+        A imagem é decodificada uma única vez para todas as variantes que faltam no cache;
+        as já geradas antes são reaproveitadas.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self.executor,
+                lambda: media.prepare_variants(file, self.cache, names, scheduler=self.scheduler)
+            )
+        except Exception as e:
+            raise MediaProcessingException(f"Erro ao gerar variantes de {file}: {e}", str(file))
     
     async def process_file(self, file: Path) -> Path:
         """Processa um arquivo individual"""
@@ -63,5 +208,18 @@ class MediaProcessor:
             raise MediaProcessingException(f"Erro ao processar {file}: {e}")
     
     def _process_file_sync(self, file: Path) -> Path:
-        # Implementar lógica de processamento específica aqui
+        """Prepara a mídia para upload, reaproveitando o cache"""
+        suffix = file.suffix.lower()
+        if suffix in self.config.allowed_image_formats:
+            return media.prepare_image(
+                file, self.cache, scheduler=self.scheduler, max_bytes=self.config.image_max_bytes or None
+            )
+        if suffix in self.config.allowed_video_formats:
+            path, action = media.prepare_video(
+                file, self.cache,
+                settings=media.VideoSettings.from_config(self.config),
+                scheduler=self.scheduler
+            )
+            self.logger.info(f"Vídeo {file.name}: {action}")
+            return path
         return file 
\ No newline at end of file
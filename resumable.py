@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Union
+
+import media
+from exceptions import ResumableUploadException
+from probe import probe_video
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Espera entre as tentativas de configurar o vídeo enquanto o Instagram o transcodifica
+CONFIGURE_ATTEMPTS = 50
+CONFIGURE_DELAY = 3
+TRANSCODE_DELAY = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    account TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    upload_id TEXT NOT NULL,
+    upload_name TEXT NOT NULL,
+    waterfall_id TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    thumbnail TEXT NOT NULL,
+    PRIMARY KEY (account, digest)
+);
+"""
+
+
+@dataclass
+class UploadState:
+    """Progresso de um upload de vídeo, gravado após cada bloco enviado"""
+    account: str
+    digest: str  # hash do conteúdo da origem
+    path: str  # arquivo enviado (já preparado)
+    size: int
+    upload_id: str
+    upload_name: str
+    waterfall_id: str
+    offset: int  # bytes confirmados pelo servidor
+    width: int
+    height: int
+    duration: float
+    thumbnail: str
+
+    @property
+    def complete(self) -> bool:
+        return self.offset >= self.size
+
+
+class UploadStateStore:
+    """Estado dos uploads em andamento, em SQLite, para retomar após falhas ou reinícios"""
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, account: str, digest: str) -> Optional[UploadState]:
+        names = [f.name for f in fields(UploadState)]
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(names)} FROM uploads WHERE account = ? AND digest = ?",
+                (account, digest)
+            ).fetchone()
+        return UploadState(*row) if row is not None else None
+
+    def save(self, state: UploadState):
+        values = asdict(state)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO uploads ({', '.join(values)}) "
+                f"VALUES ({', '.join('?' for _ in values)})",
+                tuple(values.values())
+            )
+
+    def delete(self, account: str, digest: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM uploads WHERE account = ? AND digest = ?", (account, digest))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResumableVideoUploader:
+    """Upload de vídeo em blocos pelo protocolo rupload, retomável a partir do último byte confirmado
+
+    Um GET no endereço do upload informa quantos bytes o servidor já recebeu; cada POST
+    envia o bloco seguinte com o cabeçalho `Offset`. O estado fica em `store`, então uma
+    queda de rede, um Ctrl-C ou um reinício continuam o mesmo upload em vez de recomeçar
+    do zero. Com o arquivo inteiro enviado, a publicação é feita com `video_configure`,
+    repetida enquanto o Instagram transcodifica (interrompida assim que `stop` for sinalizado).
+    A capa é extraída em `thumbnail_dir` (nunca na pasta de mídias, onde seria postada
+    como foto) e removida quando o upload termina ou o estado é descartado.
+    """
+
+    def __init__(
+        self,
+        client,
+        store: UploadStateStore,
+        base_url: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_retries: int = 3,
+        retry_delay: float = 5,
+        session: Optional['requests.Session'] = None,
+        thumbnail_dir: Optional[PathLike] = None,
+        stop: Optional[threading.Event] = None,
+    ):
+        if chunk_size < 1:
+            raise ValueError("chunk_size deve ser maior que 0")
+        self.client = client
+        self.store = store
+        if base_url is None:
+            from instagrapi import config as instagrapi_config
+            base_url = f"https://{instagrapi_config.API_DOMAIN}"
+        self.base_url = base_url.rstrip('/')
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._session = session
+        self.thumbnail_dir = Path(thumbnail_dir or Path(tempfile.gettempdir()) / 'instaposter-thumbnails')
+        self.stop = stop or threading.Event()
+        self.resumed = 0
+
+    @property
+    def session(self) -> 'requests.Session':
+        """Sessão HTTP autenticada do instagrapi, a menos que outra seja informada"""
+        return self._session or self.client.private
+
+    @property
+    def account(self) -> str:
+        return str(self.client.user_id or self.client.username)
+
+    def _url(self, state: UploadState) -> str:
+        return f"{self.base_url}/rupload_igvideo/{state.upload_name}"
+
+    def _headers(self, state: UploadState) -> dict:
+        params = {
+            "retry_context": '{"num_step_auto_retry":0,"num_reupload":0,"num_step_manual_retry":0}',
+            "media_type": "2",
+            "xsharing_user_ids": json.dumps([self.client.user_id]),
+            "upload_id": state.upload_id,
+            "upload_media_duration_ms": str(int(state.duration * 1000)),
+            "upload_media_width": str(state.width),
+            "upload_media_height": str(state.height),
+        }
+        return {
+            "Accept-Encoding": "gzip, deflate",
+            "X-Instagram-Rupload-Params": json.dumps(params),
+            "X_FB_VIDEO_WATERFALL_ID": state.waterfall_id,
+        }
+
+    def _new_state(self, path: Path, digest: str) -> UploadState:
+        info = probe_video(path)
+        if info is None:
+            raise ResumableUploadException("Não foi possível ler os metadados do vídeo", str(path))
+        thumbnail = self.thumbnail_dir / f"{self.account}-{digest}.jpg"
+        upload_id = str(int(time.time() * 1000))
+        return UploadState(
+            account=self.account,
+            digest=digest,
+            path=str(path),
+            size=os.path.getsize(path),
+            upload_id=upload_id,
+            upload_name=f"{upload_id}_0_{random.randint(1000000000, 9999999999)}",
+            waterfall_id=str(uuid.uuid4()),
+            offset=0,
+            width=info.width,
+            height=info.height,
+            duration=info.duration,
+            thumbnail=str(thumbnail),
+        )
+
+    def _server_offset(self, state: UploadState) -> Optional[int]:
+        """Bytes já recebidos pelo servidor; None se ele não conhece mais o upload"""
+        response = self.session.get(self._url(state), headers=self._headers(state))
+        if response.status_code != 200:
+            return None
+        try:
+            return int(response.json().get('offset', 0))
+        except ValueError:
+            return 0
+
+    def _send_chunk(self, state: UploadState, f) -> int:
+        f.seek(state.offset)
+        chunk = f.read(self.chunk_size)
+        headers = {
+            "Offset": str(state.offset),
+            "X-Entity-Name": state.upload_name,
+            "X-Entity-Length": str(state.size),
+            "Content-Type": "application/octet-stream",
+            "Content-Length": str(len(chunk)),
+            "X-Entity-Type": "video/mp4",
+            **self._headers(state),
+        }
+        response = self.session.post(self._url(state), data=chunk, headers=headers)
+        if response.status_code != 200:
+            raise ResumableUploadException(
+                f"Servidor recusou o bloco em {state.offset}: HTTP {response.status_code}",
+                state.path, {"status": response.status_code, "body": response.text[:500]}
+            )
+        return state.offset + len(chunk)
+
+    def _transfer(self, state: UploadState):
+        """Envia os blocos restantes, retomando pelo offset do servidor após cada falha"""
+        import requests
+
+        failures = 0
+        with open(state.path, 'rb') as f:
+            while not state.complete:
+                try:
+                    state.offset = self._send_chunk(state, f)
+                    self.store.save(state)
+                    failures = 0
+                    continue
+                except (requests.RequestException, ResumableUploadException) as e:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise
+                    logger.warning(f"Falha no upload de {state.path} em {state.offset}/{state.size} "
+                                   f"bytes ({e}); nova tentativa em {self.retry_delay}s")
+                    time.sleep(self.retry_delay)
+                try:
+                    offset = self._server_offset(state)
+                except requests.RequestException:
+                    continue
+                if offset is None:
+                    raise ResumableUploadException("Upload desconhecido pelo servidor", state.path)
+                state.offset = offset
+                self.store.save(state)
+
+    def _thumbnail(self, state: UploadState) -> Path:
+        """Capa do vídeo, extraída de novo se foi apagada desde o início do upload"""
+        thumbnail = Path(state.thumbnail)
+        if not thumbnail.exists():
+            thumbnail.parent.mkdir(parents=True, exist_ok=True)
+            media.extract_thumbnail(state.path, thumbnail, at=min(1.0, state.duration / 2))
+        return thumbnail
+
+    def _discard(self, state: UploadState):
+        """Remove o estado do upload e a capa extraída para ele"""
+        self.store.delete(state.account, state.digest)
+        try:
+            os.remove(state.thumbnail)
+        except OSError:
+            pass
+
+    def _configure(self, state: UploadState, caption: str) -> dict:
+        """Publica o vídeo enviado, aguardando o fim da transcodificação do Instagram"""
+        thumbnail = self._thumbnail(state)
+        for _ in range(CONFIGURE_ATTEMPTS):
+            if self.stop.wait(CONFIGURE_DELAY):
+                break
+            try:
+                configured = self.client.video_configure(
+                    state.upload_id, state.width, state.height, state.duration,
+                    thumbnail, caption
+                )
+            except Exception as e:
+                if "Transcode not finished yet" in str(e):
+                    if self.stop.wait(TRANSCODE_DELAY):
+                        break
+                    continue
+                raise
+            if configured:
+                return configured
+        if self.stop.is_set():
+            # O estado é mantido: a próxima execução só precisa configurar o vídeo
+            raise ResumableUploadException("Configuração do vídeo interrompida", state.path)
+        raise ResumableUploadException("Instagram não concluiu a configuração do vídeo", state.path)
+
+    def upload(self, path: PathLike, digest: str, caption: str) -> dict:
+        """Envia e publica o vídeo, retomando um upload anterior do mesmo conteúdo"""
+        path = Path(path)
+        state = self.store.get(self.account, digest)
+        if state is not None and (state.path != str(path) or state.size != os.path.getsize(path)):
+            self._discard(state)
+            state = None
+        if state is not None:
+            offset = self._server_offset(state)
+            if offset is None:
+                logger.info(f"Upload anterior de {path.name} expirou; recomeçando")
+                self._discard(state)
+                state = None
+            else:
+                state.offset = offset
+
+        if state is None:
+            state = self._new_state(path, digest)
+            # O GET inicial registra o upload no servidor
+            offset = self._server_offset(state)
+            if offset is None:
+                raise ResumableUploadException("Servidor recusou o início do upload", str(path))
+            state.offset = offset
+            self.store.save(state)
+        else:
+            self.resumed += 1
+            print(f"Retomando upload de {path.name} a partir de {state.offset / (1024 * 1024):.1f} MB")
+
+        self._transfer(state)
+        configured = self._configure(state, caption)
+        self._discard(state)
+        return configured
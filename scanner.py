@@ -0,0 +1,189 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    digest TEXT,
+    skipped TEXT
+);
+"""
+
+
+@dataclass
+class ScanEntry:
+    """Arquivo encontrado na varredura, com a classificação do índice"""
+    path: Path
+    size: int
+    mtime_ns: int
+    inode: int
+    kind: str  # 'image', 'video' ou 'other'
+    digest: Optional[str] = None
+    changed: bool = True
+    skipped: Optional[str] = None  # regras com que a preparação sempre pula o arquivo
+
+
+class MediaScanner:
+    """Varredura incremental de diretórios com índice persistente de (path, size, mtime, inode)
+
+    Apenas arquivos novos ou alterados são reclassificados; os demais reaproveitam a
+    classificação e o hash já conhecidos. As entradas são geradas sob demanda com
+    `os.scandir`, sem montar a lista completa do diretório.
+    """
+
+    def __init__(self, index_path: PathLike, classify: Callable[[Path], str], batch_size: int = 500):
+        self.index_path = Path(index_path)
+        self.classify = classify
+        self.batch_size = batch_size
+        self.scanned = 0
+        self.reexamined = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if 'skipped' not in columns:
+            # Índices criados antes da marcação de arquivos pulados
+            self._conn.execute("ALTER TABLE files ADD COLUMN skipped TEXT")
+
+    def _walk(self, directory: str, recursive: bool) -> Iterator[os.DirEntry]:
+        """Percorre o diretório com os.scandir, gerando apenas arquivos regulares"""
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_file(follow_symlinks=False):
+                        yield entry
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        yield from self._walk(entry.path, recursive)
+        except OSError as e:
+            logger.warning(f"Não foi possível listar {directory}: {e}")
+
+    def _lookup(self, path: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, mtime_ns, inode, kind, digest, skipped FROM files WHERE path = ?", (path,)
+            ).fetchone()
+
+    def _store(self, entry: ScanEntry):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, kind, digest, skipped) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(entry.path), entry.size, entry.mtime_ns, entry.inode, entry.kind, entry.digest,
+                 entry.skipped)
+            )
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._conn.commit()
+                self._pending = 0
+
+    def _examine_stat(self, path: str, stat: os.stat_result) -> ScanEntry:
+        row = self._lookup(path)
+        if row is not None and tuple(row[:3]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return ScanEntry(Path(path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                             row[3], row[4], changed=False, skipped=row[5])
+
+        self.reexamined += 1
+        entry = ScanEntry(Path(path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                          self.classify(Path(path)))
+        self._store(entry)
+        return entry
+
+    def examine(self, path: PathLike) -> Optional[ScanEntry]:
+        """Consulta (e atualiza, se preciso) a entrada de um único arquivo"""
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+        except OSError:
+            return None
+        return self._examine_stat(str(path), stat)
+
+    def scan(self, directory: PathLike, recursive: bool = False) -> Iterator[ScanEntry]:
+        """Gera as entradas do diretório, reexaminando apenas arquivos alterados
+
+        Cada varredura completa registra uma única etapa 'scan', com o tempo gasto aqui
+        (sem o tempo em que o consumidor segura o gerador).
+        """
+        self.scanned = 0
+        self.reexamined = 0
+        seen = set()
+        work = 0.0
+        start = time.perf_counter()
+        for dir_entry in self._walk(str(directory), recursive):
+            try:
+                stat = dir_entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            self.scanned += 1
+            seen.add(dir_entry.path)
+            entry = self._examine_stat(dir_entry.path, stat)
+            work += time.perf_counter() - start
+            yield entry
+            start = time.perf_counter()
+
+        # Varredura completa: remove do índice os arquivos que não existem mais
+        self._prune(str(directory), recursive, seen)
+        self.flush()
+        work += time.perf_counter() - start
+        metrics.record('scan', work, directory=str(directory), files=self.scanned, reexamined=self.reexamined)
+        logger.debug(f"Varredura de {directory}: {self.scanned} arquivos, {self.reexamined} reexaminados")
+
+    def _prune(self, directory: str, recursive: bool, seen: set):
+        prefix = os.path.join(directory, '')
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE path >= ? AND path < ?", (prefix, prefix + '￿')
+            ).fetchall()
+            stale = [
+                (path,) for (path,) in rows
+                if path not in seen and (recursive or os.path.dirname(path) == os.path.dirname(prefix))
+            ]
+            if stale:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", stale)
+
+    def update_digest(self, path: PathLike, digest: str):
+        """Guarda o hash do conteúdo calculado fora da varredura"""
+        self._update(path, 'digest', digest)
+
+    def mark_skipped(self, path: PathLike, rules: str):
+        """Marca o arquivo como pulado pela preparação sob `rules`; a marca cai se ele mudar"""
+        self._update(path, 'skipped', rules)
+
+    def _update(self, path: PathLike, column: str, value: str):
+        with self._lock:
+            self._conn.execute(f"UPDATE files SET {column} = ? WHERE path = ?", (value, str(path)))
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._conn.commit()
+                self._pending = 0
+
+    def flush(self):
+        """Confirma as alterações pendentes no índice"""
+        with self._lock:
+            if self._pending:
+                self._conn.commit()
+                self._pending = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def _ignore_sigint():
+    """Nos workers: o Ctrl-C é tratado só pelo processo principal"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class MemoryBudget:
+    """Limite de memória compartilhado pelos trabalhos de preparação em paralelo
+
+    Um trabalho maior que o limite inteiro ainda roda, mas sozinho.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, amount: int):
+        amount = max(0, amount)
+        with self._cond:
+            while self.in_use and self.in_use + amount > self.limit:
+                self._cond.wait()
+            self.in_use += amount
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= amount
+                self._cond.notify_all()
+
+
+class PrepScheduler:
+    """Agenda a preparação de mídia dentro de um orçamento de núcleos de CPU
+
+    Imagens (PIL, limitado pela CPU e pelo GIL) rodam em um pool de processos e consomem
+    um núcleo cada. Vídeos rodam no ffmpeg e recebem `video_threads` threads do encoder,
+    descontadas do mesmo orçamento, para que encodes simultâneos não disputem os núcleos.
+    Quando falta orçamento, os trabalhos maiores são atendidos primeiro. Imagens também
+    reservam a memória estimada da decodificação em `memory`, se houver limite.
+    """
+
+    def __init__(self, budget: int, video_threads: Optional[int] = None, memory_limit: Optional[int] = None):
+        if budget < 1:
+            raise ValueError("budget deve ser maior que 0")
+        self.budget = budget
+        self.video_threads = min(video_threads or max(1, budget // 2), budget)
+        self.memory = MemoryBudget(memory_limit) if memory_limit else None
+        self.in_use = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._waiting: list = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        """Trabalhos aguardando orçamento"""
+        with self._cond:
+            return len(self._waiting)
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Sem fork: o pool nasce em threads de trabalho enquanto outras seguram
+                # locks (sqlite, logging, scanner), que ficariam travados nos filhos
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.budget, mp_context=multiprocessing.get_context(method),
+                    initializer=_ignore_sigint
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Descarta um pool quebrado (worker morto); o próximo trabalho cria outro"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @contextmanager
+    def _slot(self, cost: int, size: int):
+        """Reserva `cost` núcleos; a fila de espera é ordenada do maior trabalho para o menor"""
+        cost = min(cost, self.budget)
+        ticket = (-size, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or self.budget - self.in_use < cost:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self.in_use += cost
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= cost
+                self._cond.notify_all()
+
+    def run_image(self, fn: Callable[..., T], *args, size: int = 0, memory: int = 0) -> T:
+        """Executa `fn(*args)` no pool de processos, ocupando um núcleo e `memory` bytes
+
+        Se um worker morrer (ex.: morto por falta de memória), o pool é recriado e o
+        trabalho tentado mais uma vez.
+        """
+        with ExitStack() as stack:
+            if self.memory is not None:
+                stack.enter_context(self.memory.reserve(memory))
+            stack.enter_context(self._slot(1, size))
+            for attempt in range(2):
+                pool = self._process_pool()
+                try:
+                    return pool.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+                    if attempt:
+                        raise
+                    logger.warning("Pool de processos quebrado (worker encerrado); recriando")
+
+    def run_video(self, fn: Callable[[int], T], size: int = 0) -> T:
+        """Executa `fn(threads)` na thread atual, reservando os núcleos do encoder"""
+        with self._slot(self.video_threads, size):
+            return fn(self.video_threads)
+
+    def run_light(self, fn: Callable[[], T], size: int = 0) -> T:
+        """Trabalho leve (ex.: remux), ocupando um núcleo"""
+        with self._slot(1, size):
+            return fn()
+
+    def shutdown(self, wait: bool = True):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
+
+
+def default_budget(max_workers: int) -> int:
+    """Orçamento de núcleos: `max_workers`, limitado aos núcleos disponíveis"""
+    return max(1, min(max_workers, os.cpu_count() or 1))
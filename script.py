@@ -1,35 +1,50 @@
 # pyright: reportMissingImports=false
-from instagrapi import Client  # Cliente principal para API do Instagram
+# instagrapi, PIL, moviepy, requests e cryptography são importados apenas onde são
+# usados, para que uma execução sem nada a postar termine sem carregá-los
 import os  # Operações do sistema operacional
-import time  # Para delays entre operações
-from PIL import Image # type: ignore  # Manipulação de imagens
 import sys  # Funcionalidades do sistema
 import logging  # Sistema de logs
-import requests  # Requisições HTTP
 from dotenv import load_dotenv  # Carregamento de variáveis de ambiente
 import subprocess  # Execução de processos
 import argparse  # Parse de argumentos da linha de comando
-from colorama import init, Fore  # Cores no terminal
 import locale  # Configurações regionais
-import json  # Manipulação de JSON
-from datetime import datetime  # Manipulação de datas
-from cryptography.fernet import Fernet  # Criptografia
-import base64  # Codificação base64
-from moviepy.editor import VideoFileClip
+import json  # Sessão serializada
+import functools  # Cache da chave de criptografia
+import importlib.util  # Verificação de dependências sem importá-las
+from config import Config  # Configurações da aplicação
+from processor import MediaProcessor  # Executor compartilhado de processamento
+from pipeline import PostingPipeline, PreparedMedia, PreparedAlbum  # Pipeline de preparação/upload
+import media  # Transformações de mídia com cache
+from cache import file_digest  # Hash do conteúdo das mídias
+from ledger import PostedLedger  # Registro indexado de mídias postadas
+from watcher import DirectoryWatcher  # Observação da pasta no modo --watch
+from probe import probe_video  # Metadados de vídeo sem decodificação
+from pacing import PostingRateLimiter, throttle_errors  # Ritmo de postagem
+from datetime import datetime, timedelta  # Janela das cotas de postagem
+from accounts import load_accounts  # Várias contas no mesmo processo
+import threading  # Uma thread de upload por conta
+import structlog  # Contexto dos spans por conta
+from resumable import ResumableVideoUploader, UploadStateStore  # Upload de vídeo retomável
+from metrics import metrics, configure_logging as configure_metrics_log, MetricsServer  # Telemetria
+from albums import group_entries  # Carrosséis de mídias relacionadas
+from jobqueue import JobQueue  # Fila persistente de posts
+from perceptual import image_hash, video_hash  # Cópias quase idênticas de mídias postadas
+from pathlib import Path  # Caminhos das mídias do carrossel
+import uuid  # Identificador de carrossel sem resposta do Instagram
+import math  # Relógio sem espera no --dry-run
+import shutil  # Remoção das cópias do --dry-run
+import sqlite3  # Cópia dos registros para o --dry-run
+import tempfile  # Diretório das cópias do --dry-run
+from clients import SimulatedClient  # Instagram simulado (--simulate / --dry-run)
 
 # Após os imports, antes de iniciar o processamento
-try:
-    import moviepy.editor
-    moviepy_installed = True
-except ImportError:
-    moviepy_installed = False
+moviepy_installed = importlib.util.find_spec('moviepy') is not None
 
-# Configura encoding para UTF-8
+# Configura encoding para UTF-8 e as cores do terminal no Windows
 if sys.platform.startswith('win'):
     sys.stdout.reconfigure(encoding='utf-8')
-
-# Inicializa colorama para cores no Windows
-init()
+    from colorama import init
+    init()
 
 # Configuração de logging
 logging.basicConfig(
@@ -45,6 +60,12 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
+# Sessão do instagrapi salva entre execuções (criptografada com .secret.key)
+SESSION_FILE = '.session.enc'
+
+# Notificações (Telegram/email) da execução; None quando desativadas
+NOTIFICACOES = None
+
 def get_system_language():
     try:
         locale.setlocale(locale.LC_ALL, '')
@@ -70,6 +91,8 @@ MESSAGES = {
         'waiting': 'Aguardando {} segundos antes do próximo post...',
         'video_processing': 'Preparando vídeo para upload...',
         'video_skipped': 'Vídeo ignorado: MoviePy não está instalado',
+        'session_restored': '[OK] Sessão anterior restaurada, login dispensado.',
+        'session_expired': 'Sessão salva expirada. Fazendo login completo...',
     },
     'en_US': {
         'login_success': '[OK] Login successful!',
@@ -86,6 +109,8 @@ MESSAGES = {
         'waiting': 'Waiting {} seconds before next post...',
         'video_processing': 'Preparing video for upload...',
         'video_skipped': 'Video skipped: MoviePy not installed',
+        'session_restored': '[OK] Previous session restored, login skipped.',
+        'session_expired': 'Saved session expired. Performing full login...',
     }
 }
 
@@ -109,9 +134,7 @@ def check_dependencies():
     }
     
     for module, package in required_packages.items():
-        try:
-            __import__(module)
-        except ImportError:
+        if importlib.util.find_spec(module) is None:
             logger.warning(get_message('dep_missing').format(package))
             subprocess.check_call([sys.executable, "-m", "pip", "install", package])
     
@@ -120,26 +143,36 @@ def check_dependencies():
 def check_instagram_connection():
     """Verifica a conexão com o Instagram"""
     try:
+        import requests
         response = requests.get('https://www.instagram.com', timeout=5)
         return response.status_code == 200
     except:
         return False
 
-def resize_image(image_path):
+def ler_imagem(image_path):
+    """Abre a imagem uma única vez para o cabeçalho (formato, tamanho) e o hash perceptual"""
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        return media.ImageHeader.of(img), image_hash(img)
+
+def resize_image(image_path, cache=None, digest=None, scheduler=None, max_bytes=None, cabecalho=None):
     """Redimensiona a imagem para as dimensões aceitas pelo Instagram"""
     try:
-        with Image.open(image_path) as img:
-            max_size = (1080, 1080)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            output_path = f"{image_path}_resized.jpg"
-            img.save(output_path, "JPEG", quality=95)
-            return output_path
+        if cache is not None:
+            return str(media.prepare_image(
+                image_path, cache, digest, scheduler, max_bytes, pin=True, header=cabecalho
+            ))
+        output_path = f"{image_path}_resized.jpg"
+        media.resize_image(image_path, output_path, max_bytes)
+        return output_path
     except Exception as e:
         print(f"Erro ao redimensionar imagem: {e}")
         return image_path
 
 def is_valid_image(filepath):
     try:
+        from PIL import Image  # type: ignore
         with Image.open(filepath) as img:
             return img.format in ['JPEG', 'PNG']
     except:
@@ -150,13 +183,15 @@ def is_valid_video(filepath):
     video_extensions = ['.mp4', '.mov', '.avi']
     return os.path.splitext(filepath)[1].lower() in video_extensions
 
+@functools.lru_cache(maxsize=None)
 def get_or_create_key():
-    """Obtém ou cria uma chave de criptografia"""
+    """Obtém ou cria uma chave de criptografia (lida do disco uma única vez)"""
     key_file = '.secret.key'
     if os.path.exists(key_file):
         with open(key_file, 'rb') as f:
             return f.read()
     else:
+        from cryptography.fernet import Fernet
         key = Fernet.generate_key()
         with open(key_file, 'wb') as f:
             f.write(key)
@@ -164,6 +199,7 @@ def get_or_create_key():
 
 def encrypt_credentials(username, password):
     """Criptografa as credenciais"""
+    from cryptography.fernet import Fernet
     key = get_or_create_key()
     f = Fernet(key)
     credentials = f"{username}:{password}".encode()
@@ -171,6 +207,7 @@ def encrypt_credentials(username, password):
 
 def decrypt_credentials():
     """Descriptografa as credenciais"""
+    from cryptography.fernet import Fernet
     try:
         key = get_or_create_key()
         f = Fernet(key)
@@ -182,13 +219,64 @@ def decrypt_credentials():
     except FileNotFoundError:
         return None, None
 
-def login(cl):
-    """Realiza login no Instagram usando credenciais criptografadas"""
-    usuario = os.getenv('INSTAGRAM_USER')
-    senha = os.getenv('INSTAGRAM_PASSWORD')
-    
-    if not usuario or not senha:
-        usuario, senha = decrypt_credentials()
+def save_session(cl, session_file=SESSION_FILE):
+    """Salva a sessão do instagrapi criptografada com a chave local"""
+    from cryptography.fernet import Fernet
+    try:
+        f = Fernet(get_or_create_key())
+        encrypted_data = f.encrypt(json.dumps(cl.get_settings()).encode())
+        tmp_file = f"{session_file}.tmp"
+        with open(tmp_file, 'wb') as file:
+            file.write(encrypted_data)
+        os.replace(tmp_file, session_file)
+    except Exception as e:
+        logger.warning(f"Não foi possível salvar a sessão: {e}")
+
+def load_session(cl, session_file=SESSION_FILE):
+    """Restaura a sessão salva; retorna False se não houver sessão utilizável"""
+    from cryptography.fernet import Fernet, InvalidToken
+    try:
+        f = Fernet(get_or_create_key())
+        with open(session_file, 'rb') as file:
+            encrypted_data = file.read()
+        cl.set_settings(json.loads(f.decrypt(encrypted_data)))
+        return True
+    except FileNotFoundError:
+        return False
+    except (InvalidToken, ValueError) as e:
+        logger.warning(f"Sessão salva inválida, ignorando: {e}")
+        return False
+
+def login(cl, session_file=SESSION_FILE, usuario=None, senha=None):
+    """Realiza login no Instagram, reaproveitando a sessão salva quando válida
+
+    Sem `usuario`, as credenciais vêm do .env ou de .credentials.enc; com `usuario`
+    e sem `senha`, só a sessão salva da conta é aceita.
+    """
+    from instagrapi.exceptions import LoginRequired
+    if load_session(cl, session_file):
+        try:
+            # Valida a sessão com uma chamada leve, sem login completo
+            with metrics.span('login', session='restored'):
+                cl.get_timeline_feed()
+            logger.info(get_message('session_restored'))
+            return True
+        except LoginRequired:
+            logger.info(get_message('session_expired'))
+            # Mantém os identificadores do dispositivo para evitar desafios de segurança
+            uuids = cl.get_settings().get('uuids')
+            cl.set_settings({})
+            if uuids:
+                cl.set_uuids(uuids)
+        except Exception as e:
+            logger.warning(f"Não foi possível validar a sessão salva: {e}")
+
+    if not usuario:
+        usuario = os.getenv('INSTAGRAM_USER')
+        senha = os.getenv('INSTAGRAM_PASSWORD')
+        if not usuario or not senha:
+            usuario, senha = decrypt_credentials()
+    # Uma conta informada sem senha nunca usa as credenciais de outra conta
     if not usuario or not senha:
         logger.error(get_message('missing_env'))
         return False
@@ -199,190 +287,878 @@ def login(cl):
     
     try:
         logger.info(f"Tentando fazer login como {usuario}...")
-        cl.login(usuario, senha)
+        with metrics.span('login', user=usuario):
+            cl.login(usuario, senha)
         logger.info(get_message('login_success'))
+        save_session(cl, session_file)
         return True
     except Exception as e:
         logger.error(get_message('login_error').format(str(e)))
         return False
 
-def load_posted_media():
-    """Carrega o registro de mídias já postadas"""
-    try:
-        with open('posted_media.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+def load_posted_media(config, conta=None):
+    """Abre o registro de mídias já postadas, migrando o antigo posted_media.json
+
+    Cada conta tem o seu registro, ao lado do registro padrão.
+    """
+    if conta is not None:
+        return PostedLedger(
+            conta.ledger_path(config.ledger_path),
+            batch_size=config.ledger_batch_size,
+            similarity_distance=config.dedup_max_distance
+        )
+    return PostedLedger(
+        config.ledger_path,
+        # Uma simulação não migra (nem renomeia) o registro antigo
+        legacy_json=None if config.simulate else 'posted_media.json',
+        batch_size=config.ledger_batch_size,
+        similarity_distance=config.dedup_max_distance
+    )
 
-def save_posted_media(media_path):
+def save_posted_media(ledger, midia):
     """Salva registro de mídia postada"""
-    posted = load_posted_media()
-    posted[os.path.basename(media_path)] = {
-        'timestamp': datetime.now().isoformat(),
-        'path': media_path
-    }
-    with open('posted_media.json', 'w') as f:
-        json.dump(posted, f, indent=2)
+    with metrics.span('ledger_write', file=str(midia.source)):
+        ledger.record(midia.source, midia.digest, midia.phash)
+
+def regras_preparo(config):
+    """Configuração que decide os pulos permanentes; mudá-la faz os arquivos serem reavaliados"""
+    return (f"{config.max_video_duration}|{config.max_video_size}|{config.video_trim:d}|"
+            f"{config.video_fit_size:d}|{config.dedup_perceptual:d}|{config.dedup_max_distance}")
+
+def preparar_midia(caminho_arquivo, processor=None, ledger=None, entry=None, ao_pular=None):
+    """Valida e prepara uma mídia para upload (executado nos workers do pipeline)
+
+    Com `processor`, as mídias preparadas vêm do cache e os hashes calculados são
+    guardados no índice da varredura; com `entry` (desse índice) a classificação e o
+    hash já conhecidos são reaproveitados. Quando a mídia é pulada de propósito (já
+    postada, fora dos limites, quase idêntica a outra), `ao_pular` recebe o motivo;
+    nos erros de preparação, não é chamada. Pulos que se repetiriam em toda execução
+    (fora dos limites, quase idêntica, arquivo ilegível) ficam marcados no índice, para
+    não contarem como mídia nova antes do login.
+    """
+    cache = processor.cache if processor is not None else None
+    scanner = processor.scanner if processor is not None else None
+    scheduler = processor.scheduler if processor is not None else None
+    arquivo = os.path.basename(caminho_arquivo)
+    print(f"\nProcessando arquivo: {arquivo}")
+
+    def pular(span, motivo):
+        span.outcome = 'skipped'
+        if ao_pular is not None:
+            ao_pular(motivo)
+
+    def descartar():
+        if scanner is not None:
+            chave = str(entry.path) if entry is not None else caminho_arquivo
+            scanner.mark_skipped(chave, regras_preparo(processor.config))
+
+    with metrics.span('validate', file=caminho_arquivo) as span:
+        if entry is not None:
+            imagem = entry.kind == 'image'
+            valido = entry.kind in ('image', 'video')
+        else:
+            imagem = is_valid_image(caminho_arquivo)
+            valido = imagem or is_valid_video(caminho_arquivo)
+        if not valido:
+            print(f"Arquivo ignorado (não é uma mídia válida): {arquivo}")
+            pular(span, "não é uma mídia válida")
+            return None
+
+        # Mídias são identificadas pelo conteúdo, não pelo nome
+        digest = entry.digest if entry is not None else None
+        if digest is None:
+            digest = file_digest(caminho_arquivo)
+            if scanner is not None:
+                scanner.update_digest(caminho_arquivo, digest)
+        if ledger is not None and ledger.is_posted(digest, arquivo):
+            print(f"Arquivo já postado anteriormente: {arquivo}")
+            pular(span, "cópia idêntica já postada")
+            return None
 
-def postar_midia(cl):
+        if not imagem:
+            if not moviepy_installed: # type: ignore
+                print("Pulando vídeo pois moviepy não está instalado")
+                span.outcome = 'skipped'
+                return None
+
+            print(f"Arquivo é um vídeo válido: {arquivo}")
+            try:
+                # Lê apenas os metadados do container, sem abrir o vídeo com o moviepy
+                print(f"Verificando vídeo: {caminho_arquivo}")
+                info = probe_video(caminho_arquivo)
+                if info is None:
+                    raise ValueError("não foi possível ler os metadados do vídeo")
+                duration = info.duration
+                size_mb = os.path.getsize(caminho_arquivo) / (1024 * 1024)  # Tamanho em MB
+                print(f"Duração do vídeo: {duration:.1f} segundos")
+                print(f"Tamanho do arquivo: {size_mb:.1f} MB")
+
+                # Instagram geralmente tem limite de ~100MB e 60s; acima disso o vídeo é
+                # recodificado para caber (video_fit_size) ou cortado (video_trim)
+                config = processor.config if processor is not None else Config.model_construct()
+                if duration > config.max_video_duration:
+                    if not config.video_trim:
+                        print(f"Vídeo muito longo ({duration:.1f}s). Pulando...")
+                        pular(span, f"vídeo muito longo ({duration:.1f}s)")
+                        descartar()
+                        return None
+                    print(f"Vídeo muito longo ({duration:.1f}s), será cortado em {config.max_video_duration}s")
+
+                if size_mb * 1024 * 1024 > config.max_video_size:
+                    if not config.video_fit_size:
+                        print(f"Vídeo muito grande ({size_mb:.1f}MB). Pulando...")
+                        pular(span, f"vídeo muito grande ({size_mb:.1f}MB)")
+                        descartar()
+                        return None
+                    print(f"Vídeo muito grande ({size_mb:.1f}MB), será recodificado para caber no limite")
+
+            except Exception as e:
+                print(f"Erro ao processar vídeo: {str(e)}")
+                print("Verifique se o vídeo está corrompido ou em formato incompatível")
+                span.outcome = 'error'
+                descartar()
+                return None
+
+    phash = None
+    cabecalho = None  # da abertura do dedup, reaproveitado na estimativa de memória
+    if ledger is not None and processor is not None and processor.config.dedup_perceptual:
+        with metrics.span('dedup', file=caminho_arquivo) as span:
+            try:
+                if imagem:
+                    cabecalho, phash = ler_imagem(caminho_arquivo)
+                else:
+                    phash = video_hash(caminho_arquivo, info)
+            except Exception as e:
+                # Sem o hash perceptual vale apenas a verificação pelo conteúdo
+                print(f"Não foi possível calcular o hash perceptual de {arquivo}: {e}")
+            semelhante = ledger.find_similar(phash) if phash is not None else None
+            if semelhante is not None:
+                nome, distancia = semelhante
+                print(f"Arquivo quase idêntico a {nome}, já postado ({distancia} bits de diferença): {arquivo}")
+                pular(span, f"quase idêntico a {nome}, já postado ({distancia} bits de diferença)")
+                descartar()
+                return None
+
+    if imagem:
+        print(f"Arquivo é uma imagem válida: {arquivo}")
+        with metrics.span('prepare', file=caminho_arquivo, kind='photo') as span:
+            try:
+                print(f"Redimensionando imagem: {arquivo}")
+                max_bytes = (processor.config.image_max_bytes or None) if processor is not None else None
+                resized_image = resize_image(caminho_arquivo, cache, digest, scheduler, max_bytes, cabecalho)
+                return PreparedMedia(
+                    source=caminho_arquivo,
+                    path=resized_image,
+                    kind='photo',
+                    temporary=cache is None and resized_image != caminho_arquivo,
+                    digest=digest,
+                    action='resize',
+                    phash=phash,
+                    cache=cache if resized_image != caminho_arquivo else None
+                )
+            except Exception as e:
+                print(f"Erro ao processar foto {arquivo}: {str(e)}")
+                print(f"Detalhes completos: {repr(e)}")
+                span.outcome = 'error'
+                # Erros de decodificação do PIL (sem errno), não de disco: o arquivo é ilegível
+                if isinstance(e, (SyntaxError, ValueError)) or (isinstance(e, OSError) and e.errno is None):
+                    descartar()
+                return None
+
+    with metrics.span('prepare', file=caminho_arquivo, kind='video') as span:
+        settings = media.VideoSettings.from_config(processor.config) if processor is not None else None
+        video_path, acao = convert_video(caminho_arquivo, cache, digest, info, settings, scheduler)
+        span.fields['action'] = acao
+        if video_path is None:
+            # Falha no caminho escolhido: registrada como erro, não como passthrough
+            print(f"Vídeo {arquivo}: falha no {acao or 'preparo'}, pulando")
+            span.outcome = 'error'
+            return None
+        print(f"Vídeo {arquivo}: {acao}")
+        return PreparedMedia(
+            source=caminho_arquivo,
+            path=video_path,
+            kind='video',
+            temporary=cache is None and video_path != caminho_arquivo,
+            digest=digest,
+            action=acao,
+            phash=phash,
+            cache=cache if video_path != caminho_arquivo else None
+        )
+
+def ja_postada(ledger, midia):
+    """Motivo para não publicar `midia`, se uma cópia dela foi postada desde a preparação
+
+    A verificação da preparação roda nos workers, antes dos uploads das mídias à frente
+    no pipeline; cópias no mesmo lote só são reconhecidas aqui, logo antes do upload.
+    """
+    if ledger is None:
+        return None
+    if midia.digest and ledger.is_posted(midia.digest):
+        return "cópia idêntica já postada"
+    semelhante = ledger.find_similar(midia.phash) if midia.phash is not None else None
+    if semelhante is not None:
+        nome, distancia = semelhante
+        return f"quase idêntico a {nome}, já postado ({distancia} bits de diferença)"
+    return None
+
+def liberar(midia):
+    """Remove o arquivo temporário da mídia ou libera sua entrada fixada no cache"""
+    if midia.temporary and os.path.exists(midia.path):
+        print("Removendo arquivo temporário...")
+        os.remove(midia.path)
+    if midia.cache is not None:
+        midia.cache.unpin(midia.path)
+        midia.cache = None
+
+def publicar_midia(cl, midia, ledger=None, caption=None, uploader=None):
+    """Faz o upload de uma mídia preparada e libera o arquivo preparado
+
+    Com `uploader`, vídeos são enviados em blocos e um upload interrompido é retomado
+    na próxima tentativa (inclusive em outra execução). Num limite do Instagram, o
+    arquivo é mantido para a nova tentativa do pipeline.
+    """
+    arquivo = os.path.basename(midia.source)
+    caption = caption or CAPTION_PADRAO
+    repetir = False
     try:
-        arquivos = os.listdir(CAMINHO_ARQUIVOS)
-        posted_media = load_posted_media()
-        
-        # Filtra arquivos já postados
-        arquivos = [f for f in arquivos if f not in posted_media]
-        
-        logger.info(f"Encontrados {len(arquivos)} arquivos não postados no diretório")
+        motivo = ja_postada(ledger, midia)
+        if motivo is not None:
+            print(f"Pulando {arquivo}: {motivo}")
+            return False
+        if midia.kind == 'photo':
+            print(f"Tentando fazer upload da foto: {midia.path}")
+            print(f"Tamanho do arquivo: {os.path.getsize(midia.path) / (1024 * 1024):.2f} MB")
+            try:
+                with metrics.span('upload', file=str(midia.source), kind='photo'):
+                    cl.photo_upload(
+                        midia.path,
+                        caption=caption
+                    )
+                print(f"✓ Foto postada com sucesso: {arquivo}")
+                if ledger is not None:
+                    save_posted_media(ledger, midia)
+                return True
+            except throttle_errors():
+                # O pipeline aguarda o backoff e tenta de novo
+                repetir = True
+                raise
+            except Exception as upload_error:
+                print(f"Erro específico durante upload: {str(upload_error)}")
+                print(f"Tipo do erro: {type(upload_error)}")
+                print(f"Detalhes completos: {repr(upload_error)}")
+                return False
+
+        print("Tentando upload para o Instagram...")
+        try:
+            with metrics.span('upload', file=str(midia.source), kind='video'):
+                if uploader is not None:
+                    uploader.upload(midia.path, midia.digest, caption)
+                else:
+                    cl.video_upload(
+                        midia.path,
+                        caption=caption
+                    )
+            print(f"✓ Vídeo postado com sucesso: {arquivo}")
+            if ledger is not None:
+                save_posted_media(ledger, midia)
+            return True
+        except throttle_errors():
+            repetir = True
+            raise
+        except Exception as e:
+            print(f"Erro durante upload do vídeo: {str(e)}")
+            print("Detalhes do erro:", repr(e))
+            return False
+    finally:
+        if not repetir:
+            liberar(midia)
+
+def publicar_album(cl, album, ledger=None, caption=None):
+    """Publica as mídias preparadas de um grupo como um único carrossel"""
+    caption = caption or CAPTION_PADRAO
+    repetir = False
+    try:
+        itens = []
+        vistos = set()
+        for midia in album.items:
+            motivo = "repetido no álbum" if midia.digest in vistos else ja_postada(ledger, midia)
+            if motivo is not None:
+                print(f"Pulando {os.path.basename(midia.source)} do álbum {album.key}: {motivo}")
+                continue
+            vistos.add(midia.digest)
+            itens.append(midia)
+        if not itens:
+            return False
+        if len(itens) == 1:
+            # Um carrossel precisa de pelo menos duas mídias
+            try:
+                return publicar_midia(cl, itens[0], ledger, caption)
+            except throttle_errors():
+                repetir = True
+                raise
+        print(f"Tentando upload do álbum {album.key} ({len(itens)} mídias): "
+              f"{', '.join(os.path.basename(m.source) for m in itens)}")
+        try:
+            with metrics.span('upload', file=album.key, kind='album', items=len(itens)):
+                resultado = cl.album_upload(
+                    [Path(m.path) for m in itens],
+                    caption=caption
+                )
+            print(f"✓ Álbum postado com sucesso: {album.key}")
+            if ledger is not None:
+                with metrics.span('ledger_write', file=album.key):
+                    ledger.record_album(
+                        str(getattr(resultado, 'pk', None) or uuid.uuid4().hex),
+                        [(m.source, m.digest, m.phash) for m in itens]
+                    )
+            return True
+        except throttle_errors():
+            repetir = True
+            raise
+        except Exception as e:
+            print(f"Erro durante upload do álbum: {str(e)}")
+            print("Detalhes do erro:", repr(e))
+            return False
+    finally:
+        if not repetir:
+            for midia in album.items:
+                liberar(midia)
+
+def publicar(cl, midia, ledger=None, caption=None, uploader=None):
+    """Publica uma mídia ou um carrossel preparado pelo pipeline"""
+    if isinstance(midia, PreparedAlbum):
+        return publicar_album(cl, midia, ledger, caption)
+    return publicar_midia(cl, midia, ledger, caption, uploader)
+
+def agrupar(candidatos, config, pasta, watch=False):
+    """Agrupa os candidatos em carrosséis, conforme `album_mode`"""
+    if config.album_mode == 'off':
+        return candidatos
+    if watch:
+        # No --watch os arquivos chegam aos poucos e o grupo nunca estaria completo
+        logger.warning("Modo álbum não se aplica ao --watch; as mídias serão postadas individualmente")
+        return candidatos
+    return group_entries(
+        candidatos,
+        config.album_mode,
+        pasta,
+        max_items=config.album_max_items,
+        window=config.album_window
+    )
+
+def usar_fila(fila, midias, cl, processor, ledger, uploader=None, conta=None, watch=False, stop=None):
+    """Alimenta a fila com as mídias da pasta; retorna os jobs prontos e os passos do pipeline
+
+    Cada job termina postado ('done'), pulado de propósito ('skipped', ex.: já postado),
+    volta para a fila com atraso ou, esgotadas as tentativas, fica estacionado ('failed')
+    com o motivo, até `jobqueue.py requeue`.
+    """
+    conta_id = conta.username if conta is not None else ''
+    caption_conta = conta.caption if conta is not None else None
+    liberados = fila.release(conta_id)
+    if liberados:
+        print(f"{liberados} jobs interrompidos (reserva expirada) voltaram para a fila")
+
+    # Entradas da varredura por caminho absoluto (o da fila): a classificação e o hash
+    # já calculados são reaproveitados na preparação
+    entradas = {}
+
+    def registrar(entry):
+        caminho = str(entry.path.resolve())
+        entradas[caminho] = entry
+        return caminho
+
+    if watch:
+        def enfileirar():
+            for entry in midias:
+                fila.enqueue_new([registrar(entry)], conta_id)
+
+        threading.Thread(target=enfileirar, name=f"fila-{conta_id or 'principal'}", daemon=True).start()
+    else:
+        novos = fila.enqueue_new(sorted(registrar(entry) for entry in midias), conta_id)
+        print(f"{novos} mídias novas na fila")
+
+    em_andamento = {}
+
+    def preparar(job):
+        entry = entradas.pop(job.path, None) or processor.scanner.examine(job.path)
+        if entry is None:
+            fila.fail(job.id, "arquivo não encontrado")
+            return None
+        pulada = []
+        try:
+            midia = preparar_midia(job.path, processor, ledger, entry, ao_pular=pulada.append)
+        except Exception as e:
+            fila.fail(job.id, str(e))
+            return None
+        if midia is None:
+            if pulada:
+                # Pulada de propósito: o job termina sem contar como falha
+                fila.skip(job.id, pulada[0])
+            else:
+                fila.fail(job.id, "mídia inválida ou erro na preparação (detalhes no log)")
+            return None
+        em_andamento[midia.source] = job
+        return midia
+
+    def publicar_job(midia):
+        job = em_andamento.pop(midia.source)
+        motivo = ja_postada(ledger, midia)
+        if motivo is not None:
+            # Pulada de propósito: o job termina, não conta como falha
+            print(f"Pulando {os.path.basename(midia.source)}: {motivo}")
+            fila.skip(job.id, motivo)
+            liberar(midia)
+            return False
+        # A espera do ritmo pode ter consumido boa parte da reserva
+        fila.renew(job.id)
+        try:
+            postado = publicar_midia(cl, midia, ledger, job.caption or caption_conta, uploader)
+        except throttle_errors():
+            # O pipeline tenta de novo após o backoff
+            em_andamento[midia.source] = job
+            raise
+        except Exception as e:
+            fila.fail(job.id, str(e))
+            raise
+        if postado:
+            fila.complete(job.id)
+        elif fila.fail(job.id, "falha no upload (detalhes no log)") == 'failed':
+            print(f"Job {job.id} estacionado após {job.attempts} tentativas: {job.path}")
+        return postado
+
+    jobs = fila.iter_ready(conta_id, stop=stop, follow=watch, poll_interval=processor.config.watch_poll_interval)
+    return jobs, preparar, publicar_job
+
+def postar_midia(cl, processor, watch=False, conta=None, stop=None):
+    """Posta as mídias da pasta (a de `conta`, se informada) até o fim ou até `stop`"""
+    pipeline = None
+    ledger = None
+    watcher = None
+    upload_state = None
+    fila = None
+    gauges = []
+    scanner = processor.scanner
+    config = processor.config
+    pasta = conta.media_path if conta is not None else CAMINHO_ARQUIVOS
+    prefixo = f"[{conta.username}] " if conta is not None else ""
+    try:
+        ledger = load_posted_media(config, conta)
+        uploader = None
+        if config.resumable_video_upload:
+            upload_state = UploadStateStore(config.upload_state_path)
+            uploader = ResumableVideoUploader(
+                cl,
+                upload_state,
+                base_url=config.rupload_base_url,
+                chunk_size=config.upload_chunk_size,
+                max_retries=config.max_retries,
+                retry_delay=config.retry_delay,
+                stop=stop
+            )
         
-        if not arquivos:
-            logger.info("Nenhum arquivo novo para postar. Encerrando...")
-            return
+        # A varredura é incremental e entrega os arquivos sob demanda ao pipeline;
+        # arquivos já postados são descartados nos workers, pelo hash do conteúdo.
+        # No modo --watch, os arquivos novos continuam chegando pelo observador.
+        if watch:
+            watcher = DirectoryWatcher(
+                pasta,
+                scanner,
+                settle_seconds=config.watch_settle_seconds,
+                poll_interval=config.watch_poll_interval,
+                backend=config.watch_backend,
+                stop=stop
+            )
+            entradas = watcher.watch()
+        else:
+            entradas = scanner.scan(pasta, recursive=config.album_mode == 'folder')
+        midias = (
+            entry for entry in entradas
+            if entry.kind in ('image', 'video') and (conta is None or conta.matches(entry.path))
+        )
+        if config.job_queue:
+            # A pasta apenas alimenta a fila; os posts saem dela, por prioridade e horário
+            if config.album_mode != 'off':
+                logger.warning("album_mode é ignorado com a fila de posts; cada mídia sai como um post")
+            fila = JobQueue(config.job_queue_path, config.job_max_attempts, config.job_retry_delay,
+                            config.job_lease)
+            candidatos, preparar, enviar = usar_fila(
+                fila, midias, cl, processor, ledger, uploader, conta, watch, stop
+            )
+        else:
+            candidatos = agrupar(midias, config, pasta, watch)
+            preparar = lambda entry: preparar_midia(str(entry.path), processor, ledger, entry)
+            enviar = lambda midia: publicar(cl, midia, ledger, conta.caption if conta else None, uploader)
+        ritmo = dict(conta.pacing) if conta is not None else {}
+        if isinstance(cl, SimulatedClient):
+            # As esperas do ritmo passam no relógio acelerado da simulação
+            ritmo.update(clock=cl.clock, sleep=cl.clock.sleep, wait_event=cl.clock.wait)
+        limiter = PostingRateLimiter.from_config(
+            config,
+            history=ledger.posted_since(datetime.now() - timedelta(days=1)),
+            **ritmo
+        )
+        pipeline = PostingPipeline(
+            processor.executor,
+            prepare=preparar,
+            upload=enviar,
+            limiter=limiter,
+            prefetch=config.pipeline_prefetch,
+            throttle_retries=config.throttle_retries,
+            stop=stop
+        )
+        rotulo = {'account': conta.username} if conta is not None else {}
+        gauges.append(metrics.gauge('pipeline_queue_depth', lambda: pipeline.depth,
+                                    'Mídias aguardando upload', **rotulo))
+        gauges.append(metrics.gauge('pace_wait_seconds_total', lambda: limiter.waited,
+                                    'Tempo total aguardando o ritmo de postagem', **rotulo))
+        if fila is not None:
+            conta_id = conta.username if conta is not None else ''
+            gauges.append(metrics.gauge('jobs_pending', lambda: fila.counts(conta_id)['pending'],
+                                        'Jobs pendentes na fila', **rotulo))
+            gauges.append(metrics.gauge('jobs_failed', lambda: fila.counts(conta_id)['failed'],
+                                        'Jobs estacionados após esgotar as tentativas', **rotulo))
+        pipeline.run(candidatos)
         
-        posts_realizados = 0
-        for arquivo in arquivos:
-            caminho_arquivo = os.path.join(CAMINHO_ARQUIVOS, arquivo)
-            print(f"\nProcessando arquivo: {arquivo}")
-            
-            if is_valid_image(caminho_arquivo):
-                print("Arquivo é uma imagem válida")
-                try:
-                    print("Redimensionando imagem...")
-                    resized_image = resize_image(caminho_arquivo)
-                    
-                    print(f"Tentando fazer upload da foto: {resized_image}")
-                    print(f"Tamanho do arquivo: {os.path.getsize(resized_image) / (1024 * 1024):.2f} MB")
-                    
-                    try:
-                        media = cl.photo_upload(
-                            resized_image,
-                            caption=CAPTION_PADRAO
-                        )
-                        print(f"✓ Foto postada com sucesso: {arquivo}")
-                        posts_realizados += 1
-                    except Exception as upload_error:
-                        print(f"Erro específico durante upload: {str(upload_error)}")
-                        print(f"Tipo do erro: {type(upload_error)}")
-                        print(f"Detalhes completos: {repr(upload_error)}")
-                    
-                    if resized_image != caminho_arquivo:
-                        print("Removendo arquivo temporário...")
-                        os.remove(resized_image)
-                    
-                except Exception as e:
-                    print(f"Erro ao processar foto {arquivo}: {str(e)}")
-                    print(f"Detalhes completos: {repr(e)}")
-                    
-            elif is_valid_video(caminho_arquivo):
-                if not moviepy_installed: # type: ignore
-                    print("Pulando vídeo pois moviepy não está instalado")
-                    continue
-                    
-                print("Arquivo é um vídeo válido")
-                try:
-                    print("Iniciando upload do vídeo...")
-                    try:
-                        # Verify video can be loaded with moviepy
-                        print(f"Verificando vídeo: {caminho_arquivo}")
-                        video = VideoFileClip(caminho_arquivo)
-                        duration = video.duration
-                        size_mb = os.path.getsize(caminho_arquivo) / (1024 * 1024)  # Tamanho em MB
-                        print(f"Duração do vídeo: {duration:.1f} segundos")
-                        print(f"Tamanho do arquivo: {size_mb:.1f} MB")
-                        video.close()
-                        
-                        if duration > 60:
-                            print(f"Vídeo muito longo ({duration:.1f}s). Pulando...")
-                            continue
-                            
-                        if size_mb > 100:  # Instagram geralmente tem limite de ~100MB
-                            print(f"Vídeo muito grande ({size_mb:.1f}MB). Pulando...")
-                            continue
-                            
-                    except Exception as e:
-                        print(f"Erro ao processar vídeo: {str(e)}")
-                        print("Verifique se o vídeo está corrompido ou em formato incompatível")
-                        continue
-
-                    print("Tentando upload para o Instagram...")
-                    try:
-                        print("Convertendo vídeo para formato compatível...")
-                        video_path = convert_video(caminho_arquivo)
-                        
-                        print("Tentando upload para o Instagram...")
-                        media = cl.video_upload(
-                            video_path,
-                            caption=CAPTION_PADRAO
-                        )
-                        
-                        # Limpa o arquivo convertido se foi criado
-                        if video_path != caminho_arquivo:
-                            os.remove(video_path)
-                            
-                        print(f"✓ Vídeo postado com sucesso: {arquivo}")
-                        posts_realizados += 1
-                    except Exception as e:
-                        print(f"Erro durante upload do vídeo: {str(e)}")
-                        print("Detalhes do erro:", repr(e))
-                        
-                except Exception as e:
-                    print(f"Erro ao postar vídeo {arquivo}: {str(e)}")
-                    print("Erro completo:", repr(e))
-            else:
-                print(f"Arquivo ignorado (não é uma mídia válida): {arquivo}")
-            
-            if posts_realizados < len(arquivos):
-                tempo_espera = 30 if is_valid_video(caminho_arquivo) else 10
-                print(f"Aguardando {tempo_espera} segundos antes do próximo post...")
-                time.sleep(tempo_espera)
+        if conta is None:
+            # Com várias contas o scanner é compartilhado e os contadores se misturam
+            logger.info(f"Encontrados {scanner.scanned} arquivos no diretório "
+                        f"({scanner.reexamined} novos ou alterados)")
+        if not pipeline.posted:
+            logger.info(f"{prefixo}Nenhum arquivo novo para postar. Encerrando...")
                 
-        print("\nProcessamento concluído!")
-        print(f"Total de posts realizados: {posts_realizados}")
+        print(f"\n{prefixo}Processamento concluído!")
+        print(f"{prefixo}Total de posts realizados: {pipeline.posted}")
+        cache_stats = processor.cache.stats()
+        print(f"Cache de mídia: {cache_stats['hits']} acertos, {cache_stats['misses']} falhas, "
+              f"{cache_stats['evictions']} removidos")
+        print(f"{prefixo}Ritmo de postagem: {limiter.waited:.0f}s aguardando, "
+              f"{limiter.throttled} limites do Instagram")
+        if pipeline.posted:
+            notificar(f"{prefixo}Processamento concluído: {pipeline.posted} posts realizados")
         
     except KeyboardInterrupt:
         print("\nOperação interrompida pelo usuário")
-        print(f"Total de posts realizados antes da interrupção: {posts_realizados}")
+        print(f"Total de posts realizados antes da interrupção: {pipeline.posted if pipeline else 0}")
     except Exception as e:
-        print(f"Erro geral: {str(e)}")
+        print(f"{prefixo}Erro geral: {str(e)}")
+        notificar(f"{prefixo}Erro geral na postagem", e)
+    finally:
+        if watcher is not None:
+            watcher.close()
+        if ledger is not None:
+            ledger.close()
+        if upload_state is not None:
+            upload_state.close()
+        for gauge in gauges:
+            metrics.remove_gauge(gauge)
+        if fila is not None:
+            # Jobs preparados mas não enviados voltam para a fila
+            fila.release_claimed()
+            fila.close()
+        scanner.flush()
+
+def existe_midia_nova(processor, conta=None):
+    """Verifica, antes do login, se a pasta tem alguma mídia ainda não postada
+
+    Os hashes calculados aqui ficam no índice da varredura e são reaproveitados pelo
+    pipeline. Arquivos marcados como pulados pela preparação, com as regras atuais, não
+    contam. Sem nada novo, a execução termina sem carregar o instagrapi nem fazer login.
+    """
+    scanner = processor.scanner
+    config = processor.config
+    pasta = conta.media_path if conta is not None else CAMINHO_ARQUIVOS
+    if config.job_queue:
+        fila = JobQueue(config.job_queue_path, lease=config.job_lease)
+        try:
+            conta_id = conta.username if conta is not None else ''
+            fila.release(conta_id)
+            if fila.has_ready(conta_id):
+                return True
+        finally:
+            fila.close()
+    ledger = load_posted_media(config, conta)
+    regras = regras_preparo(config)
+    try:
+        for entry in scanner.scan(pasta, recursive=processor.config.album_mode == 'folder'):
+            if entry.kind not in ('image', 'video') or (conta is not None and not conta.matches(entry.path)):
+                continue
+            if entry.skipped == regras:
+                # A preparação pularia de novo (fora dos limites, quase idêntico, ilegível)
+                continue
+            digest = entry.digest
+            if digest is None:
+                digest = file_digest(entry.path)
+                scanner.update_digest(entry.path, digest)
+            if not ledger.is_posted(digest, entry.path.name):
+                return True
+        return False
+    finally:
+        ledger.close()
+        scanner.flush()
 
-def convert_video(input_path):
-    """Converte o vídeo para um formato compatível com o Instagram"""
+def executar_conta(processor, conta, watch=False, stop=None):
+    """Login e postagem de uma conta, com cliente e sessão próprios"""
+    if not watch and not existe_midia_nova(processor, conta):
+        logger.info(f"[{conta.username}] Nenhum arquivo novo para postar.")
+        return
+    simulado = processor.config.simulate
+    if simulado:
+        cl = SimulatedClient.from_config(processor.config, conta.username)
+    else:
+        from instagrapi import Client
+        cl = Client()
+    # Os spans desta thread levam o nome da conta
+    structlog.contextvars.bind_contextvars(account=conta.username)
     try:
-        output_path = input_path + "_converted.mp4"
-        print("Convertendo vídeo para formato compatível...")
-        
-        video = VideoFileClip(input_path)
-        video.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True
+        if not simulado and not login(cl, conta.session_file, conta.username, conta.password):
+            logger.error(f"Não foi possível fazer login como {conta.username}")
+            notificar(f"[{conta.username}] Não foi possível fazer login")
+            return
+        try:
+            postar_midia(cl, processor, watch=watch, conta=conta, stop=stop)
+        finally:
+            if simulado:
+                resumo_simulacao(cl, f"[{conta.username}] ")
+            else:
+                save_session(cl, conta.session_file)
+    except Exception as e:
+        # Uma conta com problema não derruba as demais
+        logger.error(f"Erro na conta {conta.username}: {e}")
+        notificar(f"[{conta.username}] Erro na conta", e)
+
+def postar_contas(processor, contas, watch=False):
+    """Atende várias contas ao mesmo tempo, uma thread de upload para cada
+
+    O executor, o cache e o scanner do `processor` são compartilhados; cada conta tem
+    fila, sessão, registro e ritmo próprios, então uma conta lenta ou limitada pelo
+    Instagram não atrasa as outras.
+    """
+    stop = threading.Event()
+    threads = [
+        threading.Thread(
+            target=executar_conta,
+            args=(processor, conta, watch, stop),
+            name=f"conta-{conta.username}",
+            daemon=True
         )
-        video.close()
-        
-        return output_path
+        for conta in contas
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        print("\nOperação interrompida pelo usuário, encerrando as contas...")
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=10)
+
+def copiar_banco(origem, destino):
+    """Copia um banco SQLite, inclusive o que ainda está só no WAL"""
+    if not os.path.exists(origem):
+        return
+    fonte = sqlite3.connect(str(origem))
+    alvo = sqlite3.connect(str(destino))
+    try:
+        fonte.backup(alvo)
+    finally:
+        alvo.close()
+        fonte.close()
+
+def simulado(caminho):
+    """posted_media.db -> posted_media.simulado.db"""
+    caminho = Path(caminho)
+    return caminho.with_name(f"{caminho.stem}.simulado{caminho.suffix}")
+
+def configurar_simulacao(config, contas=(), dry_run=False):
+    """Configuração do --simulate / --dry-run, sem tocar no que foi postado de verdade
+
+    --simulate usa registro e fila próprios (`.simulado`), mantidos entre simulações.
+    --dry-run trabalha sobre cópias temporárias do registro e da fila reais e não espera
+    o ritmo de postagem: mostra o que a próxima execução postaria. Retorna a configuração
+    e o diretório das cópias (None no --simulate), a remover no fim.
+    """
+    opcoes = {'simulate': True, 'resumable_video_upload': False, 'telegram_enabled': False, 'email_enabled': False}
+    if not dry_run:
+        opcoes['ledger_path'] = simulado(config.ledger_path)
+        opcoes['job_queue_path'] = simulado(config.job_queue_path)
+        return config.model_copy(update=opcoes), None
+
+    temporario = Path(tempfile.mkdtemp(prefix='instaposter-dry-run-'))
+    bancos = [config.ledger_path, config.job_queue_path]
+    bancos += [conta.ledger_path(config.ledger_path) for conta in contas]
+    for banco in bancos:
+        copiar_banco(banco, temporario / Path(banco).name)
+    opcoes.update(
+        ledger_path=temporario / Path(config.ledger_path).name,
+        job_queue_path=temporario / Path(config.job_queue_path).name,
+        simulate_speedup=math.inf,
+        simulate_latency=0,
+        simulate_failure_rate=0,
+        simulate_throttle_rate=0,
+        simulate_hourly_limit=0,
+    )
+    return config.model_copy(update=opcoes), temporario
+
+def resumo_simulacao(cl, prefixo=""):
+    """Mostra o resultado do cliente simulado"""
+    resumo = cl.summary()
+    print(f"{prefixo}Simulação: {resumo['uploads']} posts ({resumo['media']} mídias), "
+          f"{resumo['failures']} falhas, {resumo['throttles']} limites do Instagram")
+    print(f"{prefixo}Tempo simulado: {resumo['simulated_seconds'] / 3600:.1f}h "
+          f"({resumo['posts_per_hour']:.1f} posts/h) em {resumo['real_seconds']:.1f}s reais")
+
+def convert_video(input_path, cache=None, digest=None, info=None, settings=None, scheduler=None):
+    """Prepara o vídeo para o Instagram: sem alterações, só trocando o container ou recodificando
+
+    Retorna o caminho do vídeo e a decisão tomada; o caminho é None quando a preparação
+    falha, para o vídeo ser pulado em vez de enviado fora dos limites do Instagram.
+    """
+    acao = None
+    output_path = None
+    try:
+        info = info or probe_video(input_path)
+        # Decidido antes, para uma falha ser atribuída ao caminho escolhido
+        acao = media.plan_video(info, settings, os.path.getsize(input_path))
+        if cache is not None:
+            video_path, acao = media.prepare_video(input_path, cache, digest, info, settings, scheduler, pin=True)
+            return str(video_path), acao
+        if acao == media.PASSTHROUGH:
+            return input_path, acao
+        output_path = input_path + "_converted.mp4"
+        if acao == media.REMUX:
+            media.remux_video(input_path, output_path, settings.max_duration if settings else None)
+        else:
+            print("Convertendo vídeo para formato compatível...")
+            media.convert_video(input_path, output_path, settings)
+        return output_path, acao
     except Exception as e:
         print(f"Erro ao converter vídeo: {str(e)}")
-        return input_path
+        if output_path is not None and os.path.exists(output_path):
+            os.remove(output_path)
+        return None, acao
+
+def iniciar_metricas(processor, watch=False):
+    """Configura o log de spans e, no modo --watch, o endpoint Prometheus"""
+    config = processor.config
+    configure_metrics_log(config.metrics_log)
+    cache, scheduler = processor.cache, processor.scheduler
+    for nome in ('hits', 'misses', 'evictions', 'entries', 'bytes'):
+        metrics.gauge(f"cache_{nome}", lambda nome=nome: cache.stats()[nome], 'Estado do cache de mídia')
+    metrics.gauge('prep_waiting', lambda: scheduler.waiting, 'Trabalhos aguardando núcleos de CPU')
+    metrics.gauge('prep_cores_in_use', lambda: scheduler.in_use, 'Núcleos reservados pela preparação')
+    if scheduler.memory is not None:
+        metrics.gauge('prep_memory_bytes', lambda: scheduler.memory.in_use, 'Memória reservada por imagens')
+
+    if not watch or not config.metrics_port:
+        return None
+    try:
+        servidor = MetricsServer(metrics, config.metrics_port, config.metrics_host).start()
+    except OSError as e:
+        logger.warning(f"Endpoint de métricas indisponível: {e}")
+        return None
+    logger.info(f"Métricas em http://{config.metrics_host}:{servidor.port}/metrics")
+    return servidor
+
+def encerrar_metricas(servidor):
+    if servidor is not None:
+        servidor.close()
+    metrics.log_summary()
+
+def iniciar_notificacoes(config):
+    """Inicia os canais habilitados (Telegram, email); None se nenhum estiver"""
+    if not (config.telegram_enabled or config.email_enabled):
+        return None
+    from notifications import NotificationService
+    try:
+        return NotificationService(config).start_background()
+    except Exception as e:
+        logger.warning(f"Notificações indisponíveis: {e}")
+        return None
+
+def encerrar_notificacoes(servico):
+    """Envia as notificações pendentes antes de encerrar"""
+    if servico is not None:
+        servico.close_background(timeout=30)
+
+def notificar(mensagem, erro=None):
+    """Enfileira a notificação, sem esperar o envio; nada acontece se estiverem desativadas"""
+    if NOTIFICACOES is not None:
+        NOTIFICACOES.notify(mensagem, erro)
 
 def parse_arguments():
     """Parse argumentos da linha de comando"""
     parser = argparse.ArgumentParser(description='Instagram Auto Poster')
     parser.add_argument('--caption', type=str, help='Caption personalizada para os posts')
     parser.add_argument('--path', type=str, help='Caminho para a pasta com as mídias')
-    return parser.parse_args()
+    parser.add_argument('--watch', action='store_true',
+                        help='Permanece em execução e posta os arquivos novos assim que chegam na pasta')
+    parser.add_argument('--album', choices=['off', 'folder', 'prefix', 'time'],
+                        help='Agrupa mídias relacionadas em carrosséis de até 10 itens '
+                             '(por subpasta, prefixo do nome ou janela de tempo)')
+    parser.add_argument('--queue', action='store_true',
+                        help='Posta a partir da fila persistente (prioridades e horários; ver jobqueue.py)')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Usa um Instagram simulado (latência, falhas e limites da configuração) '
+                             'com registro próprio e o ritmo de postagem acelerado')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Mostra o que seria postado, sem postar nem alterar o registro real')
+    parser.add_argument('--check-deps', action='store_true',
+                        help='Verifica e instala as dependências antes de executar')
+    parser.add_argument('--accounts', type=str,
+                        help='Arquivo JSON com as contas a atender (usuário, pasta, caption, regras)')
+    args = parser.parse_args()
+    if args.queue and args.album not in (None, 'off'):
+        parser.error("--album não é suportado com --queue: a fila publica cada mídia como um post")
+    return args
 
 if __name__ == "__main__":
+    temporario = None  # cópias do --dry-run
     try:
-        # Verifica dependências
-        check_dependencies()
-        
         # Parse argumentos
         args = parse_arguments()
         
+        # Verificação de dependências apenas sob demanda: importa e pode instalar pacotes
+        if args.check_deps:
+            check_dependencies()
+        
         # Configura caminho e caption
         CAMINHO_ARQUIVOS = args.path or os.getenv('MEDIA_PATH', r"LOCAL DA PASTA AQUI")
         CAPTION_PADRAO = args.caption or os.getenv('DEFAULT_CAPTION', "Postado automaticamente. #automacao")
+        ARQUIVO_CONTAS = args.accounts or os.getenv('ACCOUNTS_FILE')
+        # Opções da linha de comando têm precedência sobre o .env
+        opcoes = {'album_mode': args.album} if args.album else {}
+        if args.queue:
+            opcoes['job_queue'] = True
+        
+        if ARQUIVO_CONTAS:
+            contas = []
+            for conta in load_accounts(ARQUIVO_CONTAS):
+                if conta.media_path.exists():
+                    contas.append(conta)
+                else:
+                    logger.error(f"Erro: O diretório {conta.media_path} da conta {conta.username} não existe!")
+            if not contas:
+                sys.exit(1)
+            logger.info(f"Atendendo {len(contas)} contas: {', '.join(c.username for c in contas)}")
+            
+            config = Config(upload_dir=contas[0].media_path, **opcoes)
+            if args.simulate or args.dry_run:
+                config, temporario = configurar_simulacao(config, contas, args.dry_run)
+            processor = MediaProcessor(config)
+            servidor_metricas = iniciar_metricas(processor, watch=args.watch)
+            NOTIFICACOES = iniciar_notificacoes(config)
+            try:
+                postar_contas(processor, contas, watch=args.watch)
+            finally:
+                encerrar_notificacoes(NOTIFICACOES)
+                encerrar_metricas(servidor_metricas)
+                processor.shutdown(wait=False)
+            sys.exit(0)
         
         if not os.path.exists(CAMINHO_ARQUIVOS):
             logger.error(f"Erro: O diretório {CAMINHO_ARQUIVOS} não existe!")
@@ -390,13 +1166,47 @@ if __name__ == "__main__":
             
         logger.info(f"Usando diretório de mídia: {CAMINHO_ARQUIVOS}")
         
-        cl = Client()
+        config = Config(upload_dir=CAMINHO_ARQUIVOS, **opcoes)
+        if args.simulate or args.dry_run:
+            config, temporario = configurar_simulacao(config, dry_run=args.dry_run)
+        processor = MediaProcessor(config)
+        servidor_metricas = iniciar_metricas(processor, watch=args.watch)
+        NOTIFICACOES = iniciar_notificacoes(config)
         
-        if login(cl):
-            postar_midia(cl)
-        else:
-            logger.error("Não foi possível fazer login. Encerrando programa.")
+        try:
+            if not args.watch and not existe_midia_nova(processor):
+                logger.info("Nenhum arquivo novo para postar. Encerrando...")
+                sys.exit(0)
+            
+            if config.simulate:
+                cl = SimulatedClient.from_config(config)
+                try:
+                    postar_midia(cl, processor, watch=args.watch)
+                finally:
+                    resumo_simulacao(cl)
+                sys.exit(0)
+            
+            from instagrapi import Client
+            cl = Client()
+            if login(cl):
+                try:
+                    postar_midia(cl, processor, watch=args.watch)
+                finally:
+                    # Guarda os cookies atualizados durante a execução
+                    save_session(cl)
+            else:
+                logger.error("Não foi possível fazer login. Encerrando programa.")
+                notificar("Não foi possível fazer login")
+        finally:
+            encerrar_notificacoes(NOTIFICACOES)
+            encerrar_metricas(servidor_metricas)
+            processor.shutdown(wait=False)
     except KeyboardInterrupt:
         logger.info("\nPrograma encerrado pelo usuário")
+    except ImportError as e:
+        logger.error(f"Dependência ausente ({e}). Execute com --check-deps para instalar.")
     except Exception as e:
         logger.error(f"Erro inesperado: {e}")
+    finally:
+        if temporario is not None:
+            shutil.rmtree(temporario, ignore_errors=True)
@@ -0,0 +1,199 @@
+"""Upload retomável contra um servidor rupload local (sem Instagram)"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import requests  # noqa: E402
+
+import media  # noqa: E402
+import resumable  # noqa: E402
+from exceptions import ResumableUploadException  # noqa: E402
+from resumable import ResumableVideoUploader, UploadStateStore  # noqa: E402
+
+CHUNK = 16 * 1024
+
+
+class RuploadServer:
+    """Servidor rupload mínimo: GET informa o offset, POST grava o bloco no offset pedido
+
+    `fail_posts` lista os números (a partir de 1) dos POSTs que devem falhar com HTTP 500.
+    """
+
+    def __init__(self):
+        self.uploads = {}
+        self.posts = []  # (nome, offset) de cada POST aceito
+        self.gets = 0
+        self.fail_posts = set()
+        self._count = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body=None):
+                data = json.dumps(body or {}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                name = self.path.rsplit('/', 1)[-1]
+                with server._lock:
+                    server.gets += 1
+                    data = server.uploads.setdefault(name, bytearray())
+                    self._reply(200, {'offset': len(data)})
+
+            def do_POST(self):
+                name = self.path.rsplit('/', 1)[-1]
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                offset = int(self.headers['Offset'])
+                with server._lock:
+                    server._count += 1
+                    if server._count in server.fail_posts:
+                        return self._reply(500, {'status': 'fail'})
+                    data = server.uploads.setdefault(name, bytearray())
+                    if offset != len(data):
+                        return self._reply(400, {'offset': len(data)})
+                    data.extend(body)
+                    server.posts.append((name, offset))
+                    self._reply(200, {'status': 'ok'})
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeClient:
+    """Só o que o uploader usa do instagrapi.Client"""
+
+    def __init__(self, pending=0):
+        self.user_id = '42'
+        self.username = 'teste'
+        self.configured = []
+        self.pending = pending  # respostas "Transcode not finished yet" antes do sucesso
+
+    def video_configure(self, upload_id, width, height, duration, thumbnail, caption):
+        if self.pending:
+            self.pending -= 1
+            raise Exception("Transcode not finished yet")
+        self.configured.append((upload_id, Path(thumbnail).exists(), caption))
+        return {'pk': upload_id}
+
+
+class ResumableUploadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.video = Path(cls.tmp.name) / 'clip.mp4'
+        subprocess.run(
+            [
+                media.ffmpeg_binary(), '-v', 'error', '-y', '-f', 'lavfi',
+                '-i', 'testsrc2=size=320x240:rate=25', '-t', '2',
+                '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', str(cls.video),
+            ],
+            check=True
+        )
+        cls.size = os.path.getsize(cls.video)
+        assert cls.size > 3 * CHUNK, "vídeo de teste pequeno demais para vários blocos"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.server = RuploadServer()
+        self.addCleanup(self.server.close)
+        self.dir = Path(tempfile.mkdtemp(dir=self.tmp.name))
+        self.store = UploadStateStore(self.dir / 'state.db')
+        self.addCleanup(self.store.close)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        self._delays = (resumable.CONFIGURE_DELAY, resumable.TRANSCODE_DELAY)
+        resumable.CONFIGURE_DELAY = resumable.TRANSCODE_DELAY = 0
+        self.addCleanup(self._restore_delays)
+
+    def _restore_delays(self):
+        resumable.CONFIGURE_DELAY, resumable.TRANSCODE_DELAY = self._delays
+
+    def uploader(self, client, **kwargs):
+        kwargs.setdefault('max_retries', 0)
+        return ResumableVideoUploader(
+            client, self.store, base_url=self.server.url, chunk_size=CHUNK, retry_delay=0,
+            session=self.session, thumbnail_dir=self.dir / 'thumbs', **kwargs
+        )
+
+    def uploaded(self) -> bytes:
+        (data,) = self.server.uploads.values()
+        return bytes(data)
+
+    def test_chunked_upload(self):
+        client = FakeClient()
+        self.uploader(client).upload(self.video, 'abc', 'legenda')
+
+        self.assertEqual(self.uploaded(), self.video.read_bytes())
+        offsets = [offset for _, offset in self.server.posts]
+        self.assertEqual(offsets, list(range(0, self.size, CHUNK)))
+        self.assertEqual(len(client.configured), 1)
+        self.assertTrue(client.configured[0][1], "capa não existia no configure")
+        self.assertIsNone(self.store.get('42', 'abc'))
+        self.assertEqual(list((self.dir / 'thumbs').iterdir()), [])
+
+    def test_retry_resumes_from_server_offset(self):
+        self.server.fail_posts = {2}
+        client = FakeClient()
+        self.uploader(client, max_retries=1).upload(self.video, 'abc', 'legenda')
+
+        self.assertEqual(self.uploaded(), self.video.read_bytes())
+        # Após a falha, o GET confirma o offset e o mesmo bloco é reenviado
+        self.assertEqual(self.server.gets, 2)
+        self.assertEqual(self.server.posts[1][1], CHUNK)
+
+    def test_restart_mid_upload(self):
+        self.server.fail_posts = {3}
+        with self.assertRaises(ResumableUploadException):
+            self.uploader(FakeClient()).upload(self.video, 'abc', 'legenda')
+        state = self.store.get('42', 'abc')
+        self.assertEqual(state.offset, 2 * CHUNK)
+
+        # Nova execução: mesmo estado, retomado pelo offset do servidor
+        client = FakeClient()
+        uploader = self.uploader(client)
+        uploader.upload(self.video, 'abc', 'legenda')
+
+        self.assertEqual(uploader.resumed, 1)
+        self.assertEqual(self.server.posts[2][1], 2 * CHUNK)
+        self.assertEqual(self.uploaded(), self.video.read_bytes())
+        self.assertEqual(client.configured[0][0], state.upload_id)
+
+    def test_stop_interrupts_configure(self):
+        resumable.TRANSCODE_DELAY = 30
+        stop = threading.Event()
+        uploader = self.uploader(FakeClient(pending=100), stop=stop)
+        threading.Timer(0.2, stop.set).start()
+        start = time.monotonic()
+        with self.assertRaises(ResumableUploadException):
+            uploader.upload(self.video, 'abc', 'legenda')
+        self.assertLess(time.monotonic() - start, 5)
+        # O vídeo já está no servidor; o estado fica para configurar depois
+        self.assertIsNotNone(self.store.get('42', 'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+from scanner import MediaScanner, ScanEntry
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Acesso mínimo ao inotify do Linux via ctypes"""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch falhou em {directory}")
+
+    def read(self, timeout: float) -> Optional[list]:
+        """Nomes alterados até `timeout`; None se a fila do kernel transbordou"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """Observa um diretório e gera os arquivos novos assim que terminam de ser gravados
+
+    Usa inotify quando disponível e, caso contrário, varreduras incrementais periódicas.
+    Um arquivo só é entregue depois de ficar `settle_seconds` sem mudar de tamanho ou
+    mtime, para não pegar cópias pela metade. O estado guardado se limita aos arquivos
+    ainda em gravação, então a memória fica estável em execuções longas.
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        scanner: MediaScanner,
+        settle_seconds: float = 2.0,
+        poll_interval: float = 5.0,
+        backend: str = 'auto',
+        stop: Optional[threading.Event] = None,
+    ):
+        if backend not in ('auto', 'inotify', 'poll'):
+            raise ValueError(f"Backend de observação desconhecido: {backend}")
+        self.directory = str(directory)
+        self.scanner = scanner
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.backend = backend
+        self._stop = stop or threading.Event()
+        # caminho -> (tamanho, mtime, desde quando está estável)
+        self._pending: Dict[str, Tuple[int, int, float]] = {}
+
+    def close(self):
+        """Encerra a observação; o gerador termina na próxima verificação"""
+        self._stop.set()
+
+    def _open_inotify(self) -> Optional[_Inotify]:
+        if self.backend == 'poll' or not sys.platform.startswith('linux'):
+            return None
+        try:
+            return _Inotify(self.directory)
+        except (OSError, AttributeError) as e:
+            if self.backend == 'inotify':
+                raise
+            logger.warning(f"inotify indisponível ({e}); usando varredura periódica")
+            return None
+
+    def _touch(self, path: str):
+        """Marca o arquivo como em gravação, reiniciando a contagem de estabilidade"""
+        if os.path.basename(path).startswith('.'):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        self._pending[path] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    def _settled(self) -> Iterator[ScanEntry]:
+        """Entrega os arquivos que pararam de mudar há pelo menos `settle_seconds`"""
+        now = time.monotonic()
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - since < self.settle_seconds:
+                continue
+            del self._pending[path]
+            entry = self.scanner.examine(path)
+            if entry is not None:
+                yield entry
+        self.scanner.flush()
+
+    def watch(self) -> Iterator[ScanEntry]:
+        """Gera as mídias já presentes e, em seguida, as que forem chegando"""
+        inotify = self._open_inotify()
+        try:
+            # O inotify é registrado antes da varredura inicial para não perder arquivos
+            for entry in self.scanner.scan(self.directory):
+                if time.time() - entry.mtime_ns / 1e9 < self.settle_seconds:
+                    # Possivelmente ainda em gravação
+                    self._touch(str(entry.path))
+                else:
+                    yield entry
+            logger.info(f"Observando {self.directory} ({'inotify' if inotify else 'varredura periódica'})")
+
+            while not self._stop.is_set():
+                if inotify is not None:
+                    timeout = min(self.settle_seconds, 1.0) if self._pending else 1.0
+                    names = inotify.read(timeout)
+                    if names is None:
+                        logger.warning("Fila do inotify transbordou; fazendo varredura completa")
+                        for entry in self.scanner.scan(self.directory):
+                            if entry.changed:
+                                self._touch(str(entry.path))
+                    else:
+                        for name in names:
+                            self._touch(os.path.join(self.directory, name))
+                else:
+                    self._stop.wait(self.poll_interval)
+                    for entry in self.scanner.scan(self.directory):
+                        if entry.changed:
+                            self._touch(str(entry.path))
+                yield from self._settled()
+        finally:
+            if inotify is not None:
+                inotify.close()